@@ -1,17 +1,56 @@
 # backend/app/config.py — paths and model config (no cloud APIs)
+import json
 import os
 from pathlib import Path
 from types import SimpleNamespace
+from typing import Dict
+
+from app.log import get_logger
+
+log = get_logger("config")
 
 # Project root: parent of backend/
 PROJECT_ROOT = Path(__file__).resolve().parent.parent.parent
 MODELS_DIR = PROJECT_ROOT / "models"
 DATA_DIR = PROJECT_ROOT / "data"
 
+_profiles: Dict[str, Dict[str, str]] = {}
+
+
+def load_profile(path: str) -> Dict[str, str]:
+    """
+    Settings measured by scripts/calibrate.py (keys without the TUTOR_ prefix). Read once
+    per process; ignored if it was measured on different hardware.
+    """
+    if path in _profiles:
+        return _profiles[path]
+    values: Dict[str, str] = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f)
+    except FileNotFoundError:
+        profile = None
+    except (OSError, ValueError) as e:
+        log.warning("Ignoring unreadable hardware profile %s: %s", path, e)
+        profile = None
+    if profile is not None:
+        from app.services.hardware import fingerprint
+        here = fingerprint()
+        if profile.get("fingerprint") != here:
+            log.warning("Ignoring %s: measured on %s, this node is %s", path, profile.get("fingerprint"), here)
+        else:
+            values = {k: str(v) for k, v in (profile.get("settings") or {}).items()}
+    _profiles[path] = values
+    return values
+
 
 def get_settings() -> SimpleNamespace:
+    # Precedence: TUTOR_* environment variable, then the calibrated profile, then the default.
+    profile_path = os.environ.get("TUTOR_HW_PROFILE", str(DATA_DIR / "hw_profile.json"))
+    profile = load_profile(profile_path) if profile_path not in ("", "0") else {}
+
     def env(key: str, default: str = "") -> str:
-        return os.environ.get(f"TUTOR_{key}", default)
+        return os.environ.get(f"TUTOR_{key}", profile.get(key, default))
 
     llama_path = env("LLAMA_MODEL_PATH")
     if not llama_path and (MODELS_DIR / "llama").exists():
@@ -33,12 +72,102 @@ def get_settings() -> SimpleNamespace:
     return SimpleNamespace(
         llama_model_path=llama_path,
         llama_n_ctx=int(env("LLAMA_N_CTX", "2048")),
-        llama_n_gpu_layers=int(env("LLAMA_N_GPU_LAYERS", "-1")),
+        llama_n_gpu_layers=int(env("LLAMA_N_GPU_LAYERS", "-1")),   # -1 = all (GPU builds only), 0 = CPU
+        llama_n_threads=int(env("LLAMA_N_THREADS", "0")),               # decode threads; 0 = physical cores
+        llama_n_threads_batch=int(env("LLAMA_N_THREADS_BATCH", "0")),   # prompt-eval threads; 0 = as decode
+        llama_use_mmap=env("LLAMA_USE_MMAP", "1") not in ("0", "false", "no"),
+        llama_use_mlock=env("LLAMA_USE_MLOCK", "0") not in ("0", "false", "no"),
+        llm_batch_slots=int(env("LLM_BATCH_SLOTS", "1")),
+        llm_n_batch=int(env("LLM_N_BATCH", "512")),
+        llm_fallback_model_path=env("LLM_FALLBACK_MODEL_PATH"),   # smaller GGUF for the "fallback" load level
+        llm_replicas=int(env("LLM_REPLICAS", "1")),
+        llm_replica_threads=int(env("LLM_REPLICA_THREADS", "0")),   # 0 = physical cores / replicas
+        llm_replica_timeout_s=float(env("LLM_REPLICA_TIMEOUT_S", "120")),
+        llm_affinity_slack=int(env("LLM_AFFINITY_SLACK", "2")),
+        llm_speculative=env("LLM_SPECULATIVE", "off"),   # off | prompt_lookup | draft
+        llm_draft_model_path=env("LLM_DRAFT_MODEL_PATH"),
+        llm_draft_tokens=int(env("LLM_DRAFT_TOKENS", "0")),   # 0 = mode default (10 lookup, 4 draft)
+        llm_ngram_size=int(env("LLM_NGRAM_SIZE", "3")),
+        llm_spec_min_accept=float(env("LLM_SPEC_MIN_ACCEPT", "0.3")),
+        llm_spec_window=int(env("LLM_SPEC_WINDOW", "256")),
+        llm_spec_cooldown=int(env("LLM_SPEC_COOLDOWN", "512")),
+        grade_reply_tokens=int(env("GRADE_REPLY_TOKENS", "64")),   # praise/correction after a graded answer
+        llm_token_queue_size=int(env("LLM_TOKEN_QUEUE_SIZE", "64")),
+        kv_cache_ram_mb=int(env("KV_CACHE_RAM_MB", "512")),
+        kv_cache_disk_dir=env("KV_CACHE_DISK_DIR"),
+        kv_cache_disk_mb=int(env("KV_CACHE_DISK_MB", "2048")),
         whisper_model=env("WHISPER_MODEL", "base"),
-        whisper_device=env("WHISPER_DEVICE", "cuda"),
+        whisper_device=env("WHISPER_DEVICE", "auto"),   # auto = cuda if torch sees a GPU, else cpu
+        ffmpeg_bin=env("FFMPEG_PATH", "ffmpeg"),
+        stt_input=env("STT_INPUT", "ffmpeg"),   # "pcm": clients send 16 kHz mono s16le (or WAV)
+        stt_window_s=float(env("STT_WINDOW_S", "8")),
+        stt_overlap_s=float(env("STT_OVERLAP_S", "1.5")),
+        stt_step_s=float(env("STT_STEP_S", "1")),
+        stt_silence_ms=int(env("STT_SILENCE_MS", "800")),
+        stt_idle_ms=int(env("STT_IDLE_MS", "1500")),
+        stt_max_queue=int(env("STT_MAX_QUEUE", "32")),
+        stt_max_batch=int(env("STT_MAX_BATCH", "8")),
+        stt_batch_window_ms=int(env("STT_BATCH_WINDOW_MS", "15")),
         piper_bin=env("PIPER_PATH", "piper"),
         piper_model_path=piper_path,
+        piper_pool_size=int(env("PIPER_POOL_SIZE", "2")),
+        piper_timeout=float(env("PIPER_TIMEOUT", "30")),
+        piper_health_interval=float(env("PIPER_HEALTH_INTERVAL", "10")),
+        piper_speaker=env("PIPER_SPEAKER"),
+        piper_length_scale=env("PIPER_LENGTH_SCALE"),
+        tts_cache_dir=env("TTS_CACHE_DIR", str(DATA_DIR / "tts_cache")),
+        tts_cache_mb=int(env("TTS_CACHE_MB", "256")),
+        tts_cache_hot_mb=int(env("TTS_CACHE_HOT_MB", "32")),
+        tts_chunk_ms=int(env("TTS_CHUNK_MS", "100")),
+        tts_opus_bitrate=int(env("TTS_OPUS_BITRATE", "24000")),
+        tts_min_segment_chars=int(env("TTS_MIN_SEGMENT_CHARS", "20")),
+        tts_max_segment_chars=int(env("TTS_MAX_SEGMENT_CHARS", "200")),
         db_path=db_path,
+        db_pool_size=int(env("DB_POOL_SIZE", "4")),
+        db_flush_ms=int(env("DB_FLUSH_MS", "5")),
+        db_maintenance_interval_s=float(env("DB_MAINTENANCE_INTERVAL_S", "3600")),   # 0 disables archive.py
+        db_archive_after_days=float(env("DB_ARCHIVE_AFTER_DAYS", "30")),   # idle sessions move to the archive
+        db_archive_segment_rows=int(env("DB_ARCHIVE_SEGMENT_ROWS", "256")),
+        db_archive_sessions_per_run=int(env("DB_ARCHIVE_SESSIONS_PER_RUN", "200")),
+        db_retention_days=float(env("DB_RETENTION_DAYS", "0")),   # drop archived sessions after this; 0 keeps them
+        history_admin=env("HISTORY_ADMIN", "0") in ("1", "true", "yes"),   # history/search endpoints read any session
+        db_vacuum_pages=int(env("DB_VACUUM_PAGES", "4096")),   # free pages released per pass
+        semantic_index=env("SEMANTIC_INDEX", "1") not in ("0", "false", "no"),
+        semantic_index_dir=env("SEMANTIC_INDEX_DIR", str(DATA_DIR / "semantic_index")),
+        semantic_index_factory=env("SEMANTIC_INDEX_FACTORY", "IDMap2,HNSW32"),
+        semantic_compact_rows=int(env("SEMANTIC_COMPACT_ROWS", "20000")),
+        semantic_related_k=int(env("SEMANTIC_RELATED_K", "3")),
+        semantic_min_score=float(env("SEMANTIC_MIN_SCORE", "0.45")),
+        embed_model=env("EMBED_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+        embed_batch_size=int(env("EMBED_BATCH_SIZE", "64")),
+        embed_poll_s=float(env("EMBED_POLL_S", "2")),
+        admission=env("ADMISSION", "1") not in ("0", "false", "no"),
+        admission_max_active=int(env("ADMISSION_MAX_ACTIVE", "8")),   # generations in flight; 0 = no limit
+        admission_slo_ms=float(env("ADMISSION_SLO_MS", "1500")),   # p95 time to first token of admitted turns
+        admission_levels=[l.strip() for l in env("ADMISSION_LEVELS", "short,fallback,text,busy").split(",") if l.strip()],
+        admission_step_s=float(env("ADMISSION_STEP_S", "5")),   # min time between level changes
+        admission_window_s=float(env("ADMISSION_WINDOW_S", "30")),   # latency samples considered
+        admission_max_wait_s=float(env("ADMISSION_MAX_WAIT_S", "30")),   # queued longer than this: turn refused
+        degrade_token_factor=float(env("DEGRADE_TOKEN_FACTOR", "0.5")),
+        degrade_min_tokens=int(env("DEGRADE_MIN_TOKENS", "32")),
+        lesson_pack=env("LESSON_PACK", str(DATA_DIR / "lessons.pack")),   # scripts/build_lessons.py; "" disables
+        response_cache=env("RESPONSE_CACHE", "1") not in ("0", "false", "no"),
+        response_cache_entries=int(env("RESPONSE_CACHE_ENTRIES", "512")),
+        response_cache_variants=int(env("RESPONSE_CACHE_VARIANTS", "3")),   # replies collected per key before serving
+        response_cache_min_score=float(env("RESPONSE_CACHE_MIN_SCORE", "0.92")),   # cosine; 1 = exact matches only
+        response_cache_ttl_s=float(env("RESPONSE_CACHE_TTL_S", "604800")),   # concept explanations
+        response_cache_question_ttl_s=float(env("RESPONSE_CACHE_QUESTION_TTL_S", "86400")),
+        ws_flush_ms=float(env("WS_FLUSH_MS", "15")),
+        ws_max_frame_bytes=int(env("WS_MAX_FRAME_BYTES", "2048")),
+        ws_high_water=int(env("WS_HIGH_WATER", "64")),
+        stub_engines={n.strip() for n in env("STUB_ENGINES").split(",") if n.strip()} - {"0"},
+        stub_profile=env("STUB_PROFILE", "cpu"),
+        trace_sample=float(env("TRACE_SAMPLE", "0")),   # fraction of turns written to trace_dir
+        trace_slow_ms=int(env("TRACE_SLOW_MS", "0")),    # also write every turn slower than this (0 = off)
+        trace_dir=env("TRACE_DIR", str(DATA_DIR / "traces")),
+        hw_profile=profile_path,
+        startup_warmup=env("STARTUP_WARMUP", "1") not in ("0", "false", "no"),
+        startup_timeout_s=float(env("STARTUP_TIMEOUT_S", "300")),
         host=env("HOST", "127.0.0.1"),
         port=int(env("PORT", "8765")),
     )
@@ -0,0 +1,48 @@
+# backend/app/log.py — non-blocking log sink for hot paths (event loop, token streaming)
+#
+# Records are put on an in-memory queue (QueueHandler) and written to stderr by a
+# background QueueListener thread, so a slow terminal or pipe never stalls the loop.
+
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+from typing import Optional
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[logging.Handler] = None
+
+
+def _setup() -> None:
+    global _listener, _handler
+    if _listener is not None:
+        return
+    q: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    out = logging.StreamHandler(sys.stderr)
+    out.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(name)s] %(message)s"))
+    root = logging.getLogger("tutor")
+    root.setLevel(os.environ.get("TUTOR_LOG_LEVEL", "INFO").upper())
+    _handler = logging.handlers.QueueHandler(q)
+    root.addHandler(_handler)
+    root.propagate = False
+    _listener = logging.handlers.QueueListener(q, out, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger under the `tutor.` namespace; the first call starts the writer thread."""
+    _setup()
+    return logging.getLogger(f"tutor.{name}")
+
+
+def shutdown_logging() -> None:
+    """Write out anything still queued and stop the writer thread."""
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger("tutor").removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
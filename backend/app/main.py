@@ -1,22 +1,104 @@
 # backend/app/main.py — FastAPI app and WebSocket endpoint (local only)
 
-import base64
-import json
 import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 
+from app import metrics, tracing
 from app.config import get_settings
-from app.websocket.handler import handle_ws_message
+from app.log import get_logger, shutdown_logging
+from app.services.loop_monitor import get_loop_monitor
+from app.websocket.handler import cancel_turn, handle_ws_message
+from app.websocket.output import OutputChannel
+
+log = get_logger("app")
+_channels = set()   # OutputChannel of every open WebSocket
+
+
+def _queue_depths():
+    """Work waiting in front of each engine, read at scrape time."""
+    from app.services import llm_service, stt_worker
+    from app.services.db import _databases
+    depths = {
+        ("ws_out",): sum(c.depth for c in _channels),
+        ("db_write",): sum(len(db._writes) for db in _databases.values()),
+    }
+    for name, engine in (("llm", llm_service._worker), ("stt", stt_worker._worker)):
+        if engine is not None:
+            depths[(name,)] = engine.queue_depth
+    return depths
+
+
+def _cache_counts(field: str):
+    def read():
+        from app.services.audio_cache import get_audio_cache
+        from app.services.kv_cache import get_kv_cache
+        from app.services import lesson_pack, response_cache
+        out = {}
+        kv = get_kv_cache()
+        tts = get_audio_cache()
+        replies = response_cache._cache
+        pack = lesson_pack._pack
+        if field == "hits":
+            out[("kv", "ram")] = kv.hits
+            out[("kv", "disk")] = kv.hits_disk
+            if tts is not None:
+                out[("tts", "ram")] = tts.hits_hot
+                out[("tts", "disk")] = tts.hits_disk
+            if replies is not None:
+                out[("response", "exact")] = replies.hits_exact
+                out[("response", "semantic")] = replies.hits_semantic
+            if pack is not None:
+                out[("lesson", "pack")] = pack.hits
+        else:
+            out[("kv",)] = kv.misses
+            if tts is not None:
+                out[("tts",)] = tts.misses
+            if replies is not None:
+                out[("response",)] = replies.misses
+            if pack is not None:
+                out[("lesson",)] = pack.misses
+        return out
+    return read
+
+
+metrics.gauge("tutor_active_sessions", "Open WebSocket connections").set_function(lambda: len(_channels))
+metrics.gauge("tutor_queue_depth", "Items waiting per queue", ["queue"]).set_function(_queue_depths)
+metrics.gauge("tutor_event_loop_lag_p99_seconds", "p99 event-loop wake-up lag over the sampling window").set_function(
+    lambda: (get_loop_monitor().snapshot()["p99_ms"] or 0.0) / 1000
+)
+metrics.counter("tutor_cache_hits_total", "Cache hits", ["cache", "tier"]).set_function(_cache_counts("hits"))
+metrics.counter("tutor_cache_misses_total", "Cache misses", ["cache"]).set_function(_cache_counts("misses"))
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Optional: preload models on startup (can slow start)
+    # Load and warm every engine in the background; /ready flips once they are all up.
+    from app.services.startup import get_orchestrator
+    orchestrator = get_orchestrator()
+    orchestrator.start()
+    get_loop_monitor().start()
     yield
+    orchestrator.cancel()
+    get_loop_monitor().stop()
     # Shutdown
+    from app.services.llm_service import shutdown_llm
+    from app.services.tts_service import shutdown_piper_pools
+    from app.services.stt_worker import shutdown_stt_worker
+    from app.services.semantic_index import shutdown_semantic_index
+    from app.services.archive import shutdown_maintenance
+    await asyncio.to_thread(shutdown_llm)
+    await asyncio.to_thread(shutdown_stt_worker)
+    await shutdown_semantic_index()
+    await shutdown_maintenance()
+    # Commit anything still in the write-behind queue before exiting.
+    from app.services.db import close_databases
+    await close_databases()
+    await shutdown_piper_pools()
+    shutdown_logging()
 
 
 app = FastAPI(title="Local AI Tutor", version="0.1.0", lifespan=lifespan)
@@ -34,47 +116,120 @@ def health():
     return {"status": "ok", "service": "tutor-backend"}
 
 
+@app.get("/ready")
+def ready():
+    """Readiness for load balancers: 200 once every required engine is loaded and warm, else 503."""
+    from app.services.startup import get_orchestrator
+    report = get_orchestrator().report()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
+
+
+@app.get("/stats")
+def stats(reset: bool = False):
+    """Event-loop lag and live connections (used by scripts/bench_ws.py); reset=1 starts a new window."""
+    monitor = get_loop_monitor()
+    out = {"loop_lag": monitor.snapshot(), "active_connections": len(_channels)}
+    if reset:
+        monitor.reset()
+    return out
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, queue/session gauges, cache and error counters."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/concepts")
 def concepts():
     from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS
     return {"concepts": EXAMPLE_CONCEPTS}
 
 
+async def _student_sessions(student_id: str = None):
+    """Sessions the caller may read: the student's own, or all (None) with TUTOR_HISTORY_ADMIN=1."""
+    if get_settings().history_admin:
+        return None
+    if not student_id:
+        raise HTTPException(status_code=403, detail="student_id is required")
+    from app.services.memory_service import MemoryService
+    return set(await MemoryService().student_sessions(student_id))
+
+
+@app.get("/sessions/{session_id}/messages")
+async def session_messages(session_id: str, student_id: str = None, limit: int = 50, before: int = None):
+    """One page of a session's history, newest page first; pass next_before back as `before` for the previous page."""
+    from app.services.memory_service import MemoryService
+    allowed = await _student_sessions(student_id)
+    if allowed is not None and session_id not in allowed:
+        # Same answer as for a session that does not exist.
+        raise HTTPException(status_code=404, detail="Session not found")
+    limit = max(1, min(limit, 500))
+    rows = await MemoryService().get_history(session_id, limit, before_id=before, include_archived=True)
+    return {
+        "messages": [{"id": i, "role": role, "content": content} for i, role, content in rows],
+        "next_before": rows[0][0] if len(rows) == limit else None,
+    }
+
+
+@app.get("/archive/search")
+async def archive_search(q: str, student_id: str = None, session_id: str = None, limit: int = 20):
+    """Full-text search over the student's archived sessions."""
+    from app.services.archive import get_archive
+    allowed = await _student_sessions(student_id)
+    if allowed is not None and not allowed:
+        return {"results": []}
+    return {"results": await get_archive().search(q, session_id, max(1, min(limit, 100)), sessions=allowed)}
+
+
 @app.websocket("/ws")
 async def websocket_endpoint(ws: WebSocket):
     await ws.accept()
-    state = {}
-
-    async def send(msg):
-        try:
-            if isinstance(msg, dict):
-                await ws.send_text(json.dumps(msg))
-            else:
-                await ws.send_text(msg)
-        except Exception:
-            pass
+    s = get_settings()
+    # All outgoing frames go through one flow-controlled, token-coalescing channel.
+    out = OutputChannel(
+        ws,
+        flush_ms=s.ws_flush_ms,
+        max_frame_bytes=s.ws_max_frame_bytes,
+        high_water=s.ws_high_water,
+    )
+    state = {"out": out}
+    _channels.add(out)
+    send = out.send
 
     try:
         while True:
             msg = await ws.receive()
+            if msg.get("type") == "websocket.disconnect":
+                break
             raw = msg.get("text") or msg.get("bytes") or b""
             if isinstance(raw, bytes) and len(raw) > 0:
-                # Binary audio chunk: wrap as JSON for handler
-                await handle_ws_message(
-                    json.dumps({"type": "audio_chunk", "data": base64.b64encode(raw).decode("ascii")}),
-                    send,
-                    state,
-                )
+                # Binary frame = audio chunk; passed through as bytes (no base64 round trip)
+                await handle_ws_message(raw, send, state)
             else:
                 text = raw.decode("utf-8") if isinstance(raw, bytes) else raw
                 await handle_ws_message(text, send, state)
     except WebSocketDisconnect:
         pass
     except Exception as e:
+        tracing.ERRORS.inc(stage="ws")
         try:
             await send({"type": "error", "message": str(e)})
         except Exception:
             pass
+    finally:
+        from app.services.llm_service import release_session
+        # Stop the reply in flight (LLM job, Piper work, admission slot) along with the socket.
+        await cancel_turn(state, "disconnect")
+        speech = state.get("speech")
+        if speech is not None:
+            await speech.cancel()
+        if state.get("context") is not None:
+            state["context"].cancel()
+        release_session(state.get("session_id"))
+        _channels.discard(out)
+        await out.close()
+        log.info("Connection closed: %s", out.summary())
 
 
 def run():
@@ -0,0 +1,157 @@
+# backend/app/metrics.py — in-process counters, gauges and histograms in Prometheus text format
+#
+# No client library: a few hundred series at most, rendered on each GET /metrics. Metrics
+# are created once at import time via counter()/gauge()/histogram(); anything that already
+# keeps its own number (queue sizes, cache stats) is exposed with set_function() and read
+# at scrape time instead of being mirrored on the hot path.
+
+import bisect
+import math
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+# Seconds; covers a socket send (~ms) up to a slow CPU turn.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+Value = Union[float, Dict[Tuple[str, ...], float]]
+
+
+def _fmt(v: float) -> str:
+    if math.isinf(v):
+        return "+Inf" if v > 0 else "-Inf"
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+
+def _escape(v: object) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        self._fn: Optional[Callable[[], Value]] = None
+
+    def set_function(self, fn: Callable[[], Value]) -> "_Metric":
+        """Read the value at scrape time: a number, or {label values tuple: number}."""
+        self._fn = fn
+        return self
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _values(self) -> Dict[Tuple[str, ...], float]:
+        if self._fn is None:
+            with self._lock:
+                return dict(self._data)
+        try:
+            v = self._fn()
+        except Exception:
+            return {}
+        return v if isinstance(v, dict) else {(): v}
+
+    def samples(self) -> Iterator[str]:
+        for key, v in sorted(self._values().items()):
+            yield f"{self.name}{_labels(self.labelnames, key)} {_fmt(v)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._data: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._data[key] = self._data.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._data[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._data: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._data.get(key)
+            if row is None:
+                row = self._data[key] = [0.0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            rows = {k: list(v) for k, v in self._data.items()}
+        for key, row in sorted(rows.items()):
+            cum = 0.0
+            for le, n in zip(self.buckets + (math.inf,), row[:-1]):
+                cum += n
+                le_label = 'le="%s"' % _fmt(le)
+                yield f"{self.name}_bucket{_labels(self.labelnames, key, le_label)} {_fmt(cum)}"
+            yield f"{self.name}_sum{_labels(self.labelnames, key)} {_fmt(row[-1])}"
+            yield f"{self.name}_count{_labels(self.labelnames, key)} {_fmt(cum)}"
+
+
+_registry: Dict[str, _Metric] = {}
+
+
+def _register(cls, name: str, *args, **kwargs):
+    metric = _registry.get(name)
+    if metric is None:
+        metric = _registry[name] = cls(name, *args, **kwargs)
+    elif type(metric) is not cls:
+        raise ValueError(f"Metric {name} already registered as a {metric.kind}")
+    return metric
+
+
+def counter(name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+    return _register(Counter, name, help, labels)
+
+
+def gauge(name: str, help: str, labels: Sequence[str] = ()) -> Gauge:
+    return _register(Gauge, name, help, labels)
+
+
+def histogram(name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+    return _register(Histogram, name, help, labels, buckets)
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for name in sorted(_registry):
+        m = _registry[name]
+        lines.append(f"# HELP {name} {m.help}")
+        lines.append(f"# TYPE {name} {m.kind}")
+        lines.extend(m.samples())
+    return "\n".join(lines) + "\n"
@@ -4,9 +4,24 @@ SYSTEM_PROMPT = """You are a patient, local AI tutor. You explain concepts step
 
 EXPLAIN_PROMPT = """Explain the concept "{concept}" in 2–4 clear sentences, then ask exactly one short multiple-choice or short-answer question to check understanding. End your message with the question."""
 
-QUESTION_PROMPT = """The student was asked: "{question}". Their answer: "{user_answer}". Reply with only "CORRECT" or "INCORRECT" and if incorrect, one sentence correcting them. Then ask the next short question or say we can move on."""
+# First turn of start_concept (also what scripts/build_lessons.py pre-generates).
+OPENING_PROMPT = """Explain {concept} in one sentence and ask me a short question."""
 
-CORRECTION_PROMPT = """The student got it wrong. Briefly repeat the correct idea for "{concept}" in 1–2 sentences, then ask one more easy question on the same topic or say we can switch topics."""
+# Graded from the logits of the reply's first token (Yes / No), never generated.
+QUESTION_PROMPT = """The student was asked: "{question}". Their answer: "{user_answer}". Is the student's answer correct? Reply with only Yes or No."""
+
+CORRECT_PROMPT = """The student answered "{user_answer}" to "{question}", which is correct. Praise them in a few words, then ask one slightly harder short question about "{concept}"."""
+
+CORRECTION_PROMPT = """The student answered "{user_answer}" to "{question}", which is not right. Briefly give the correct answer and the idea behind it for "{concept}" in 1–2 sentences, then ask one more easy question on the same topic."""
+
+SUMMARY_PROMPT = """Update the running summary of a tutoring conversation. Keep it under 80 words: the concepts covered, questions asked, what the student got right or wrong, and anything they said about themselves.
+
+Current summary: {summary}
+
+New messages:
+{messages}
+
+Reply with only the updated summary."""
 
 # Example concepts for MVP (user or UI can choose)
 EXAMPLE_CONCEPTS = [
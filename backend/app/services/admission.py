@@ -0,0 +1,238 @@
+# backend/app/services/admission.py — admission control and graceful degradation for generated turns
+#
+# Every generated reply asks for a ticket first. The controller watches the p95 time to
+# first token of admitted turns (over TUTOR_ADMISSION_WINDOW_S) and the LLM queue, and
+# steps one level at a time, at most every TUTOR_ADMISSION_STEP_S, through
+# TUTOR_ADMISSION_LEVELS; each level keeps the ones before it:
+#
+#   short     max_tokens x TUTOR_DEGRADE_TOKEN_FACTOR (not below TUTOR_DEGRADE_MIN_TOKENS)
+#   fallback  generate with TUTOR_LLM_FALLBACK_MODEL_PATH (skipped when unset)
+#   text      no TTS: the reply is sent as text only
+#   busy      half as many turns in flight
+#
+# Up when p95 is over TUTOR_ADMISSION_SLO_MS; back down when it is under 60% of the SLO
+# and nothing waits in the LLM queue or for a slot. At most TUTOR_ADMISSION_MAX_ACTIVE
+# turns generate at once; the rest wait in order, with a `busy` frame (position, ETA)
+# every couple of seconds, and are refused after TUTOR_ADMISSION_MAX_WAIT_S.
+
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, List, Optional
+
+from app import metrics
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("admission")
+
+LEVELS = ("short", "fallback", "text", "busy")
+_RELIEF = 0.6          # step down below this fraction of the SLO
+_UPDATE_S = 2.0        # busy frame interval while queued
+
+
+class Ticket:
+    """What an admitted turn may use; hand it back with release()."""
+
+    def __init__(self, level: int, modes: List[str], max_tokens: int, model_path: Optional[str], tts: bool):
+        self.level = level
+        self.modes = modes
+        self.max_tokens = max_tokens
+        self.model_path = model_path
+        self.tts = tts
+        self.admitted = time.monotonic()
+        self.first_token: Optional[float] = None
+
+
+class AdmissionController:
+    def __init__(
+        self,
+        max_active: int = 8,
+        slo_ms: float = 1500,
+        levels=LEVELS,
+        token_factor: float = 0.5,
+        min_tokens: int = 32,
+        fallback_model: Optional[str] = None,
+        step_s: float = 5.0,
+        window_s: float = 30.0,
+        max_wait_s: float = 30.0,
+        queue_depth: Callable[[], int] = lambda: 0,
+    ):
+        self.max_active = max_active
+        self.slo_s = slo_ms / 1000
+        # A fallback level without a fallback model would only slow down the next step.
+        self.levels = [l for l in levels if l in LEVELS and (l != "fallback" or fallback_model)]
+        self.token_factor = token_factor
+        self.min_tokens = min_tokens
+        self.fallback_model = fallback_model
+        self.step_s = step_s
+        self.window_s = window_s
+        self.max_wait_s = max_wait_s
+        self._queue_depth = queue_depth
+        self.level = 0
+        self.active = 0
+        self.refused = 0
+        self._changed = time.monotonic()
+        self._samples: Deque = deque(maxlen=512)    # (time, seconds to first token)
+        self._turn_s = 5.0                          # EWMA of whole-turn duration, for ETAs
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    # -- turn lifecycle ---------------------------------------------------------------
+
+    async def admit(
+        self, max_tokens: int, on_wait: Optional[Callable[[int, float], Awaitable[None]]] = None
+    ) -> Optional[Ticket]:
+        """A ticket for one generation, waiting for a slot if needed; None if refused."""
+        self._evaluate()
+        if self.active < self.capacity and not self._waiters:
+            self.active += 1
+            return self._ticket(max_tokens)
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters.append(fut)
+        deadline = time.monotonic() + self.max_wait_s
+        try:
+            while not fut.done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                if on_wait is not None:
+                    position = self._waiters.index(fut) + 1
+                    await on_wait(position, self.eta(position))
+                await asyncio.wait({fut}, timeout=min(_UPDATE_S, remaining))
+        except asyncio.CancelledError:
+            if fut.done():
+                self._release_slot()     # a slot was handed over just as the turn went away
+            else:
+                self._waiters.remove(fut)
+            raise
+        if not fut.done():
+            self._waiters.remove(fut)
+            self.refused += 1
+            return None
+        return self._ticket(max_tokens)   # release() already counted this turn as active
+
+    def first_token(self, ticket: Ticket) -> None:
+        if ticket.first_token is None:
+            ticket.first_token = time.monotonic()
+            self._samples.append((ticket.first_token, ticket.first_token - ticket.admitted))
+
+    def release(self, ticket: Ticket) -> None:
+        self._turn_s = 0.8 * self._turn_s + 0.2 * (time.monotonic() - ticket.admitted)
+        self._release_slot()
+        self._evaluate()
+
+    def _release_slot(self) -> None:
+        self.active -= 1
+        self._hand_over()
+
+    def _hand_over(self) -> None:
+        # Hand free slots straight to the oldest waiters so a new arrival cannot take them.
+        while self._waiters and self.active < self.capacity:
+            fut = self._waiters.popleft()
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    # -- levels -----------------------------------------------------------------------
+
+    @property
+    def modes(self) -> List[str]:
+        return self.levels[: self.level]
+
+    @property
+    def capacity(self) -> float:
+        if self.max_active <= 0:
+            return float("inf")
+        return max(1, self.max_active // 2) if "busy" in self.modes else self.max_active
+
+    def p95(self) -> Optional[float]:
+        cutoff = time.monotonic() - self.window_s
+        recent = sorted(s for t, s in self._samples if t >= cutoff)
+        if not recent:
+            return None
+        return recent[min(len(recent) - 1, int(len(recent) * 0.95))]
+
+    def eta(self, position: int) -> float:
+        """Seconds until the turn at `position` in the queue starts, roughly."""
+        per_slot = self._turn_s / max(1.0, min(self.capacity, max(1, self.active)))
+        return round(position * per_slot, 1)
+
+    def _evaluate(self) -> None:
+        now = time.monotonic()
+        if now - self._changed < self.step_s:
+            return
+        p95 = self.p95()
+        waiting = self._queue_depth() + len(self._waiters)
+        # No samples while a queue deeper than the slots builds up: nothing reaches its first token.
+        if (p95 is not None and p95 > self.slo_s) or (p95 is None and waiting > self.capacity):
+            if self.level < len(self.levels):
+                self._step(self.level + 1, p95, waiting)
+        elif self.level > 0 and (p95 is None or p95 < self.slo_s * _RELIEF) and waiting == 0:
+            # After a quiet spell, drop the levels that would have been stepped down meanwhile.
+            self._step(max(0, self.level - int((now - self._changed) // self.step_s)), p95, waiting)
+
+    def _step(self, level: int, p95: Optional[float], waiting: int) -> None:
+        self.level = level
+        self._changed = time.monotonic()
+        # Samples from the old level say nothing about the new one.
+        self._samples.clear()
+        shown = f"{p95 * 1000:.0f} ms" if p95 is not None else "-"
+        log.info("Level %d %s (p95 first token %s, %d waiting)", level, self.modes or ["normal"], shown, waiting)
+        # Leaving "busy" doubles the capacity: the new slots go to turns already waiting.
+        self._hand_over()
+
+    def _ticket(self, max_tokens: int) -> Ticket:
+        modes = self.modes
+        if "short" in modes:
+            max_tokens = max(min(self.min_tokens, max_tokens), int(max_tokens * self.token_factor))
+        TURNS.inc(level=str(self.level))
+        return Ticket(
+            self.level,
+            modes,
+            max_tokens,
+            self.fallback_model if "fallback" in modes else None,
+            "text" not in modes,
+        )
+
+
+_controller: Optional[AdmissionController] = None
+
+
+def get_admission() -> Optional[AdmissionController]:
+    """Process-wide controller, or None when TUTOR_ADMISSION=0."""
+    global _controller
+    if _controller is None:
+        s = get_settings()
+        if not s.admission:
+            return None
+        from app.services import llm_service
+
+        def queue_depth() -> int:
+            engine = llm_service._worker
+            return engine.queue_depth if engine is not None else 0
+
+        _controller = AdmissionController(
+            max_active=s.admission_max_active,
+            slo_ms=s.admission_slo_ms,
+            levels=s.admission_levels,
+            token_factor=s.degrade_token_factor,
+            min_tokens=s.degrade_min_tokens,
+            fallback_model=s.llm_fallback_model_path or None,
+            step_s=s.admission_step_s,
+            window_s=s.admission_window_s,
+            max_wait_s=s.admission_max_wait_s,
+            queue_depth=queue_depth,
+        )
+    return _controller
+
+
+TURNS = metrics.counter("tutor_admission_turns_total", "Generated turns admitted, by degradation level", ["level"])
+metrics.gauge("tutor_admission_level", "Current degradation level (0 = full service)").set_function(
+    lambda: _controller.level if _controller is not None else 0
+)
+metrics.gauge("tutor_admission_waiting", "Turns queued for a generation slot").set_function(
+    lambda: len(_controller._waiters) if _controller is not None else 0
+)
+metrics.counter("tutor_admission_refused_total", "Turns refused after waiting too long for a slot").set_function(
+    lambda: _controller.refused if _controller is not None else 0
+)
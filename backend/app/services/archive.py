@@ -0,0 +1,294 @@
+# backend/app/services/archive.py — storage lifecycle: archive idle sessions, retention, vacuum
+#
+# Every TUTOR_DB_MAINTENANCE_INTERVAL_S a background task:
+#   1. moves sessions idle for TUTOR_DB_ARCHIVE_AFTER_DAYS out of `conversations` into
+#      zlib-compressed segments (conversation_archive), indexing their text in FTS5 and
+#      their ids in conversation_archive_map, one session per transaction;
+#   2. drops archived segments older than TUTOR_DB_RETENTION_DAYS (0 keeps them);
+#   3. returns up to TUTOR_DB_VACUUM_PAGES free pages to the OS (incremental vacuum) and
+#      truncates the WAL.
+# So `conversations` only holds recent sessions and its indexes stay small, while old
+# sessions are still readable (get_history(include_archived=True)) and searchable.
+# All of it runs on the writer connection between group commits (Database.on_writer).
+
+import asyncio
+import json
+import os
+import zlib
+from typing import Collection, Dict, List, Optional, Tuple
+
+from app import metrics
+from app.config import get_settings
+from app.log import get_logger
+from app.services.db import Database, get_database
+
+log = get_logger("db.archive")
+
+_CODEC = "zlib-json"
+
+_IDLE_SESSIONS = """SELECT c.session_id, c.id FROM
+                      (SELECT session_id, MAX(id) AS id FROM conversations GROUP BY session_id) m
+                    JOIN conversations c ON c.id = m.id
+                    WHERE c.created_at < datetime('now', ?)
+                    LIMIT ?"""
+_SESSION_ROWS = """SELECT id, role, content, created_at FROM conversations
+                   WHERE session_id = ? AND id <= ? ORDER BY id"""
+_INSERT_SEGMENT = """INSERT INTO conversation_archive
+                     (session_id, first_id, last_id, messages, started_at, ended_at, codec, body)
+                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)"""
+_SEGMENTS_BEFORE = """SELECT id, body FROM conversation_archive
+                      WHERE session_id = ? AND first_id < ? ORDER BY last_id DESC LIMIT ?"""
+_SEGMENTS_OF = """SELECT DISTINCT a.id, a.session_id, a.body FROM conversation_archive_map m
+                  JOIN conversation_archive a ON a.id = m.segment_id WHERE m.id IN ({marks})"""
+_EXPIRED = "SELECT id, body FROM conversation_archive WHERE ended_at < datetime('now', ?) LIMIT ?"
+_SEARCH = "SELECT rowid FROM conversation_archive_fts WHERE conversation_archive_fts MATCH ? ORDER BY rank LIMIT ?"
+
+ARCHIVED = metrics.counter("tutor_db_archived_messages_total", "Messages moved into compressed archive segments")
+VACUUMED = metrics.counter("tutor_db_vacuumed_pages_total", "Free pages returned by incremental vacuum")
+
+
+def encode_segment(rows: List[Tuple[int, str, str, str]]) -> bytes:
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 6)
+
+
+def decode_segment(body: bytes) -> List[list]:
+    return json.loads(zlib.decompress(body))
+
+
+def fts_query(text: str) -> str:
+    """Free text as an FTS5 query: every word must match (quoted, so no operator syntax)."""
+    return " ".join('"' + w.replace('"', '""') + '"' for w in text.split())
+
+
+class ConversationArchive:
+    def __init__(
+        self,
+        db: Database,
+        after_days: float = 30,
+        segment_rows: int = 256,
+        sessions_per_run: int = 200,
+        retention_days: float = 0,
+        vacuum_pages: int = 4096,
+    ):
+        self.db = db
+        self.after_days = after_days
+        self.segment_rows = max(1, segment_rows)
+        self.sessions_per_run = sessions_per_run
+        self.retention_days = retention_days
+        self.vacuum_pages = vacuum_pages
+        self._task: Optional[asyncio.Task] = None
+
+    # -- reads ------------------------------------------------------------------------
+
+    async def read(self, session_id: str, limit: int, before_id: int) -> List[Tuple[int, str, str]]:
+        """Up to `limit` archived (id, role, content) of a session with id < before_id, oldest first."""
+        out: List[Tuple[int, str, str]] = []
+        segments = await self.db.fetchall(
+            _SEGMENTS_BEFORE, (session_id, before_id, limit // self.segment_rows + 2)
+        )
+        for seg in segments:
+            rows = [(r[0], r[1], r[2]) for r in decode_segment(seg["body"]) if r[0] < before_id]
+            out = rows[-(limit - len(out)):] + out
+            if len(out) >= limit:
+                break
+        return out
+
+    async def fetch(self, ids: List[int]) -> Dict[int, Tuple[str, str, str]]:
+        """Archived messages by id: {id: (session_id, role, content)}."""
+        if not ids:
+            return {}
+        rows = await self.db.fetchall(_SEGMENTS_OF.format(marks=",".join("?" * len(ids))), list(ids))
+        wanted, out, decoded = set(ids), {}, {}
+        for r in rows:
+            if r["id"] not in decoded:
+                decoded[r["id"]] = (r["session_id"], decode_segment(r["body"]))
+        for session_id, messages in decoded.values():
+            for mid, role, content, _ in messages:
+                if mid in wanted:
+                    out[mid] = (session_id, role, content)
+        return out
+
+    async def search(
+        self, text: str, session_id: Optional[str] = None, limit: int = 20, sessions: Optional[Collection[str]] = None
+    ) -> List[dict]:
+        """Archived messages matching every word of `text`, best first; only from `sessions` if given."""
+        query = fts_query(text)
+        if not query:
+            return []
+        filtered = session_id is not None or sessions is not None
+        # Session filtering happens after the lookup, so over-fetch when there is one.
+        rows = await self.db.fetchall(_SEARCH, (query, limit * 4 if filtered else limit))
+        ids = [r["rowid"] for r in rows]
+        found = await self.fetch(ids)
+        hits = []
+        for mid in ids:
+            hit = found.get(mid)
+            if hit is None or (session_id is not None and hit[0] != session_id):
+                continue
+            if sessions is not None and hit[0] not in sessions:
+                continue
+            hits.append({"id": mid, "session_id": hit[0], "role": hit[1], "content": hit[2]})
+        return hits[:limit]
+
+    # -- maintenance ------------------------------------------------------------------
+
+    async def compact(self) -> int:
+        """Archive up to sessions_per_run idle sessions; returns messages moved."""
+        if self.after_days <= 0:
+            return 0
+        await self.db.flush()
+        idle = await self.db.fetchall(_IDLE_SESSIONS, (f"-{self.after_days} days", self.sessions_per_run))
+        moved = 0
+        for r in idle:
+            # One session per transaction: live group commits wait for one session at most.
+            moved += await self.db.on_writer(lambda conn, r=r: self._archive_session(conn, r["session_id"], r["id"]))
+        if moved:
+            ARCHIVED.inc(moved)
+            log.info("Archived %d messages from %d idle session(s)", moved, len(idle))
+        return moved
+
+    async def _archive_session(self, conn, session_id: str, last_id: int) -> int:
+        async with conn.execute(_SESSION_ROWS, (session_id, last_id)) as cur:
+            rows = [(r["id"], r["role"], r["content"], r["created_at"]) for r in await cur.fetchall()]
+        if not rows:
+            return 0
+        chunks = [rows[i:i + self.segment_rows] for i in range(0, len(rows), self.segment_rows)]
+        bodies = await asyncio.to_thread(lambda: [encode_segment(c) for c in chunks])
+        await conn.execute("BEGIN")
+        try:
+            for chunk, body in zip(chunks, bodies):
+                cur = await conn.execute(
+                    _INSERT_SEGMENT,
+                    (session_id, chunk[0][0], chunk[-1][0], len(chunk), chunk[0][3], chunk[-1][3], _CODEC, body),
+                )
+                segment_id = cur.lastrowid
+                await conn.executemany(
+                    "INSERT INTO conversation_archive_map (id, segment_id) VALUES (?, ?)", [(c[0], segment_id) for c in chunk]
+                )
+                await conn.executemany(
+                    "INSERT INTO conversation_archive_fts (rowid, content) VALUES (?, ?)", [(c[0], c[2]) for c in chunk]
+                )
+            await conn.execute("DELETE FROM conversations WHERE session_id = ? AND id <= ?", (session_id, last_id))
+            await conn.execute("COMMIT")
+        except Exception:
+            await conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    async def expire(self) -> int:
+        """Delete archived segments that ended more than retention_days ago; returns segments dropped."""
+        if self.retention_days <= 0:
+            return 0
+        return await self.db.on_writer(self._expire)
+
+    async def _expire(self, conn) -> int:
+        async with conn.execute(_EXPIRED, (f"-{self.retention_days} days", self.sessions_per_run)) as cur:
+            segments = await cur.fetchall()
+        if not segments:
+            return 0
+        await conn.execute("BEGIN")
+        try:
+            for seg in segments:
+                # Contentless FTS5 deletes need the original text, which only the segment has.
+                await conn.executemany(
+                    "INSERT INTO conversation_archive_fts (conversation_archive_fts, rowid, content) VALUES ('delete', ?, ?)",
+                    [(m[0], m[2]) for m in decode_segment(seg["body"])],
+                )
+                await conn.execute("DELETE FROM conversation_archive_map WHERE segment_id = ?", (seg["id"],))
+                await conn.execute("DELETE FROM conversation_archive WHERE id = ?", (seg["id"],))
+            await conn.execute("COMMIT")
+        except Exception:
+            await conn.execute("ROLLBACK")
+            raise
+        log.info("Dropped %d archived segment(s) past retention", len(segments))
+        return len(segments)
+
+    async def vacuum(self) -> int:
+        """Give up to vacuum_pages free pages back to the OS and truncate the WAL; returns pages freed."""
+        if self.vacuum_pages <= 0:
+            return 0
+        return await self.db.on_writer(self._vacuum)
+
+    async def _vacuum(self, conn) -> int:
+        async with conn.execute("PRAGMA auto_vacuum") as cur:
+            mode = (await cur.fetchone())[0]
+        if mode != 2:
+            # A database created before auto_vacuum=INCREMENTAL: one full rebuild switches it.
+            log.info("Converting the database to incremental auto-vacuum (one-time VACUUM)")
+            await conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            await conn.execute("VACUUM")
+            return 0
+        async with conn.execute("PRAGMA freelist_count") as cur:
+            free = (await cur.fetchone())[0]
+        pages = min(free, self.vacuum_pages)
+        if pages:
+            # Each step of the statement frees one page and execute() steps only once;
+            # executescript runs it to completion.
+            await conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+            VACUUMED.inc(pages)
+        await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return pages
+
+    async def maintain(self) -> None:
+        await self.compact()
+        await self.expire()
+        await self.vacuum()
+
+    def start(self, interval_s: float) -> None:
+        if interval_s > 0 and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._run(interval_s))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def _run(self, interval_s: float) -> None:
+        while True:
+            await asyncio.sleep(interval_s)
+            try:
+                await self.maintain()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Maintenance pass failed: %s", e)
+
+
+_archive: Optional[ConversationArchive] = None
+
+
+def get_archive(db: Optional[Database] = None) -> ConversationArchive:
+    global _archive
+    db = db or get_database()
+    if _archive is None or _archive.db is not db:
+        s = get_settings()
+        _archive = ConversationArchive(
+            db,
+            after_days=s.db_archive_after_days,
+            segment_rows=s.db_archive_segment_rows,
+            sessions_per_run=s.db_archive_sessions_per_run,
+            retention_days=s.db_retention_days,
+            vacuum_pages=s.db_vacuum_pages,
+        )
+    return _archive
+
+
+def start_maintenance() -> None:
+    get_archive().start(get_settings().db_maintenance_interval_s)
+
+
+async def shutdown_maintenance() -> None:
+    if _archive is not None:
+        await _archive.stop()
+
+
+def _db_file_bytes() -> float:
+    path = get_settings().db_path
+    return float(sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)))
+
+
+metrics.gauge("tutor_db_file_bytes", "SQLite database + WAL size on disk").set_function(_db_file_bytes)
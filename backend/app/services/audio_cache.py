@@ -0,0 +1,170 @@
+# backend/app/services/audio_cache.py — content-addressed TTS audio cache (memory hot tier + disk)
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.config import get_settings
+
+
+def normalize_text(text: str) -> str:
+    """Whitespace/Unicode-insensitive form used for cache keys (case and punctuation still matter for prosody)."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def voice_identity(model_path: str) -> str:
+    """Identify a voice by its .onnx (and .onnx.json) path, size and mtime, without hashing the weights."""
+    parts = []
+    for p in (Path(model_path), Path(model_path + ".json")):
+        try:
+            st = p.stat()
+            parts.append(f"{p.resolve()}:{st.st_size}:{st.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{p}:missing")
+    return "|".join(parts)
+
+
+class AudioCache:
+    """
+    Size-bounded LRU of synthesized audio. Files live at <dir>/<k[:2]>/<k>.wav, are written
+    via temp file + os.replace (safe with several processes sharing the directory), and
+    their mtime is bumped on every hit so eviction removes the least recently used.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, hot_bytes: int):
+        self.dir = Path(directory)
+        self.max_bytes = max_bytes
+        self.hot_bytes = hot_bytes
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hot_used = 0
+        self._disk_used: Optional[int] = None
+        self._lock = threading.Lock()
+        self.hits_hot = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(text: str, model_path: str, params: Dict[str, Any]) -> str:
+        blob = json.dumps(
+            {"text": normalize_text(text), "voice": voice_identity(model_path), "params": params},
+            sort_keys=True,
+        )
+        return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._hot.get(key)
+            if data is not None:
+                self._hot.move_to_end(key)
+                self.hits_hot += 1
+                return data
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits_disk += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            self._remember(key, data)
+            if self._disk_used is not None:
+                self._disk_used += len(data)
+        if self._disk_usage() > self.max_bytes:
+            self._evict()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits_hot": self.hits_hot,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "hot_bytes": self._hot_used,
+            "disk_bytes": self._disk_used or 0,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.dir / key[:2] / f"{key}.wav"
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.hot_bytes:
+            return
+        if key in self._hot:
+            self._hot_used -= len(self._hot.pop(key))
+        self._hot[key] = data
+        self._hot_used += len(data)
+        while self._hot_used > self.hot_bytes:
+            _, old = self._hot.popitem(last=False)
+            self._hot_used -= len(old)
+
+    def _disk_usage(self) -> int:
+        if self._disk_used is None:
+            self._disk_used = sum(p.stat().st_size for p in self.dir.glob("*/*.wav"))
+        return self._disk_used
+
+    def _evict(self) -> None:
+        # Another process may be evicting too; missing files are fine.
+        entries = []
+        for p in self.dir.glob("*/*.wav"):
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        # Evict down to 90% so we don't rescan on every put.
+        target = int(self.max_bytes * 0.9)
+        for _, size, p in entries:
+            if total <= target:
+                break
+            try:
+                p.unlink()
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_used = total
+
+
+_cache: Optional[AudioCache] = None
+
+
+def get_audio_cache() -> Optional[AudioCache]:
+    """Process-wide cache, or None when disabled (TUTOR_TTS_CACHE_MB=0)."""
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        if s.tts_cache_mb <= 0:
+            return None
+        _cache = AudioCache(
+            s.tts_cache_dir,
+            max_bytes=s.tts_cache_mb * 1024 * 1024,
+            hot_bytes=s.tts_cache_hot_mb * 1024 * 1024,
+        )
+    return _cache
@@ -0,0 +1,136 @@
+# backend/app/services/audio_transport.py — binary, chunked TTS audio frames for the WebSocket
+#
+# Clients that offer an audio format in `start_session` get each TTS segment as one small
+# `tts_segment` JSON header followed by binary frames of `chunk_ms` audio each, instead of
+# a base64 WAV inside `tts_chunk`. Every binary frame starts with a 16-byte header:
+#
+#   offset size  field
+#   0      2     magic b"TA"
+#   2      1     version (1)
+#   3      1     codec: 0 = pcm16 (s16le mono), 1 = opus
+#   4      1     flags: 1 = first chunk of the segment, 2 = last chunk
+#   5      1     reserved (0)
+#   6      2     sample rate / 10 (u16; 48000 Hz -> 4800)
+#   8      4     segment seq (same as the tts_segment header)
+#   12     4     chunk index within the segment
+#
+# pcm16 payloads are raw samples. opus payloads are one or more 20 ms packets, each
+# prefixed with its u16 length; opus is only offered when `opuslib` (libopus) is installed.
+
+import io
+import struct
+import wave
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PCM16 = "pcm16"
+OPUS = "opus"
+_CODECS = {PCM16: 0, OPUS: 1}
+
+MAGIC = b"TA"
+VERSION = 1
+FLAG_FIRST = 1
+FLAG_LAST = 2
+_HEADER = struct.Struct("<2sBBBBHII")
+
+_OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+_OPUS_FRAME_MS = 20
+
+
+def available_formats() -> List[str]:
+    """Formats this server can produce, best first."""
+    formats = [PCM16]
+    try:
+        import opuslib  # noqa: F401
+        formats.insert(0, OPUS)
+    except Exception:
+        pass
+    return formats
+
+
+def wav_to_pcm(wav: bytes) -> Tuple[bytes, int]:
+    """WAV bytes (as produced by Piper / the audio cache) -> (s16le mono PCM, sample rate)."""
+    with wave.open(io.BytesIO(wav), "rb") as w:
+        if w.getsampwidth() != 2:
+            raise ValueError(f"Expected 16-bit WAV, got {8 * w.getsampwidth()}-bit")
+        pcm = w.readframes(w.getnframes())
+        rate = w.getframerate()
+        if w.getnchannels() > 1:
+            samples = np.frombuffer(pcm, dtype=np.int16).reshape(-1, w.getnchannels())
+            pcm = samples.mean(axis=1).astype(np.int16).tobytes()
+    return pcm, rate
+
+
+def _resample(pcm: bytes, rate: int, target: int) -> bytes:
+    if rate == target:
+        return pcm
+    x = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+    n = int(round(len(x) * target / rate))
+    y = np.interp(np.linspace(0, len(x) - 1, n), np.arange(len(x)), x)
+    return np.clip(y, -32768, 32767).astype(np.int16).tobytes()
+
+
+class AudioFormat:
+    """The negotiated format for one connection; turns a segment's WAV into binary frames."""
+
+    def __init__(self, codec: str, chunk_ms: int = 100, opus_bitrate: int = 24000):
+        if codec not in _CODECS:
+            raise ValueError(f"Unknown audio codec {codec!r}")
+        self.codec = codec
+        # Opus chunks hold whole 20 ms packets.
+        step = _OPUS_FRAME_MS if codec == OPUS else 10
+        self.chunk_ms = max(step, int(chunk_ms) // step * step)
+        self.opus_bitrate = opus_bitrate
+
+    def describe(self) -> Dict[str, object]:
+        return {"format": self.codec, "chunk_ms": self.chunk_ms}
+
+    def frames(self, seq: int, wav: bytes) -> Tuple[int, List[bytes]]:
+        """Returns (sample rate, binary frames) for one TTS segment."""
+        pcm, rate = wav_to_pcm(wav)
+        if self.codec == OPUS:
+            rate, payloads = self._opus_payloads(pcm, rate)
+        else:
+            step = rate * self.chunk_ms // 1000 * 2
+            payloads = [pcm[i : i + step] for i in range(0, len(pcm), step)] or [b""]
+        out = []
+        last = len(payloads) - 1
+        for i, payload in enumerate(payloads):
+            flags = (FLAG_FIRST if i == 0 else 0) | (FLAG_LAST if i == last else 0)
+            out.append(_HEADER.pack(MAGIC, VERSION, _CODECS[self.codec], flags, 0, rate // 10, seq, i) + payload)
+        return rate, out
+
+    def _opus_payloads(self, pcm: bytes, rate: int) -> Tuple[int, List[bytes]]:
+        import opuslib
+
+        target = rate if rate in _OPUS_RATES else next((r for r in _OPUS_RATES if r >= rate), 48000)
+        pcm = _resample(pcm, rate, target)
+        enc = opuslib.Encoder(target, 1, opuslib.APPLICATION_VOIP)
+        enc.bitrate = self.opus_bitrate
+        frame_samples = target * _OPUS_FRAME_MS // 1000
+        frame_bytes = frame_samples * 2
+        if len(pcm) % frame_bytes:
+            pcm += b"\0" * (frame_bytes - len(pcm) % frame_bytes)
+        packets = [enc.encode(pcm[i : i + frame_bytes], frame_samples) for i in range(0, len(pcm), frame_bytes)]
+        per_chunk = self.chunk_ms // _OPUS_FRAME_MS
+        payloads = []
+        for i in range(0, len(packets), per_chunk):
+            payloads.append(b"".join(struct.pack("<H", len(p)) + p for p in packets[i : i + per_chunk]))
+        return target, payloads or [b""]
+
+
+def negotiate(offer: Optional[dict], default_chunk_ms: int = 100, opus_bitrate: int = 24000) -> Optional[AudioFormat]:
+    """
+    Pick the first format in the client's offer ({"formats": [...], "chunk_ms": n}) that we
+    support. None means the client did not offer one: keep sending JSON `tts_chunk`.
+    """
+    if not isinstance(offer, dict):
+        return None
+    wanted: Sequence[str] = offer.get("formats") or []
+    supported = available_formats()
+    for codec in wanted:
+        if codec in supported:
+            chunk_ms = offer.get("chunk_ms") or default_chunk_ms
+            return AudioFormat(codec, min(max(int(chunk_ms), 10), 1000), opus_bitrate)
+    return None
@@ -0,0 +1,135 @@
+# backend/app/services/context_builder.py — assemble prompt history under a hard token budget
+
+import asyncio
+from typing import List, Optional, Tuple
+
+from app.log import get_logger
+from app.prompts.tutoring_prompts import SUMMARY_PROMPT
+from app.services.llm_service import count_tokens, generate_stream, system_prefix
+from app.services.memory_service import MemoryService
+from app.services.semantic_index import search_related
+
+log = get_logger("llm.context")
+
+# [INST] / [/INST] / </s><s> wrapping added by format_for_llama per message
+_PER_MESSAGE_OVERHEAD = 8
+_SAFETY_MARGIN = 32
+_RELATED_CHARS = 200
+_RELATED_TIMEOUT_S = 0.25
+
+
+class ContextBuilder:
+    """
+    Per-session prompt assembly. The newest stored messages that fit the budget
+    (n_ctx - reply - system - new prompt) are sent verbatim; anything older is folded
+    into a rolling summary that a background task updates after the turn, so
+    prompt-eval cost stays bounded however long the session runs.
+    """
+
+    def __init__(
+        self,
+        memory: MemoryService,
+        session_id: str,
+        n_ctx: int,
+        history_limit: int = 200,
+        related_k: int = 0,
+        related_min_score: float = 0.0,
+    ):
+        self.memory = memory
+        self.session_id = session_id
+        self.n_ctx = n_ctx
+        self.history_limit = history_limit
+        self.related_k = related_k
+        self.related_min_score = related_min_score
+        self.student_id: Optional[str] = None   # set by start_session; enables recall of the student's earlier sessions
+        self.summary = ""
+        self._summarized_upto = 0          # last conversations.id folded into the summary
+        self._overflow: List[Tuple[int, str, str]] = []
+        self._summary_task: Optional[asyncio.Task] = None
+
+    def context_note(self, related: Optional[List[str]] = None) -> str:
+        """
+        Rolling summary and related memories. Sent as a leading "context" message, after the
+        fixed system prompt, so only that prefix is keyed and pinned in the KV cache.
+        """
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the conversation so far: {self.summary}")
+        if related:
+            parts.append("From earlier sessions:\n" + "\n".join(f"- {r}" for r in related))
+        return "\n\n".join(parts)
+
+    async def related(self, prompt: str) -> List[str]:
+        """Semantically related past messages/topics; skipped if the index is slow or unavailable."""
+        if self.related_k <= 0:
+            return []
+        try:
+            hits = await asyncio.wait_for(
+                search_related(
+                    self.session_id, prompt, self.related_k, self.related_min_score, self.student_id
+                ),
+                _RELATED_TIMEOUT_S,
+            )
+        except Exception:
+            return []
+        return [h.text[:_RELATED_CHARS] for h in hits]
+
+    async def build(self, system: str, prompt: str, max_tokens: int) -> Tuple[str, List[Tuple[str, str]]]:
+        """Returns (system prompt, history led by the summary/related context note) for generate_stream."""
+        rows, related = await asyncio.gather(
+            self.memory.get_history(self.session_id, self.history_limit),
+            self.related(prompt),
+        )
+        note = self.context_note(related)
+        budget = (
+            self.n_ctx
+            - max_tokens
+            - count_tokens(system_prefix(system))
+            - (count_tokens(note) if note else 0)
+            - count_tokens(prompt)
+            - _PER_MESSAGE_OVERHEAD
+            - _SAFETY_MARGIN
+        )
+        kept: List[Tuple[int, str, str]] = []
+        for row in reversed(rows):
+            cost = count_tokens(row[2]) + _PER_MESSAGE_OVERHEAD
+            if cost > budget:
+                break
+            budget -= cost
+            kept.append(row)
+        kept.reverse()
+        # History must start with a user turn for the [INST] layout.
+        while kept and kept[0][1] != "user":
+            kept.pop(0)
+        first_kept = kept[0][0] if kept else None
+        self._overflow = [
+            r for r in rows
+            if r[0] > self._summarized_upto and (first_kept is None or r[0] < first_kept)
+        ]
+        history = [(role, content) for _, role, content in kept]
+        return system, ([("context", note)] + history if note else history)
+
+    def summarize_in_background(self) -> None:
+        """Fold messages that no longer fit into the summary (one update at a time per session)."""
+        if not self._overflow or (self._summary_task and not self._summary_task.done()):
+            return
+        batch, self._overflow = self._overflow, []
+        self._summary_task = asyncio.create_task(self._update_summary(batch))
+
+    def cancel(self) -> None:
+        if self._summary_task and not self._summary_task.done():
+            self._summary_task.cancel()
+
+    async def _update_summary(self, batch: List[Tuple[int, str, str]]) -> None:
+        messages = "\n".join(f"{role}: {content}" for _, role, content in batch)
+        prompt = SUMMARY_PROMPT.format(summary=self.summary or "(none)", messages=messages)
+        text = ""
+        try:
+            async for token in generate_stream(prompt, "You write concise summaries.", [], max_tokens=120, temperature=0.2):
+                text += token
+        except Exception as e:
+            log.warning("Summary update failed: %s", e)
+            return
+        if text.strip():
+            self.summary = text.strip()
+            self._summarized_upto = batch[-1][0]
@@ -0,0 +1,212 @@
+# backend/app/services/db.py — process-wide SQLite pool (WAL) with write-behind group commits
+
+import asyncio
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+from app import tracing
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("db")
+
+SCHEMA_PATH = Path(__file__).resolve().parent.parent.parent / "schemas" / "schema.sql"
+
+_PRAGMAS = (
+    # Before journal_mode, which writes the header of a new file; an existing file keeps
+    # its mode until archive.py converts it once.
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",     # durable at checkpoints; safe with WAL
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-16000",      # ~16 MB page cache per connection
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+class Database:
+    """
+    Readers share a small pool of long-lived connections; all writes go through one
+    writer connection. write_behind() queues a statement and returns immediately; the
+    writer commits everything queued within `flush_ms` as one transaction. Each
+    connection keeps a statement cache, so the constant SQL used by MemoryService is
+    prepared once per connection rather than per call.
+    """
+
+    def __init__(self, path: str, readers: int = 4, flush_ms: int = 5, cached_statements: int = 256):
+        self.path = path
+        self.readers = max(1, readers)
+        self.flush_s = flush_ms / 1000
+        self.cached_statements = cached_statements
+        self._pool: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+        self._all: List[aiosqlite.Connection] = []
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._writes: List[Tuple[str, Sequence[Any], Optional[asyncio.Future]]] = []
+        self._wake = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._inflight: Optional[asyncio.Future] = None
+        self._open_lock = asyncio.Lock()
+        self._writer_lock = asyncio.Lock()   # group commits vs. on_writer() maintenance
+        self._opened = False
+
+    async def open(self) -> None:
+        async with self._open_lock:
+            if self._opened:
+                return
+            self._writer = await self._connect()
+            # Schema once per process, on the writer.
+            await self._writer.executescript(SCHEMA_PATH.read_text())
+            for _ in range(self.readers):
+                conn = await self._connect()
+                self._all.append(conn)
+                self._pool.put_nowait(conn)
+            self._flusher = asyncio.create_task(self._flush_loop())
+            self._opened = True
+
+    async def _connect(self) -> aiosqlite.Connection:
+        # Autocommit mode: transactions are explicit (BEGIN/COMMIT in _commit), so readers
+        # never hold a read transaction open between queries.
+        conn = await aiosqlite.connect(self.path, isolation_level=None, cached_statements=self.cached_statements)
+        conn.row_factory = aiosqlite.Row
+        for pragma in _PRAGMAS:
+            await conn.execute(pragma)
+        return conn
+
+    @asynccontextmanager
+    async def reader(self):
+        await self.open()
+        conn = await self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put_nowait(conn)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = (), after_writes: bool = False) -> List[aiosqlite.Row]:
+        """`after_writes=True` waits for queued writes first (read-your-writes)."""
+        if after_writes:
+            await self.flush()
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cur:
+                return await cur.fetchall()
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = (), after_writes: bool = False) -> Optional[aiosqlite.Row]:
+        rows = await self.fetchall(sql, params, after_writes)
+        return rows[0] if rows else None
+
+    def write_behind(self, sql: str, params: Sequence[Any] = ()) -> None:
+        """Queue a write; it is committed with others in the next group commit."""
+        self._writes.append((sql, params, None))
+        self._wake.set()
+
+    async def execute(self, sql: Optional[str], params: Sequence[Any] = ()) -> None:
+        """Queue a write and wait until it is committed (sql=None is a pure barrier)."""
+        await self.open()
+        fut = asyncio.get_running_loop().create_future()
+        self._writes.append((sql, params, fut))
+        self._wake.set()
+        await fut
+
+    async def on_writer(self, fn):
+        """
+        Run `await fn(conn)` on the writer connection between group commits, for work that
+        needs its own transaction or must run outside one (archiving, vacuum, checkpoints).
+        """
+        await self.open()
+        async with self._writer_lock:
+            return await fn(self._writer)
+
+    async def flush(self) -> None:
+        """Wait until everything queued so far is committed."""
+        if not self._opened:
+            await self.open()
+        if self._writes:
+            await self.execute(None)
+        elif self._inflight is not None:
+            await asyncio.shield(self._inflight)
+
+    async def close(self) -> None:
+        """Flush pending writes, then close every connection."""
+        if not self._opened:
+            return
+        await self.flush()
+        if self._flusher:
+            self._flusher.cancel()
+        for conn in self._all + [self._writer]:
+            await conn.close()
+        self._all.clear()
+        self._pool = asyncio.Queue()
+        self._opened = False
+
+    async def _flush_loop(self) -> None:
+        tracing.detach()
+        while True:
+            await self._wake.wait()
+            # Let more writes pile up so they share one commit.
+            await asyncio.sleep(self.flush_s)
+            self._wake.clear()
+            batch, self._writes = self._writes, []
+            if not batch:
+                continue
+            self._inflight = asyncio.get_running_loop().create_future()
+            try:
+                with tracing.span("db_write", rows=len(batch)):
+                    async with self._writer_lock:
+                        await self._commit(batch)
+                for _, _, fut in batch:
+                    if fut is not None and not fut.done():
+                        fut.set_result(None)
+            except Exception as e:
+                log.error("Group commit of %d writes failed: %s", len(batch), e)
+                for _, _, fut in batch:
+                    if fut is not None and not fut.done():
+                        fut.set_exception(e)
+            finally:
+                self._inflight.set_result(None)
+                self._inflight = None
+
+    async def _commit(self, batch) -> None:
+        w = self._writer
+        await w.execute("BEGIN")
+        try:
+            # Consecutive identical statements go through executemany; order is preserved.
+            batch = [b for b in batch if b[0] is not None]
+            i = 0
+            while i < len(batch):
+                sql = batch[i][0]
+                j = i
+                while j < len(batch) and batch[j][0] == sql:
+                    j += 1
+                if j - i == 1:
+                    await w.execute(sql, batch[i][1])
+                else:
+                    await w.executemany(sql, [b[1] for b in batch[i:j]])
+                i = j
+            await w.execute("COMMIT")
+        except Exception:
+            await w.execute("ROLLBACK")
+            raise
+
+
+_databases: Dict[str, Database] = {}
+
+
+def get_database(path: Optional[str] = None) -> Database:
+    path = path or get_settings().db_path
+    db = _databases.get(path)
+    if db is None:
+        s = get_settings()
+        db = Database(path, readers=s.db_pool_size, flush_ms=s.db_flush_ms)
+        _databases[path] = db
+    return db
+
+
+async def close_databases() -> None:
+    """Flush write-behind queues and close all pools (called from the lifespan shutdown)."""
+    dbs = list(_databases.values())
+    _databases.clear()
+    for db in dbs:
+        await db.close()
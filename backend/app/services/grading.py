@@ -0,0 +1,116 @@
+# backend/app/services/grading.py — grade a student's answer from one forward pass
+#
+# Instead of generating "CORRECT ..." and parsing it, the grading prompt (QUESTION_PROMPT)
+# is evaluated once and the next-token logits are read: the log-probability mass on the
+# first token of each label ("Yes"/"No" and variants) decides the verdict, and the
+# softmax over the two labels is its confidence. Restricting the choice to the label
+# tokens is the same constraint a one-rule grammar would impose, without a sampling step.
+# Grading reuses the session's KV state, so it costs the new prompt tokens only.
+
+import math
+import time
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app import tracing
+from app.prompts.tutoring_prompts import QUESTION_PROMPT
+
+# (label, spellings); the first token of each spelling counts for the label.
+Labels = Tuple[Tuple[str, Tuple[str, ...]], ...]
+ANSWER_LABELS: Labels = (
+    ("correct", ("Yes", "yes", "YES", "Correct")),
+    ("incorrect", ("No", "no", "NO", "Incorrect")),
+)
+
+
+class Verdict(NamedTuple):
+    correct: bool
+    confidence: float   # probability of the chosen label, given that one of the two is chosen
+    ms: float
+
+
+# -- engine thread ---------------------------------------------------------------------
+
+@lru_cache(maxsize=8)
+def label_token_ids(llm, labels: Labels) -> Dict[str, List[int]]:
+    """First token id of every spelling; ids shared between labels say nothing and are dropped."""
+    ids: Dict[str, set] = {}
+    for name, spellings in labels:
+        ids[name] = set()
+        for text in spellings:
+            tokens = llm.tokenize(text.encode("utf-8"), add_bos=False)
+            if tokens:
+                ids[name].add(tokens[0])
+    out = {}
+    for name, own in ids.items():
+        others = set().union(*(v for k, v in ids.items() if k != name))
+        out[name] = sorted(own - others)
+    return out
+
+
+def label_logprobs(logits: np.ndarray, ids: Dict[str, List[int]]) -> Dict[str, float]:
+    """log P(first token is one of the label's ids) under the full next-token distribution."""
+    z = logits.astype(np.float64)
+    z -= z.max()
+    log_norm = math.log(np.exp(z).sum())
+    out = {}
+    for name, toks in ids.items():
+        out[name] = float(np.logaddexp.reduce(z[toks]) - log_norm) if toks else float("-inf")
+    return out
+
+
+def last_logits(llm) -> np.ndarray:
+    """Logits after the most recent Llama.eval."""
+    if llm.context_params.logits_all:
+        return np.asarray(llm.scores[llm.n_tokens - 1])
+    import llama_cpp
+    ptr = llama_cpp.llama_get_logits(llm.ctx)
+    return np.ctypeslib.as_array(ptr, shape=(llm.n_vocab(),)).copy()
+
+
+def classify_logits(llm, text: str, labels: Labels) -> Dict[str, float]:
+    """Evaluate `text` on top of whatever prefix the KV cache already holds and score the labels."""
+    from app.services.llm_service import tokenize_prompt
+    # Llama.generate keeps the longest prefix it shares with the loaded state and always
+    # evaluates at least the last token, so the logits belong to this prompt. Its first
+    # (greedy) sample is discarded: only the logits it was drawn from are read.
+    steps = llm.generate(tokenize_prompt(llm, text), temp=0.0, reset=True)
+    try:
+        next(steps)
+    finally:
+        steps.close()
+    return label_logprobs(last_logits(llm), label_token_ids(llm, labels))
+
+
+# -- event loop ------------------------------------------------------------------------
+
+def to_verdict(scores: Dict[str, float], ms: float) -> Verdict:
+    """
+    Raises ValueError when neither label was scored, so the caller falls back to a generated
+    reply; an exact tie is graded incorrect at confidence 0.5.
+    """
+    a, b = scores.get("correct", float("-inf")), scores.get("incorrect", float("-inf"))
+    if a == b == float("-inf"):
+        raise ValueError("no label token has any probability")
+    p = 1.0 / (1.0 + math.exp(min(700.0, b - a)))
+    return Verdict(p > 0.5, round(max(p, 1.0 - p), 4), round(ms, 2))
+
+
+async def grade_answer(
+    question: str,
+    user_answer: str,
+    system: str,
+    history: Sequence[Tuple[str, str]],
+    session_id: Optional[str] = None,
+) -> Verdict:
+    """Classify the answer with one decode step; the conversation so far is context."""
+    from app.services.llm_service import classify
+    prompt = QUESTION_PROMPT.format(question=question, user_answer=user_answer)
+    t0 = time.perf_counter()
+    with tracing.span("grade") as sp:
+        scores = await classify(prompt, system, history, ANSWER_LABELS, session_id=session_id)
+        verdict = to_verdict(scores, (time.perf_counter() - t0) * 1000)
+        sp.update(correct=verdict.correct, confidence=verdict.confidence)
+    return verdict
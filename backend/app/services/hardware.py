@@ -0,0 +1,144 @@
+# backend/app/services/hardware.py — what this node has: cores, SIMD, RAM, accelerators
+#
+# Used by scripts/calibrate.py to describe the machine a profile was measured on, by
+# config.py to refuse a profile measured on different hardware, and for thread defaults.
+
+import os
+import platform
+import shutil
+import subprocess
+from functools import lru_cache
+from typing import Any, Dict, List
+
+# CPU flags that change llama.cpp / Whisper kernel choice, in /proc/cpuinfo spelling.
+_SIMD = ("sse3", "ssse3", "avx", "avx2", "fma", "f16c", "avx512f", "avx512bw", "avx512_vnni", "avx_vnni", "amx_int8", "asimd", "sve", "i8mm")
+
+
+def _cpuinfo() -> List[Dict[str, str]]:
+    """One dict per processor entry of /proc/cpuinfo (empty off Linux)."""
+    blocks, cur = [], {}
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                key, sep, value = line.partition(":")
+                if not sep:
+                    if cur:
+                        blocks.append(cur)
+                        cur = {}
+                    continue
+                cur[key.strip()] = value.strip()
+    except OSError:
+        return []
+    if cur:
+        blocks.append(cur)
+    return blocks
+
+
+@lru_cache(maxsize=1)
+def physical_cores() -> int:
+    """Physical cores (hyper-threads share one core's FPU, so llama.cpp gains little from them)."""
+    try:
+        import psutil
+        n = psutil.cpu_count(logical=False)
+        if n:
+            return n
+    except ImportError:
+        pass
+    cores = {(b.get("physical id"), b["core id"]) for b in _cpuinfo() if "core id" in b}
+    if cores:
+        return len(cores)
+    return os.cpu_count() or 1
+
+
+def logical_cores() -> int:
+    return os.cpu_count() or 1
+
+
+def cpu_model() -> str:
+    for b in _cpuinfo():
+        for key in ("model name", "Model", "Hardware"):
+            if b.get(key):
+                return b[key]
+    return platform.processor() or platform.machine()
+
+
+def simd_features() -> List[str]:
+    info = _cpuinfo()
+    flags = set((info[0].get("flags") or info[0].get("Features") or "").split()) if info else set()
+    if "pni" in flags:   # x86 kernels report SSE3 as "pni"
+        flags.add("sse3")
+    if platform.system() == "Darwin" and platform.machine() == "arm64":
+        flags |= {"asimd"}
+    return [f for f in _SIMD if f in flags]
+
+
+def total_ram_bytes() -> int:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 0
+
+
+def accelerators() -> List[Dict[str, Any]]:
+    """GPUs llama.cpp or Whisper could use: NVIDIA (nvidia-smi) and Apple Metal."""
+    out = []
+    if shutil.which("nvidia-smi"):
+        try:
+            lines = subprocess.run(
+                ["nvidia-smi", "--query-gpu=name,memory.total", "--format=csv,noheader,nounits"],
+                capture_output=True, text=True, timeout=10,
+            ).stdout.strip().splitlines()
+            for line in lines:
+                name, _, mem = line.rpartition(",")
+                out.append({"kind": "cuda", "name": name.strip(), "memory_mb": int(float(mem))})
+        except (OSError, ValueError, subprocess.TimeoutExpired):
+            pass
+    if platform.system() == "Darwin" and platform.machine() == "arm64":
+        out.append({"kind": "metal", "name": "Apple GPU", "memory_mb": total_ram_bytes() // (1024 * 1024)})
+    return out
+
+
+def llama_gpu_offload() -> bool:
+    """Whether the installed llama-cpp-python was built with a GPU backend."""
+    try:
+        import llama_cpp
+        return bool(llama_cpp.llama_supports_gpu_offload())
+    except (ImportError, AttributeError):
+        return False
+
+
+def torch_cuda() -> bool:
+    try:
+        import torch
+        return torch.cuda.is_available()
+    except ImportError:
+        return False
+
+
+def fingerprint() -> Dict[str, Any]:
+    """What a calibration result depends on; a profile is only used on a node that matches."""
+    return {
+        "cpu": cpu_model(),
+        "physical_cores": physical_cores(),
+        "logical_cores": logical_cores(),
+        "gpus": [g["name"] for g in accelerators()],
+    }
+
+
+def detect() -> Dict[str, Any]:
+    return {
+        **fingerprint(),
+        "machine": platform.machine(),
+        "simd": simd_features(),
+        "ram_mb": total_ram_bytes() // (1024 * 1024),
+        "accelerators": accelerators(),
+        "llama_gpu_offload": llama_gpu_offload(),
+        "torch_cuda": torch_cuda(),
+    }
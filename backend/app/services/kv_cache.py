@@ -0,0 +1,217 @@
+# backend/app/services/kv_cache.py — saved llama.cpp states (system prompt prefix + per-session KV)
+
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, List, Optional, Tuple
+
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("llm.kv")
+
+
+def state_nbytes(state: Any) -> int:
+    """Approximate RAM held by a LlamaState (KV blob + token ids + logits)."""
+    n = int(getattr(state, "llama_state_size", 0) or 0)
+    for attr in ("input_ids", "scores"):
+        arr = getattr(state, attr, None)
+        n += int(getattr(arr, "nbytes", 0) or 0)
+    return n
+
+
+class KVStateCache:
+    """
+    LRU of saved llama states bounded by a RAM budget. Evicted entries are pickled to
+    `disk_dir` (if set) and loaded back on demand; the disk tier has its own budget.
+    Pinned entries (the system prompt prefix) are never evicted. Spilling pickles and
+    writes outside the lock, so discard() from the event loop never waits on disk I/O.
+    Spilled files are tracked in write order with their sizes, so trimming the disk tier
+    never lists or stats the directory.
+    """
+
+    def __init__(self, ram_bytes: int, disk_dir: Optional[str] = None, disk_bytes: int = 0):
+        self.ram_bytes = ram_bytes
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_bytes = disk_bytes
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._sizes = {}
+        self._pinned = set()
+        self._spilling = {}     # evicted, still being written to disk; get() serves them from here
+        self._used = 0
+        self._disk: "OrderedDict[Path, int]" = OrderedDict()    # spilled file -> size, oldest first
+        self._disk_used = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.hits_disk = 0
+        self.misses = 0
+        if self.disk_dir:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            # Files left by an earlier run count against the budget and are trimmed first.
+            for p in sorted(self.disk_dir.glob("*.kv"), key=lambda p: p.stat().st_mtime):
+                self._disk[p] = p.stat().st_size
+                self._disk_used += self._disk[p]
+
+    def put(self, key: str, state: Any, pin: bool = False) -> None:
+        size = state_nbytes(state)
+        with self._lock:
+            self._drop(key)
+            self._spilling.pop(key, None)
+            self._entries[key] = state
+            self._sizes[key] = size
+            self._used += size
+            if pin:
+                self._pinned.add(key)
+            victims = self._evict()
+        for victim in victims:
+            self._spill(*victim)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            state = self._entries.get(key)
+            if state is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return state
+            state = self._spilling.get(key)
+        if state is None:
+            state = self._load_spilled(key)
+        if state is not None:
+            self.hits_disk += 1
+            self.put(key, state)
+        else:
+            self.misses += 1
+        return state
+
+    def discard(self, key: str) -> None:
+        with self._lock:
+            self._drop(key)
+            self._spilling.pop(key, None)
+            self._pinned.discard(key)
+            path = self._spill_path(key)
+            on_disk = path is not None and self._forget_file(path)
+        if on_disk:
+            _unlink(path)
+
+    @property
+    def used_bytes(self) -> int:
+        return self._used
+
+    def _drop(self, key: str) -> None:
+        if key in self._entries:
+            del self._entries[key]
+            self._used -= self._sizes.pop(key, 0)
+
+    def _forget_file(self, path: Path) -> bool:
+        """Drop a spilled file from the disk index (lock held); True if it was there."""
+        size = self._disk.pop(path, None)
+        if size is None:
+            return False
+        self._disk_used -= size
+        return True
+
+    def _evict(self) -> List[Tuple[str, Any]]:
+        """Drop LRU entries over the RAM budget (lock held); returns the ones to spill."""
+        victims = []
+        for key in list(self._entries):
+            if self._used <= self.ram_bytes:
+                break
+            if key in self._pinned:
+                continue
+            state = self._entries[key]
+            self._drop(key)
+            if self.disk_dir:
+                self._spilling[key] = state
+                victims.append((key, state))
+        return victims
+
+    def _spill_path(self, key: str) -> Optional[Path]:
+        if not self.disk_dir:
+            return None
+        return self.disk_dir / (hashlib.sha1(key.encode("utf-8")).hexdigest() + ".kv")
+
+    def _spill(self, key: str, state: Any) -> None:
+        path = self._spill_path(key)
+        if path is None:
+            return
+        tmp = path.with_name(f"{path.stem}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = tmp.stat().st_size
+        except Exception as e:
+            log.warning("KV spill failed: %s", e)
+            with self._lock:
+                if self._spilling.get(key) is state:
+                    del self._spilling[key]
+            _unlink(tmp)
+            return
+        trim = []
+        with self._lock:
+            spilled = self._spilling.get(key) is state
+            if spilled:
+                # Renamed under the lock, so a discard() or newer spill of the key cannot interleave.
+                del self._spilling[key]
+                try:
+                    os.replace(tmp, path)
+                except OSError as e:
+                    log.warning("KV spill failed: %s", e)
+                    spilled = False
+                else:
+                    self._forget_file(path)
+                    self._disk[path] = size
+                    self._disk_used += size
+                    trim = self._trim_disk()
+        if not spilled:
+            # Discarded, put back or evicted again while it was being written: the copy is stale.
+            _unlink(tmp)
+        for p in trim:
+            _unlink(p)
+
+    def _load_spilled(self, key: str) -> Optional[Any]:
+        path = self._spill_path(key)
+        if path is None or not path.exists():
+            return None
+        try:
+            with open(path, "rb") as f:
+                state = pickle.load(f)
+        except Exception:
+            return None
+        with self._lock:
+            self._forget_file(path)
+        _unlink(path)
+        return state
+
+    def _trim_disk(self) -> List[Path]:
+        """Drop the oldest spilled files over the disk budget from the index (lock held); returns them."""
+        victims = []
+        while self._disk_used > self.disk_bytes and self._disk:
+            path, size = self._disk.popitem(last=False)
+            self._disk_used -= size
+            victims.append(path)
+        return victims
+
+
+def _unlink(path: Path) -> None:
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+_cache: Optional[KVStateCache] = None
+
+
+def get_kv_cache() -> KVStateCache:
+    global _cache
+    if _cache is None:
+        s = get_settings()
+        _cache = KVStateCache(
+            ram_bytes=s.kv_cache_ram_mb * 1024 * 1024,
+            disk_dir=s.kv_cache_disk_dir or None,
+            disk_bytes=s.kv_cache_disk_mb * 1024 * 1024,
+        )
+    return _cache
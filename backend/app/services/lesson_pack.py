@@ -0,0 +1,191 @@
+# backend/app/services/lesson_pack.py — read-only, memory-mapped packs of pre-generated concept openers
+#
+# scripts/build_lessons.py generates the opening explanation + question for a catalog
+# of concepts offline, synthesizes its TTS segments, and writes them into one file:
+#
+#   header   "TLPK" | version u16 | flags u16 | count u32 | index_off u64 | meta_off u64 | meta_len u32
+#   records  u32 json_len | {"concept", "text", "segments": [[text, audio_len], ...]} | audio bytes...
+#   index    count x (key_hash u64, offset u64, length u32), sorted by key_hash
+#   meta     JSON: voice, model, segment lengths, build time
+#
+# The handler maps the file once and looks concepts up by binary search over the index,
+# so a packed concept is streamed with no LLM or Piper work and no per-process copy.
+
+import hashlib
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.config import get_settings
+from app.log import get_logger
+from app.services.audio_cache import normalize_text, voice_identity
+from app.services.response_cache import normalize_key
+
+log = get_logger("lessons")
+
+MAGIC = b"TLPK"
+VERSION = 1
+_HEADER = struct.Struct("<4sHHIQQI")
+_LEN = struct.Struct("<I")
+_SLOT = np.dtype([("hash", "<u8"), ("offset", "<u8"), ("length", "<u4")])
+
+
+def key_hash(concept: str) -> int:
+    """64-bit key of a concept's normalized text (what the index is sorted by)."""
+    return int.from_bytes(hashlib.blake2b(normalize_key(concept).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def voice_key(model: str, params: Dict) -> str:
+    """Which voice a pack's audio was made with; audio from another voice is not served."""
+    blob = json.dumps({"voice": voice_identity(model), "params": params}, sort_keys=True)
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def encode_record(concept: str, text: str, segments: List[Tuple[str, bytes]], **extra) -> bytes:
+    head = json.dumps(
+        {"concept": concept, "text": text, "segments": [[t, len(a)] for t, a in segments], **extra},
+        ensure_ascii=False,
+    ).encode("utf-8")
+    return b"".join([_LEN.pack(len(head)), head, *(a for _, a in segments)])
+
+
+def decode_head(buf) -> dict:
+    (n,) = _LEN.unpack_from(buf, 0)
+    return json.loads(bytes(buf[_LEN.size:_LEN.size + n]))
+
+
+def write_pack(path: str, records: Iterable[Tuple[str, bytes]], meta: dict) -> int:
+    """Write (concept, encoded record) pairs to `path` atomically; returns the record count."""
+    out = Path(path)
+    tmp = out.with_name(out.name + ".tmp")
+    slots = {}
+    with open(tmp, "wb") as f:
+        f.write(b"\0" * _HEADER.size)
+        for concept, rec in records:
+            h = key_hash(concept)
+            if h in slots:
+                continue
+            slots[h] = (f.tell(), len(rec))
+            f.write(rec)
+        index = np.array([(h, off, n) for h, (off, n) in sorted(slots.items())], dtype=_SLOT)
+        index_off = f.tell()
+        f.write(index.tobytes())
+        meta_blob = json.dumps(meta).encode("utf-8")
+        meta_off = f.tell()
+        f.write(meta_blob)
+        f.seek(0)
+        f.write(_HEADER.pack(MAGIC, VERSION, 0, len(slots), index_off, meta_off, len(meta_blob)))
+    tmp.replace(out)
+    return len(slots)
+
+
+class Lesson(NamedTuple):
+    concept: str
+    text: str
+    segments: Dict[str, memoryview]   # normalized segment text -> WAV bytes (empty if the voice differs)
+
+    def synthesizer(self, fallback: Callable[[str], Awaitable[bytes]]) -> Callable[[str], Awaitable[bytes]]:
+        """TTSPipeline `synthesize` that serves packed segments and synthesizes anything else."""
+        async def synthesize(text: str) -> bytes:
+            audio = self.segments.get(normalize_text(text))
+            return bytes(audio) if audio is not None else await fallback(text)
+        return synthesize
+
+
+class LessonPack:
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, index_off, meta_off, meta_len = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} lesson pack")
+        self._index = np.frombuffer(self._mm, dtype=_SLOT, count=count, offset=index_off)
+        self.meta = json.loads(self._mm[meta_off:meta_off + meta_len])
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def lookup(self, concept: str, voice: Optional[str] = None) -> Optional[Lesson]:
+        """The packed opener for `concept`; its audio only if `voice` matches the pack's."""
+        h = key_hash(concept)
+        i = int(np.searchsorted(self._index["hash"], h))
+        if i >= len(self._index) or int(self._index["hash"][i]) != h:
+            self.misses += 1
+            return None
+        off, n = int(self._index["offset"][i]), int(self._index["length"][i])
+        view = memoryview(self._mm)[off:off + n]
+        head = decode_head(view)
+        if normalize_key(head["concept"]) != normalize_key(concept):   # 64-bit collision
+            self.misses += 1
+            return None
+        segments = {}
+        if voice is None or voice == self.meta.get("voice"):
+            pos = _LEN.size + _LEN.unpack_from(view, 0)[0]
+            for text, length in head["segments"]:
+                segments[normalize_text(text)] = view[pos:pos + length]
+                pos += length
+        self.hits += 1
+        return Lesson(head["concept"], head["text"], segments)
+
+    def concepts(self) -> List[str]:
+        return [decode_head(memoryview(self._mm)[int(off):])["concept"] for off in self._index["offset"]]
+
+    def close(self) -> None:
+        self._index = None
+        try:
+            self._mm.close()
+        except BufferError:
+            pass   # a Lesson still references the map; it is released with the process
+        self._file.close()
+
+
+_pack: Optional[LessonPack] = None
+_checked = False
+_voice: Optional[str] = None
+
+
+def get_lesson_pack() -> Optional[LessonPack]:
+    """The pack at TUTOR_LESSON_PACK, or None if there is none (or it cannot be read)."""
+    global _pack, _checked
+    if not _checked:
+        _checked = True
+        path = get_settings().lesson_pack
+        if path and Path(path).is_file():
+            try:
+                _pack = LessonPack(path)
+                log.info("Mapped %d packed concepts from %s", len(_pack), path)
+            except (OSError, ValueError, struct.error) as e:
+                log.warning("Ignoring %s: %s", path, e)
+    return _pack
+
+
+def find_lesson(concept: str) -> Optional[Lesson]:
+    """The packed opener for `concept`, with audio if the pack was built with the current voice."""
+    global _voice
+    pack = get_lesson_pack()
+    if pack is None:
+        return None
+    if _voice is None:
+        from app.services.tts_service import get_piper_pool
+        try:
+            pool = get_piper_pool()
+            _voice = voice_key(pool.model, pool.params)
+        except FileNotFoundError:
+            _voice = ""
+        if _voice != pack.meta.get("voice"):
+            log.warning("Pack audio was made with another voice; packed text only")
+    return pack.lookup(concept, _voice)
+
+
+metrics.gauge("tutor_lesson_pack_concepts", "Concepts in the mapped lesson pack").set_function(
+    lambda: len(_pack) if _pack is not None else 0
+)
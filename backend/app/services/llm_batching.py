@@ -0,0 +1,325 @@
+# backend/app/services/llm_batching.py — continuous batched decoding of many sessions in one llama.cpp context
+#
+# One thread owns a llama_context with n_seq_max = slots. Every step it builds a single
+# llama_batch holding one token per decoding sequence plus prompt chunks of newly admitted
+# ones, calls llama_decode once, and samples each sequence from its own logits row.
+# Sequences join and leave between steps, each with its own KV cells (seq_id = slot).
+# One extra sequence (seq_id = slots) holds the evaluated system-prompt prefix; new
+# sequences start from a copy of its matching cells and only prefill the rest of their prompt.
+
+import asyncio
+import codecs
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.services.grading import label_logprobs, label_token_ids
+from app.services.llm_service import _Job, common_prefix_len, get_llm, tokenize_prompt
+
+
+def _kv_fn(*names):
+    """llama.cpp renamed the KV cache API twice; pick whichever this build exports. Returns (name, fn)."""
+    import llama_cpp
+    for name in names:
+        fn = getattr(llama_cpp, name, None)
+        if fn is not None:
+            return name, fn
+    raise RuntimeError(f"llama_cpp has none of {names}")
+
+
+def _stop_prefix_len(text: str, stops: List[str]) -> int:
+    """Length of the longest suffix of `text` that is a proper prefix of a stop string."""
+    best = 0
+    for s in stops:
+        for k in range(min(len(s) - 1, len(text)), best, -1):
+            if s.startswith(text[-k:]):
+                best = k
+                break
+    return best
+
+
+class _Seq:
+    """Per-slot decoding state."""
+
+    def __init__(self, slot: int, job: _Job, prompt_tokens: List[int]):
+        self.slot = slot
+        self.job = job
+        self.pending = list(prompt_tokens)  # tokens still to feed (prompt, then last sampled)
+        self.n_past = 0
+        self.n_generated = 0
+        self.max_tokens = int(job.params.get("max_tokens", 128))
+        self.temperature = float(job.params.get("temperature", 0.7))
+        self.top_p = float(job.params.get("top_p", 0.95))
+        self.stop = list(job.params.get("stop") or [])
+        self.text = ""       # generated text not yet sent (held back while it could start a stop string)
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+        self.done = False
+
+
+class BatchEngine(threading.Thread):
+    """Drop-in for InferenceWorker: submit() returns a _Job whose queue receives this sequence's tokens."""
+
+    def __init__(self, slots: int, n_ctx: int, n_batch: int = 512, model_path: Optional[str] = None):
+        super().__init__(name="llm-batch", daemon=True)
+        self.slots = max(1, slots)
+        self.n_ctx = n_ctx
+        self.n_batch = n_batch
+        self.model_path = model_path
+        self._incoming: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._stopping = threading.Event()
+        self._active: Dict[int, _Seq] = {}
+        self._ctx = None
+        self._batch = None
+        self._sys_seq = self.slots
+        self._prefix_text: Optional[str] = None
+        self._prefix_tokens: List[int] = []
+
+    # -- public API (event loop side) ------------------------------------------------
+
+    def submit(self, text: str, params: Dict[str, Any], maxsize: int, **job_kw) -> _Job:
+        if self._stopping.is_set():
+            raise RuntimeError("LLM batch engine is shutting down")
+        job = _Job(text, params, asyncio.get_running_loop(), maxsize, **job_kw)
+        self._incoming.put(job)
+        return job
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs waiting for a free slot."""
+        return self._incoming.qsize()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._incoming.put(None)
+        if self.is_alive():
+            self.join(timeout)
+        if not self.is_alive():
+            # Never started, or jobs queued after the thread finished its own cleanup.
+            self._fail_all(RuntimeError("LLM batch engine stopped"))
+
+    # -- engine thread ---------------------------------------------------------------
+
+    def run(self) -> None:
+        import llama_cpp
+        try:
+            self._llm = get_llm(model_path=self.model_path)
+            self._open_context()
+        except Exception as e:
+            self._fail_all(e)
+            return
+        try:
+            while not self._stopping.is_set():
+                self._admit(block=not self._active)
+                if self._stopping.is_set():
+                    break
+                self._step()
+        except Exception as e:
+            self._fail_all(e)
+        finally:
+            # Stopped mid-stream: active and queued jobs' consumers see the shutdown instead of hanging.
+            self._fail_all(RuntimeError("LLM batch engine stopped"))
+            if self._batch is not None:
+                llama_cpp.llama_batch_free(self._batch)
+            if self._ctx is not None:
+                llama_cpp.llama_free(self._ctx)
+
+    def _open_context(self) -> None:
+        import llama_cpp
+        params = llama_cpp.llama_context_default_params()
+        params.n_ctx = self.n_ctx
+        params.n_batch = self.n_batch
+        params.n_seq_max = self.slots + 1
+        n_threads = self._llm.context_params.n_threads
+        params.n_threads = n_threads
+        params.n_threads_batch = self._llm.context_params.n_threads_batch or n_threads
+        new_ctx = getattr(llama_cpp, "llama_init_from_model", None) or llama_cpp.llama_new_context_with_model
+        self._ctx = new_ctx(self._llm.model, params)
+        if not self._ctx:
+            raise RuntimeError("Failed to create batched llama.cpp context")
+        self._batch = llama_cpp.llama_batch_init(self.n_batch, 0, self.slots + 1)
+        self._n_vocab = self._llm.n_vocab()
+        self._eos = self._llm.token_eos()
+        name, self._seq_rm = _kv_fn("llama_memory_seq_rm", "llama_kv_self_seq_rm", "llama_kv_cache_seq_rm")
+        _, self._seq_cp = _kv_fn("llama_memory_seq_cp", "llama_kv_self_seq_cp", "llama_kv_cache_seq_cp")
+        # The newest API takes the context's memory handle instead of the context itself.
+        self._kv = llama_cpp.llama_get_memory(self._ctx) if name == "llama_memory_seq_rm" else self._ctx
+        # Each sequence gets an equal share of the KV cells.
+        self._seq_ctx = self.n_ctx // self.slots
+
+    def _admit(self, block: bool) -> None:
+        while len(self._active) < self.slots:
+            try:
+                job = self._incoming.get(block=block, timeout=0.5 if block else None)
+            except queue.Empty:
+                return
+            if job is None:
+                return
+            block = False
+            if job.cancelled.is_set():
+                continue
+            job.started = time.perf_counter()
+            if job.kind == "warm":
+                self._ensure_prefix(job.prefix)
+                job.push("done")
+                continue
+            tokens = tokenize_prompt(self._llm, job.text)
+            if len(tokens) >= self._seq_ctx:
+                job.push("error", ValueError(f"Prompt is {len(tokens)} tokens; per-session context is {self._seq_ctx}"))
+                continue
+            slot = next(i for i in range(self.slots) if i not in self._active)
+            seq = _Seq(slot, job, tokens)
+            if job.prefix:
+                self._ensure_prefix(job.prefix)
+                # Share the system-prompt cells; keep at least one token to prefill for logits.
+                n = min(common_prefix_len(self._prefix_tokens, tokens), len(tokens) - 1)
+                if n > 0:
+                    self._seq_cp(self._kv, self._sys_seq, slot, 0, n)
+                    seq.n_past = n
+                    seq.pending = tokens[n:]
+            self._active[slot] = seq
+
+    def _ensure_prefix(self, prefix: Optional[str]) -> None:
+        """
+        Evaluate the system-prompt prefix into the reserved sequence. The first one stays
+        (the warm-up's SYSTEM_PROMPT): a job with another system prompt shares whatever
+        leading tokens match instead of evicting it, so alternating prompts never thrash.
+        """
+        import llama_cpp
+        if not prefix or self._prefix_text is not None:
+            return
+        self._seq_rm(self._kv, self._sys_seq, -1, -1)
+        tokens = tokenize_prompt(self._llm, prefix)
+        batch = self._batch
+        for start in range(0, len(tokens), self.n_batch):
+            chunk = tokens[start : start + self.n_batch]
+            for j, tok in enumerate(chunk):
+                batch.token[j] = tok
+                batch.pos[j] = start + j
+                batch.n_seq_id[j] = 1
+                batch.seq_id[j][0] = self._sys_seq
+                batch.logits[j] = 0
+            batch.n_tokens = len(chunk)
+            rc = llama_cpp.llama_decode(self._ctx, batch)
+            if rc != 0:
+                raise RuntimeError(f"llama_decode failed with code {rc} while evaluating the system prompt")
+        self._prefix_text = prefix
+        self._prefix_tokens = tokens
+
+    def _step(self) -> None:
+        import llama_cpp
+        batch = self._batch
+        n = 0
+        wants_logits: List[tuple] = []
+
+        for seq in list(self._active.values()):
+            if seq.job.cancelled.is_set():
+                self._finish(seq)
+                continue
+            # Consumer is behind: leave this sequence out of the step instead of blocking everyone.
+            if seq.job.backlogged:
+                continue
+            take = min(len(seq.pending), self.n_batch - n)
+            if take <= 0:
+                continue
+            for j in range(take):
+                batch.token[n] = seq.pending[j]
+                batch.pos[n] = seq.n_past + j
+                batch.n_seq_id[n] = 1
+                batch.seq_id[n][0] = seq.slot
+                batch.logits[n] = 0
+                n += 1
+            seq.pending = seq.pending[take:]
+            seq.n_past += take
+            if not seq.pending:
+                # Last prompt token (or last sampled token): we need its logits to sample the next one.
+                batch.logits[n - 1] = 1
+                wants_logits.append((seq, n - 1))
+            if n >= self.n_batch:
+                break
+
+        if n == 0:
+            # Everyone is waiting on slow consumers; yield briefly.
+            self._stopping.wait(0.005)
+            return
+
+        batch.n_tokens = n
+        rc = llama_cpp.llama_decode(self._ctx, batch)
+        if rc != 0:
+            raise RuntimeError(f"llama_decode failed with code {rc}")
+
+        for seq, idx in wants_logits:
+            ptr = llama_cpp.llama_get_logits_ith(self._ctx, idx)
+            logits = np.ctypeslib.as_array(ptr, shape=(self._n_vocab,))
+            if seq.job.kind == "classify":
+                # Grading: score the label tokens from the prompt's logits, then free the slot.
+                ids = label_token_ids(self._llm, seq.job.params["labels"])
+                seq.job.push("verdict", label_logprobs(logits, ids))
+                self._finish(seq)
+                continue
+            self._accept(seq, self._sample(logits, seq))
+
+    def _sample(self, logits: np.ndarray, seq: _Seq) -> int:
+        if seq.temperature <= 0:
+            return int(np.argmax(logits))
+        z = logits.astype(np.float64) / seq.temperature
+        z -= z.max()
+        p = np.exp(z)
+        p /= p.sum()
+        if seq.top_p < 1.0:
+            order = np.argsort(-p)
+            cum = np.cumsum(p[order])
+            keep = order[: int(np.searchsorted(cum, seq.top_p)) + 1]
+            q = p[keep] / p[keep].sum()
+            return int(np.random.choice(keep, p=q))
+        return int(np.random.choice(len(p), p=p))
+
+    def _accept(self, seq: _Seq, token: int) -> None:
+        seq.n_generated += 1
+        if token == self._eos:
+            self._finish(seq)
+            return
+        seq.text += seq.decoder.decode(self._llm.detokenize([token]))
+        for s in seq.stop:
+            cut = seq.text.find(s)
+            if cut >= 0:
+                seq.text = seq.text[:cut]
+                self._finish(seq)
+                return
+        # Hold back a tail that could still grow into a stop string.
+        hold = _stop_prefix_len(seq.text, seq.stop)
+        ready = seq.text[: len(seq.text) - hold]
+        seq.text = seq.text[len(seq.text) - hold :]
+        if ready and not seq.job.push("token", ready):
+            self._finish(seq, flush=False)
+            return
+        if seq.n_generated >= seq.max_tokens or seq.n_past + 1 >= self._seq_ctx:
+            self._finish(seq)
+            return
+        seq.pending = [token]
+
+    def _finish(self, seq: _Seq, flush: bool = True) -> None:
+        if seq.done:
+            return
+        seq.done = True
+        self._active.pop(seq.slot, None)
+        # Free this sequence's KV cells so the slot can be reused.
+        self._seq_rm(self._kv, seq.slot, -1, -1)
+        if flush and not seq.job.cancelled.is_set():
+            if seq.text:
+                seq.job.push("token", seq.text)
+            seq.job.push("done")
+
+    def _fail_all(self, e: Exception) -> None:
+        for seq in list(self._active.values()):
+            seq.job.push("error", e)
+        self._active.clear()
+        while True:
+            try:
+                job = self._incoming.get_nowait()
+            except queue.Empty:
+                return
+            if job is not None:
+                job.push("error", e)
@@ -0,0 +1,435 @@
+# backend/app/services/llm_pool.py — N llama.cpp replicas in worker processes, sessions pinned to one
+#
+# TUTOR_LLM_REPLICAS=N starts N spawn processes that each load the GGUF with mmap, so the
+# weights live once in the page cache and every replica maps the same pages; only the KV
+# cache and scratch buffers are per process. Each replica runs the normal
+# InferenceWorker job loop (prefix + per-session KV reuse) with its own slice of
+# TUTOR_KV_CACHE_RAM_MB and physical_cores() // N threads.
+#
+# A session sticks to the replica that holds its KV state unless that replica has more
+# than TUTOR_LLM_AFFINITY_SLACK jobs beyond the least-loaded one. A replica that exits or
+# goes silent for TUTOR_LLM_REPLICA_TIMEOUT_S during a job is killed and restarted with
+# backoff; its in-flight jobs fail and its sessions are re-routed.
+#
+# Tokens flow replica -> response queue -> listener thread -> _Job.queue, so
+# generate_stream() is unchanged. The listener acknowledges delivered tokens and a
+# replica stops decoding while too many are unacknowledged (same backpressure as the
+# in-process worker).
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List, Optional, Set
+
+from app import metrics
+from app.log import get_logger
+from app.services.hardware import physical_cores
+
+log = get_logger("llm.pool")
+
+_MAX_SESSIONS = 4096       # remembered session -> replica assignments
+_MAX_BACKOFF_S = 30.0
+
+
+# -- replica process -------------------------------------------------------------------
+
+class _Inbox:
+    """Replica side of the request queue: jobs wait here; cancels, acks and releases apply at once."""
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.jobs: "deque[tuple]" = deque()
+        self.cancelled: Set[int] = set()
+        self.acked: Dict[int, int] = {}
+        self.closed = False
+
+    def poll(self, timeout: Optional[float] = None) -> None:
+        """Apply every waiting message; with a timeout, wait that long for the first one."""
+        block = timeout is not None
+        while True:
+            try:
+                msg = self.requests.get(timeout=timeout) if block else self.requests.get_nowait()
+            except queue.Empty:
+                return
+            block = False
+            self._apply(msg)
+
+    def _apply(self, msg) -> None:
+        if msg is None:
+            self.closed = True
+        elif msg[0] == "job":
+            self.jobs.append(msg[1:])
+        elif msg[0] == "cancel":
+            self.cancelled.add(msg[1])
+        elif msg[0] == "ack":
+            self.acked[msg[1]] = msg[2]
+        elif msg[0] == "release":
+            from app.services.kv_cache import get_kv_cache
+            get_kv_cache().discard(f"session:{msg[1]}")
+
+    def next_job(self) -> Optional[tuple]:
+        while not self.jobs:
+            if self.closed:
+                return None
+            self._apply(self.requests.get())
+        return self.jobs.popleft()
+
+
+class _RemoteJob:
+    """Stands in for _Job inside a replica: push() sends to the parent instead of an asyncio queue."""
+
+    def __init__(self, job_id, kind, text, params, session_id, prefix, window, inbox, responses):
+        self.id = job_id
+        self.kind = kind
+        self.text = text
+        self.params = params
+        self.session_id = session_id
+        self.prefix = prefix
+        self.window = window
+        self.inbox = inbox
+        self.responses = responses
+        self.cancelled = threading.Event()
+        self.started: Optional[float] = None
+        self.sent = 0
+
+    def _check(self) -> bool:
+        if self.id in self.inbox.cancelled or self.inbox.closed:
+            self.cancelled.set()
+        return not self.cancelled.is_set()
+
+    def push(self, kind: str, value: Any = None) -> bool:
+        self.inbox.poll()
+        if not self._check():
+            return False
+        if kind == "token":
+            # Wait for the parent to deliver earlier tokens before decoding further.
+            while self.sent - self.inbox.acked.get(self.id, 0) >= self.window:
+                self.inbox.poll(timeout=0.05)
+                if not self._check():
+                    return False
+            self.sent += 1
+        elif kind == "error":
+            # Exceptions from llama.cpp are not always picklable.
+            value = RuntimeError(f"{type(value).__name__}: {value}")
+        self.responses.put((self.id, kind, value))
+        return True
+
+
+def _replica_main(index: int, requests, responses, model_path: str, n_threads: int, kv_ram_mb: int, kv_disk_dir: str) -> None:
+    # The replica's own KV cache budget; set before kv_cache reads the settings.
+    os.environ["TUTOR_KV_CACHE_RAM_MB"] = str(kv_ram_mb)
+    os.environ["TUTOR_KV_CACHE_DISK_DIR"] = kv_disk_dir
+    from app.services import llm_service
+    from app.services.speculative import get_drafter
+    llm_service._llm = llm_service.create_llm(model_path, draft_model=get_drafter(), n_threads=n_threads)
+    responses.put((None, "ready", None))
+
+    engine = llm_service.InferenceWorker(model_path)   # never started: only its job logic is used
+    inbox = _Inbox(requests)
+    while True:
+        item = inbox.next_job()
+        if item is None:
+            return
+        job_id, kind, text, params, session_id, prefix, window = item
+        if job_id not in inbox.cancelled:
+            responses.put((job_id, "started", None))
+            job = _RemoteJob(job_id, kind, text, params, session_id, prefix, window, inbox, responses)
+            engine._run_job(job)
+        responses.put((job_id, "end", None))
+        # Ids only grow, so anything at or below this one refers to a finished job.
+        inbox.cancelled = {i for i in inbox.cancelled if i > job_id}
+        inbox.acked = {i: n for i, n in inbox.acked.items() if i > job_id}
+
+
+# -- parent side -----------------------------------------------------------------------
+
+class _PoolJob:
+    """The parent's half of a job; the consumer sees a plain _Job (queue, cancel, started)."""
+
+    def __init__(self, job, job_id: int, replicas: List["_Replica"], maxsize: int):
+        self.job = job
+        self.id = job_id
+        self.replicas = replicas
+        self.remaining = len(replicas)   # warm jobs finish once every replica is done
+        self.delivered = 0
+        self.ack_every = max(1, maxsize // 4)
+        self.failed = False
+
+
+class _Replica:
+    def __init__(self, index: int):
+        self.index = index
+        self.proc = None
+        self.requests = None
+        self.responses = None
+        self.ready = threading.Event()
+        self.jobs: Dict[int, _PoolJob] = {}
+        self.running: Optional[int] = None
+        self.last_seen = time.monotonic()
+        self.restarts = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.proc is not None and self.proc.is_alive()
+
+    @property
+    def load(self) -> int:
+        return len(self.jobs)
+
+    def send(self, msg) -> None:
+        try:
+            self.requests.put(msg)
+        except (AttributeError, ValueError, OSError):
+            pass   # replica is being restarted; its jobs are failed by the supervisor
+
+
+class LLMReplicaPool:
+    """
+    Drop-in for InferenceWorker (submit / start / stop / is_alive / queue_depth) that
+    spreads sessions over `replicas` processes.
+    """
+
+    def __init__(
+        self,
+        replicas: int,
+        model_path: str,
+        n_threads: int = 0,
+        kv_ram_mb: int = 512,
+        kv_disk_dir: str = "",
+        timeout_s: float = 120.0,
+        affinity_slack: int = 2,
+    ):
+        self.model_path = model_path
+        self.n_threads = n_threads or max(1, physical_cores() // replicas)
+        self.kv_ram_mb = max(1, kv_ram_mb // replicas)
+        self.kv_disk_dir = kv_disk_dir
+        self.timeout_s = timeout_s
+        self.affinity_slack = affinity_slack
+        self._ctx = mp.get_context("spawn")
+        self._replicas = [_Replica(i) for i in range(replicas)]
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._started = False
+        self._stopping = threading.Event()
+
+    # -- engine interface ------------------------------------------------------------
+
+    def start(self) -> None:
+        from app.services import llm_service
+        self._started = True
+        log.info(
+            "Starting %d LLM replicas, %d threads and %d MB KV cache each",
+            len(self._replicas), self.n_threads, self.kv_ram_mb,
+        )
+        for r in self._replicas:
+            self._spawn(r)
+            threading.Thread(target=self._supervise, args=(r,), name=f"llm-replica-{r.index}", daemon=True).start()
+        # Exact token counts for prompt budgeting without loading the weights here.
+        try:
+            from llama_cpp import Llama
+            llm_service._vocab = Llama(model_path=self.model_path, vocab_only=True, verbose=False)
+        except Exception as e:
+            log.warning("Could not load the tokenizer in the server process (%s); token counts are estimates", e)
+
+    def is_alive(self) -> bool:
+        return self._started and not self._stopping.is_set()
+
+    @property
+    def queue_depth(self) -> int:
+        """Jobs routed to a replica that has not started them yet."""
+        return sum(max(0, r.load - (r.running is not None)) for r in self._replicas)
+
+    def submit(self, text: str, params: Dict[str, Any], maxsize: int, **job_kw):
+        from app.services.llm_service import _Job
+        if self._stopping.is_set():
+            raise RuntimeError("LLM inference worker is shutting down")
+        job = _Job(text, params, asyncio.get_running_loop(), maxsize, **job_kw)
+        with self._lock:
+            if job.kind == "warm":
+                targets = [r for r in self._replicas if r.healthy]
+            else:
+                home = self._route(job.session_id)
+                targets = [home] if home is not None else []
+            if not targets:
+                raise RuntimeError("No healthy LLM replica")
+            entry = _PoolJob(job, next(self._ids), targets, maxsize)
+            for r in targets:
+                r.jobs[entry.id] = entry
+                r.send(("job", entry.id, job.kind, text, params, job.session_id, job.prefix, 2 * maxsize))
+        # A cancelled consumer also stops the replica at its next token.
+        cancel = job.cancel
+
+        def cancel_remote() -> None:
+            cancel()
+            for r in entry.replicas:
+                if entry.id in r.jobs:
+                    r.send(("cancel", entry.id))
+
+        job.cancel = cancel_remote
+        return job
+
+    def release(self, session_id: str) -> None:
+        """Drop a closed session's KV state on its replica."""
+        with self._lock:
+            index = self._affinity.pop(session_id, None)
+        if index is not None:
+            self._replicas[index].send(("release", session_id))
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        for r in self._replicas:
+            r.send(None)
+        deadline = time.monotonic() + timeout
+        for r in self._replicas:
+            if r.proc is not None:
+                r.proc.join(max(0.0, deadline - time.monotonic()))
+                if r.proc.is_alive():
+                    r.proc.kill()
+            self._fail_jobs(r, RuntimeError("LLM inference worker stopped"))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [
+            {"replica": r.index, "healthy": r.healthy, "ready": r.ready.is_set(), "jobs": r.load, "restarts": r.restarts}
+            for r in self._replicas
+        ]
+
+    # -- routing -----------------------------------------------------------------------
+
+    def _route(self, session_id: Optional[str]) -> Optional[_Replica]:
+        healthy = [r for r in self._replicas if r.healthy]
+        if not healthy:
+            return None
+        least = min(healthy, key=lambda r: (r.load, r.index))
+        if session_id is None:
+            return least
+        index = self._affinity.get(session_id)
+        if index is not None:
+            home = self._replicas[index]
+            if home.healthy and home.load <= least.load + self.affinity_slack:
+                self._affinity.move_to_end(session_id)
+                return home
+            # Moving: the old replica's copy of the session state would only go stale.
+            home.send(("release", session_id))
+        self._affinity[session_id] = least.index
+        self._affinity.move_to_end(session_id)
+        while len(self._affinity) > _MAX_SESSIONS:
+            self._affinity.popitem(last=False)
+        return least
+
+    # -- supervision -------------------------------------------------------------------
+
+    def _spawn(self, r: _Replica) -> None:
+        disk_dir = os.path.join(self.kv_disk_dir, f"replica{r.index}") if self.kv_disk_dir else ""
+        r.ready.clear()
+        r.running = None
+        r.requests = self._ctx.Queue()
+        r.responses = self._ctx.Queue()
+        r.proc = self._ctx.Process(
+            target=_replica_main,
+            args=(r.index, r.requests, r.responses, self.model_path, self.n_threads, self.kv_ram_mb, disk_dir),
+            name=f"llm-replica-{r.index}",
+            daemon=True,
+        )
+        r.proc.start()
+        r.last_seen = time.monotonic()
+
+    def _supervise(self, r: _Replica) -> None:
+        """Listener for one replica; restarts it when it exits or hangs mid-job."""
+        backoff = 1.0
+        while not self._stopping.is_set():
+            self._listen(r)
+            if self._stopping.is_set():
+                return
+            log.warning("LLM replica %d exited with code %s; restarting in %.0f s", r.index, r.proc.exitcode, backoff)
+            with self._lock:
+                for sid in [s for s, i in self._affinity.items() if i == r.index]:
+                    del self._affinity[sid]
+            self._fail_jobs(r, RuntimeError(f"LLM replica {r.index} crashed"))
+            # Only back off further if the replica died before serving anything.
+            backoff = min(backoff * 2, _MAX_BACKOFF_S) if not r.ready.is_set() else 1.0
+            if self._stopping.wait(backoff):
+                return
+            with self._lock:
+                r.restarts += 1
+                self._spawn(r)
+
+    def _listen(self, r: _Replica) -> None:
+        proc, responses = r.proc, r.responses
+        while True:
+            try:
+                job_id, kind, value = responses.get(timeout=1.0)
+            except queue.Empty:
+                if not proc.is_alive():
+                    return
+                if r.running is not None and time.monotonic() - r.last_seen > self.timeout_s:
+                    log.error("LLM replica %d silent for %.0f s during a job; killing it", r.index, self.timeout_s)
+                    proc.kill()
+                    proc.join()
+                    return
+                continue
+            if kind == "ready":
+                r.ready.set()
+                log.info("LLM replica %d ready (pid %s)", r.index, proc.pid)
+                continue
+            entry = r.jobs.get(job_id)
+            if kind == "started":
+                r.running = job_id
+                if entry is not None and entry.job.started is None:
+                    entry.job.started = time.perf_counter()
+            elif kind == "end":
+                r.running = None
+                with self._lock:
+                    r.jobs.pop(job_id, None)
+            elif entry is None or entry.failed:
+                continue
+            elif kind == "token":
+                if entry.job.push("token", value):
+                    entry.delivered += 1
+                    if entry.delivered % entry.ack_every == 0:
+                        r.send(("ack", job_id, entry.delivered))
+            elif kind == "verdict":
+                entry.job.push("verdict", value)
+            elif kind == "error":
+                entry.failed = True
+                entry.job.push("error", value)
+            elif kind == "done":
+                entry.remaining -= 1
+                if entry.remaining == 0:
+                    entry.job.push("done")
+            # Measured after delivery: push() may have waited on a slow consumer.
+            r.last_seen = time.monotonic()
+
+    def _fail_jobs(self, r: _Replica, exc: Exception) -> None:
+        with self._lock:
+            entries = list(r.jobs.values())
+            r.jobs.clear()
+            r.running = None
+        for entry in entries:
+            if not entry.failed:
+                entry.failed = True
+                entry.job.push("error", exc)
+
+
+def _pool() -> Optional[LLMReplicaPool]:
+    from app.services import llm_service
+    return llm_service._worker if isinstance(llm_service._worker, LLMReplicaPool) else None
+
+
+def _replica_stat(key: str):
+    def read():
+        pool = _pool()
+        if pool is None:
+            return {}
+        return {(str(s["replica"]),): int(s[key]) for s in pool.stats()}
+    return read
+
+
+metrics.gauge("tutor_llm_replica_healthy", "1 while the replica process is up", ["replica"]).set_function(_replica_stat("healthy"))
+metrics.gauge("tutor_llm_replica_jobs", "Jobs routed to the replica and not finished", ["replica"]).set_function(_replica_stat("jobs"))
+metrics.counter("tutor_llm_replica_restarts_total", "Replica processes restarted after a crash or hang", ["replica"]).set_function(_replica_stat("restarts"))
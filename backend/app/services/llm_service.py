@@ -1,9 +1,25 @@
 import os
 import asyncio
+import concurrent.futures
+import queue
+import threading
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional, Tuple, AsyncGenerator
+from typing import Any, Dict, List, Optional, Sequence, Tuple, AsyncGenerator
+
+from app import tracing
+from app.config import get_settings
+from app.log import get_logger
+from app.services import speculative
+from app.services.kv_cache import get_kv_cache
+
+log = get_logger("llm")
 
 _llm = None
+_vocab = None    # tokenizer-only Llama in the server process when replicas hold the weights
+_worker = None
+_fallback_worker = None   # TUTOR_LLM_FALLBACK_MODEL_PATH, served under load (admission.py)
 
 def _default_model_path() -> str:
     base = Path(__file__).resolve().parent.parent.parent.parent
@@ -12,7 +28,32 @@ def _default_model_path() -> str:
         return str(candidates[0])
     return ""
 
-def get_llm(model_path: Optional[str] = None, n_ctx: int = 512):
+def create_llm(path: str, draft_model=None, n_threads: Optional[int] = None, n_ctx: Optional[int] = None):
+    """
+    A Llama for `path` sized by the settings (calibrated per node by scripts/calibrate.py).
+    `n_threads` pins decode and prompt eval to that many threads (one replica's share);
+    with a draft model (see speculative.py) every position keeps logits.
+    """
+    from llama_cpp import Llama
+    from app.services.hardware import physical_cores
+    s = get_settings()
+    threads = n_threads or s.llama_n_threads or physical_cores()
+    return Llama(
+        model_path=path,
+        n_ctx=n_ctx or s.llama_n_ctx,
+        n_threads=threads,
+        n_threads_batch=n_threads or s.llama_n_threads_batch or threads,
+        n_gpu_layers=s.llama_n_gpu_layers,
+        n_batch=s.llm_n_batch,
+        use_mmap=s.llama_use_mmap,    # page weights in from the GGUF instead of copying
+        use_mlock=s.llama_use_mlock,  # pin them so a cold node never swaps mid-turn
+        # Speculative decoding samples at every drafted position.
+        logits_all=draft_model is not None,
+        draft_model=draft_model,
+        verbose=False,
+    )
+
+def get_llm(model_path: Optional[str] = None, n_ctx: Optional[int] = None):
     global _llm
     path = model_path or os.environ.get("TUTOR_LLAMA_MODEL_PATH") or _default_model_path()
     
@@ -20,22 +61,15 @@ def get_llm(model_path: Optional[str] = None, n_ctx: int = 512):
         raise FileNotFoundError(f"GGUF model not found at {path}")
 
     if _llm is None:
-        from llama_cpp import Llama
-        _llm = Llama(
-            model_path=path,
-            n_ctx=2048,
-            n_threads=6,       # i3 Dual Core Optimization
-            n_gpu_layers=33,    # CPU only
-            n_batch=512,         # Low RAM optimization
-            verbose=False,
-        )
+        from app.services.speculative import get_drafter
+        _llm = create_llm(path, draft_model=get_drafter(), n_ctx=n_ctx)
     return _llm
 
 def build_messages(system: str, history: List[Tuple[str, str]]) -> List[dict]:
-    """Organizes conversation roles."""
+    """Organizes conversation roles ("context" is per-session text ahead of the first user turn)."""
     out = [{"role": "system", "content": system}]
     for r, c in history:
-        out.append({"role": "user" if r == "user" else "assistant", "content": c})
+        out.append({"role": r if r in ("user", "context") else "assistant", "content": c})
     return out
 
 def format_for_llama(messages: List[dict]) -> str:
@@ -47,13 +81,367 @@ def format_for_llama(messages: List[dict]) -> str:
     prompt += f"<s>[INST] <<SYS>>\n{system_content}\n<</SYS>>\n\n"
     
     for m in messages[1:]:
-        if m["role"] == "user":
+        if m["role"] == "context":
+            # After <</SYS>>, so the system-prompt prefix (and its pinned KV state) stays fixed.
+            prompt += f"{m['content']}\n\n"
+        elif m["role"] == "user":
             prompt += f"{m['content']} [/INST] "
         else:
             prompt += f"{m['content']} </s><s>[INST] "
     
     return prompt
 
+def system_prefix(system: str) -> str:
+    """The part of every prompt that only depends on the system prompt (shared KV prefix)."""
+    return format_for_llama([{"role": "system", "content": system}])
+
+def tokenize_prompt(llm, text: str) -> List[int]:
+    """Tokenize the way Llama.create_completion does, so prefixes compare equal."""
+    try:
+        return llm.tokenize(text.encode("utf-8"), special=True)
+    except TypeError:
+        return llm.tokenize(text.encode("utf-8"))
+
+def count_tokens(text: str) -> int:
+    """Token count of one message; exact once the model is loaded, ~4 chars/token before."""
+    return _count_tokens(text, _llm is not None or _vocab is not None)
+
+@lru_cache(maxsize=16384)
+def _count_tokens(text: str, exact: bool) -> int:
+    if exact:
+        try:
+            return len((_llm or _vocab).tokenize(text.encode("utf-8"), add_bos=False))
+        except Exception:
+            pass
+    return len(text) // 4 + 1
+
+def common_prefix_len(a, b) -> int:
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+class _Job:
+    """One generation request: the inference thread pushes into `queue`, the coroutine pulls."""
+
+    def __init__(
+        self,
+        text: str,
+        params: Dict[str, Any],
+        loop: asyncio.AbstractEventLoop,
+        maxsize: int,
+        kind: str = "generate",
+        session_id: Optional[str] = None,
+        prefix: Optional[str] = None,
+    ):
+        self.text = text
+        self.params = params
+        self.kind = kind
+        self.session_id = session_id
+        self.prefix = prefix
+        self.loop = loop
+        self.maxsize = maxsize
+        self.queue: "asyncio.Queue[Tuple[str, Any]]" = asyncio.Queue(maxsize=maxsize)
+        self.cancelled = threading.Event()
+        # Items pushed but not yet taken by get(); asyncio.Queue.qsize() is not safe off the loop.
+        self._unread = 0
+        self._unread_lock = threading.Lock()
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None   # set by the engine thread when it picks the job up
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+
+    @property
+    def backlogged(self) -> bool:
+        """True while the consumer has `maxsize` items still to read (safe from any thread)."""
+        with self._unread_lock:
+            return 0 < self.maxsize <= self._unread
+
+    async def get(self) -> Tuple[str, Any]:
+        """Next (kind, value) pushed by the inference thread; the consumer side of push()."""
+        item = await self.queue.get()
+        with self._unread_lock:
+            self._unread -= 1
+        return item
+
+    def push(self, kind: str, value: Any = None) -> bool:
+        """
+        Called from the inference thread. Blocks while the queue is full (backpressure
+        from a slow consumer); returns False once the consumer has gone away.
+        """
+        if self.cancelled.is_set() or self.loop.is_closed():
+            return False
+        with self._unread_lock:
+            self._unread += 1
+        fut = asyncio.run_coroutine_threadsafe(self.queue.put((kind, value)), self.loop)
+        while True:
+            try:
+                fut.result(timeout=0.1)
+                return True
+            except concurrent.futures.TimeoutError:
+                if self.cancelled.is_set() or self.loop.is_closed():
+                    fut.cancel()
+                    return False
+
+
+class InferenceWorker(threading.Thread):
+    """
+    Dedicated thread that owns the Llama object. Each blocking decode step runs here,
+    so the event loop only ever awaits tokens.
+    """
+
+    def __init__(self, model_path: Optional[str] = None, private: bool = False):
+        super().__init__(name="llm-fallback" if private else "llm-inference", daemon=True)
+        self.model_path = model_path
+        # private: this worker owns a Llama for model_path instead of the shared one, and
+        # namespaces its KV states so they are never restored into the other model.
+        self.private = private
+        self.kv_ns = f"{Path(model_path).name}:" if private else ""
+        self._llm = None
+        self._jobs: "queue.Queue[Optional[_Job]]" = queue.Queue()
+        self._stopping = threading.Event()
+
+    def submit(self, text: str, params: Dict[str, Any], maxsize: int, **job_kw) -> _Job:
+        if self._stopping.is_set():
+            raise RuntimeError("LLM inference worker is shutting down")
+        job = _Job(text, params, asyncio.get_running_loop(), maxsize, **job_kw)
+        self._jobs.put(job)
+        return job
+
+    @property
+    def queue_depth(self) -> int:
+        return self._jobs.qsize()
+
+    def run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if job.cancelled.is_set():
+                continue
+            self._run_job(job)
+
+    def _run_job(self, job: _Job) -> None:
+        job.started = time.perf_counter()
+        try:
+            llm = self._model()
+            if job.kind == "warm":
+                self._prefix_state(llm, job.prefix)
+                job.push("done")
+                return
+            if job.kind == "classify":
+                from app.services.grading import classify_logits
+                if job.prefix:
+                    self._restore_best_state(llm, job)
+                job.push("verdict", classify_logits(llm, job.text, job.params["labels"]))
+                job.push("done")
+                return
+            if job.prefix:
+                self._restore_best_state(llm, job)
+            response_iterator = llm(job.text, stream=True, echo=False, **job.params)
+            try:
+                for chunk in response_iterator:
+                    token = chunk["choices"][0].get("text", "")
+                    if token and not job.push("token", token):
+                        break
+                    if self._stopping.is_set():
+                        break
+            finally:
+                # Stops the llama-cpp generator at this token boundary.
+                response_iterator.close()
+        except Exception as e:
+            job.push("error", e)
+            return
+        job.push("done")
+        if job.session_id:
+            # Prompt + reply are now in the KV cache; keep them so the next turn of
+            # this session only prefills its new text.
+            try:
+                get_kv_cache().put(f"{self.kv_ns}session:{job.session_id}", llm.save_state())
+            except Exception as e:
+                log.warning("Could not save session state: %s", e)
+
+    def _model(self):
+        if not self.private:
+            return get_llm(model_path=self.model_path)
+        if self._llm is None:
+            self._llm = create_llm(self.model_path)
+        return self._llm
+
+    def _prefix_state(self, llm, prefix: str):
+        """Evaluate the system-prompt prefix once and keep its state pinned."""
+        cache = get_kv_cache()
+        key = f"{self.kv_ns}prefix:{prefix}"
+        state = cache.get(key)
+        if state is None:
+            llm.reset()
+            llm.eval(tokenize_prompt(llm, prefix))
+            state = llm.save_state()
+            cache.put(key, state, pin=True)
+        return state
+
+    def _restore_best_state(self, llm, job: _Job) -> None:
+        """
+        Load whichever saved state shares the longest token prefix with this prompt;
+        Llama.generate then only evaluates the remaining suffix.
+        """
+        tokens = tokenize_prompt(llm, job.text)[:-1]
+        best, best_len = None, common_prefix_len(llm.input_ids[: llm.n_tokens].tolist(), tokens)
+        candidates = [self._prefix_state(llm, job.prefix)]
+        if job.session_id:
+            candidates.insert(0, get_kv_cache().get(f"{self.kv_ns}session:{job.session_id}"))
+        for state in candidates:
+            if state is None:
+                continue
+            n = common_prefix_len(state.input_ids[: state.n_tokens].tolist(), tokens)
+            if n > best_len:
+                best, best_len = state, n
+        if best is not None:
+            llm.load_state(best)
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        # Drop queued jobs so their consumers see the shutdown instead of hanging.
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job.push("error", RuntimeError("LLM inference worker stopped"))
+                job.cancel()
+        self._jobs.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+
+def get_inference_worker(model_path: Optional[str] = None):
+    """
+    The engine generate_stream submits to: an InferenceWorker (one sequence at a time),
+    with TUTOR_LLM_REPLICAS > 1 an LLMReplicaPool of that many processes, or with
+    TUTOR_LLM_BATCH_SLOTS > 1 a BatchEngine decoding that many sessions per step.
+    """
+    global _worker
+    if model_path and model_path == get_settings().llm_fallback_model_path:
+        return _get_fallback_worker(model_path)
+    if _worker is None or not _worker.is_alive():
+        s = get_settings()
+        from app.services.stub_engines import stubs_enabled
+        if stubs_enabled("llm"):
+            from app.services.stub_engines import StubLLMEngine
+            _worker = StubLLMEngine(model_path)
+        elif s.llm_replicas > 1:
+            from app.services.llm_pool import LLMReplicaPool
+            path = model_path or os.environ.get("TUTOR_LLAMA_MODEL_PATH") or _default_model_path()
+            if not path or not Path(path).exists():
+                raise FileNotFoundError(f"GGUF model not found at {path}")
+            if s.llm_batch_slots > 1:
+                log.warning("TUTOR_LLM_BATCH_SLOTS is ignored with TUTOR_LLM_REPLICAS > 1")
+            _worker = LLMReplicaPool(
+                s.llm_replicas,
+                path,
+                n_threads=s.llm_replica_threads,
+                kv_ram_mb=s.kv_cache_ram_mb,
+                kv_disk_dir=s.kv_cache_disk_dir,
+                timeout_s=s.llm_replica_timeout_s,
+                affinity_slack=s.llm_affinity_slack,
+            )
+        elif s.llm_batch_slots > 1:
+            from app.services.llm_batching import BatchEngine
+            _worker = BatchEngine(
+                slots=s.llm_batch_slots,
+                n_ctx=s.llama_n_ctx * s.llm_batch_slots,
+                n_batch=s.llm_n_batch,
+                model_path=model_path,
+            )
+        else:
+            _worker = InferenceWorker(model_path)
+        _worker.start()
+    return _worker
+
+
+def _get_fallback_worker(model_path: str):
+    """A separate engine (own thread and Llama) for the smaller fallback GGUF."""
+    global _fallback_worker
+    if _fallback_worker is None or not _fallback_worker.is_alive():
+        from app.services.stub_engines import stubs_enabled
+        if stubs_enabled("llm"):
+            from app.services.stub_engines import StubLLMEngine
+            _fallback_worker = StubLLMEngine(model_path)
+        else:
+            if not Path(model_path).exists():
+                raise FileNotFoundError(f"Fallback GGUF model not found at {model_path}")
+            _fallback_worker = InferenceWorker(model_path, private=True)
+        _fallback_worker.start()
+    return _fallback_worker
+
+
+def shutdown_llm(timeout: float = 5.0) -> None:
+    """Stop the inference engine threads (called from the FastAPI lifespan)."""
+    global _worker, _fallback_worker
+    for engine in (_worker, _fallback_worker):
+        if engine is not None:
+            engine.stop(timeout)
+    _worker = _fallback_worker = None
+
+
+def release_session(session_id: Optional[str]) -> None:
+    """Forget a session's saved KV state (called when its WebSocket closes)."""
+    if session_id:
+        get_kv_cache().discard(f"session:{session_id}")
+        ns = getattr(_fallback_worker, "kv_ns", None)
+        if ns:
+            get_kv_cache().discard(f"{ns}session:{session_id}")
+        if hasattr(_worker, "release"):
+            _worker.release(session_id)
+
+
+async def warm_prefix(system: str, model_path: Optional[str] = None) -> None:
+    """Evaluate and cache the system-prompt prefix ahead of the first request."""
+    job = get_inference_worker(model_path).submit(
+        "", {}, maxsize=1, kind="warm", prefix=system_prefix(system)
+    )
+    kind, value = await job.get()
+    if kind == "error":
+        raise value
+
+
+async def classify(
+    prompt: str,
+    system: str,
+    history: Sequence[Tuple[str, str]],
+    labels,
+    model_path: Optional[str] = None,
+    session_id: Optional[str] = None,
+) -> Dict[str, float]:
+    """
+    Log-probability of each label as the first token of the reply (see grading.py):
+    one forward pass over the prompt, nothing sampled or streamed.
+    """
+    messages = build_messages(system, list(history) + [("user", prompt)])
+    # No trailing space after [/INST], so the label is the reply's first whole token.
+    text = format_for_llama(messages).rstrip()
+    job = get_inference_worker(model_path).submit(
+        text, {"labels": labels}, maxsize=2, kind="classify", session_id=session_id, prefix=system_prefix(system)
+    )
+    scores: Dict[str, float] = {}
+    try:
+        while True:
+            kind, value = await job.get()
+            if kind == "verdict":
+                scores = value
+            elif kind == "error":
+                tracing.ERRORS.inc(stage="llm")
+                raise value
+            else:
+                return scores
+    finally:
+        job.cancel()
+
+
 async def generate_stream(
     prompt: str,
     system: str,
@@ -61,6 +449,7 @@ async def generate_stream(
     max_tokens: int = 128,
     temperature: float = 0.7,
     model_path: Optional[str] = None,
+    session_id: Optional[str] = None,
 ) -> AsyncGenerator[str, None]:
     
     hist = list(history)
@@ -68,20 +457,53 @@ async def generate_stream(
     messages = build_messages(system, full_history)
     text = format_for_llama(messages)
 
-    llm = get_llm(model_path=model_path)
-    
-    # Create the generator
-    response_iterator = llm(
+    # Decoding runs on the inference thread; tokens arrive through a bounded queue,
+    # so a slow consumer pauses generation instead of buffering without limit.
+    job = get_inference_worker(model_path).submit(
         text,
-        max_tokens=max_tokens,
-        temperature=temperature,
-        stop=["[/INST]", "</s>"],
-        echo=False,
-        stream=True
+        dict(max_tokens=max_tokens, temperature=temperature, stop=["[/INST]", "</s>"]),
+        maxsize=get_settings().llm_token_queue_size,
+        session_id=session_id,
+        prefix=system_prefix(system),
     )
+    first: Optional[float] = None
+    n = 0
+    drafter = None
+    drafts = (0, 0)
+    try:
+        while True:
+            kind, value = await job.get()
+            if kind == "token":
+                if first is None:
+                    first = time.perf_counter()
+                    _record_prefill(job, first)
+                    # One sequence at a time: counter deltas from here on belong to this reply.
+                    drafter = speculative.current_drafter()
+                    if drafter is not None:
+                        drafts = drafter.counts()
+                n += 1
+                yield value
+            elif kind == "error":
+                tracing.ERRORS.inc(stage="llm")
+                raise value
+            else:
+                break
+    finally:
+        # Consumer finished, failed or was cancelled: stop decoding at the next token.
+        job.cancel()
+        if first is not None and n > 1:
+            decode_s = time.perf_counter() - first
+            attrs = {"tokens": n}
+            if drafter is not None:
+                d, a = drafter.counts()
+                attrs.update(drafted=d - drafts[0], accepted=a - drafts[1])
+            tracing.record("decode", decode_s, first, **attrs)
+            tracing.DECODE_TPS.observe((n - 1) / decode_s if decode_s > 0 else 0.0, mode=speculative.current_mode())
+
 
-    for chunk in response_iterator:
-        token = chunk["choices"][0].get("text", "")
-        if token:
-            yield token
-            await asyncio.sleep(0) # Let the server send the packet
\ No newline at end of file
+def _record_prefill(job: _Job, first_token: float) -> None:
+    """Split time-to-first-token into waiting for the engine and evaluating the prompt."""
+    tracing.record("ttft", first_token - job.submitted, job.submitted)
+    if job.started is not None:
+        tracing.record("llm_queue", job.started - job.submitted, job.submitted)
+        tracing.record("prompt_eval", first_token - job.started, job.started)
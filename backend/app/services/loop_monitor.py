@@ -0,0 +1,70 @@
+# backend/app/services/loop_monitor.py — event-loop lag sampler
+#
+# Sleeps for a fixed interval and records how late it wakes up. Any blocking call on the
+# loop (a sync DB query, a big json.dumps, a CPU-bound helper) shows up here directly.
+
+import asyncio
+import math
+import time
+from collections import deque
+from typing import Deque, Dict, Optional
+
+
+def percentile(values, p: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted sequence (None when empty)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1))
+    return ordered[k]
+
+
+class LoopLagMonitor:
+    def __init__(self, interval_s: float = 0.05, window: int = 2400):
+        self.interval_s = interval_s
+        self._samples: Deque[float] = deque(maxlen=window)   # lag in ms
+        self._max_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def reset(self) -> None:
+        self._samples.clear()
+        self._max_ms = 0.0
+
+    async def _run(self) -> None:
+        while True:
+            t0 = time.perf_counter()
+            await asyncio.sleep(self.interval_s)
+            lag_ms = max(0.0, (time.perf_counter() - t0 - self.interval_s) * 1000)
+            self._samples.append(lag_ms)
+            if lag_ms > self._max_ms:
+                self._max_ms = lag_ms
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        samples = list(self._samples)
+        r = lambda v: None if v is None else round(v, 3)
+        return {
+            "samples": len(samples),
+            "p50_ms": r(percentile(samples, 50)),
+            "p95_ms": r(percentile(samples, 95)),
+            "p99_ms": r(percentile(samples, 99)),
+            "max_ms": r(self._max_ms),
+        }
+
+
+_monitor: Optional[LoopLagMonitor] = None
+
+
+def get_loop_monitor() -> LoopLagMonitor:
+    global _monitor
+    if _monitor is None:
+        _monitor = LoopLagMonitor()
+    return _monitor
@@ -1,86 +1,91 @@
 # backend/app/services/memory_service.py — SQLite conversation + topic storage
 
-import aiosqlite
-from pathlib import Path
 from typing import List, Optional, Tuple
-import os
 
+from app.services.db import Database, get_database
 
-def _db_path() -> str:
-    p = os.environ.get("TUTOR_DB_PATH")
-    if p:
-        return p
-    base = Path(__file__).resolve().parent.parent.parent.parent
-    data = base / "data"
-    data.mkdir(parents=True, exist_ok=True)
-    return str(data / "tutor.db")
+# Constant SQL so each pooled connection's statement cache reuses the prepared statement.
+_INSERT_MESSAGE = "INSERT INTO conversations (session_id, role, content) VALUES (?, ?, ?)"
+# Ordered by id, not created_at: idx_conversations_session is (session_id, rowid), so both
+# reads walk the index backwards and stop after LIMIT rows instead of sorting the session.
+_RECENT_MESSAGES = """SELECT role, content FROM conversations
+                   WHERE session_id = ? ORDER BY id DESC LIMIT ?"""
+_HISTORY = """SELECT id, role, content FROM conversations
+             WHERE session_id = ? AND id < ? ORDER BY id DESC LIMIT ?"""
+_NO_BOUND = 1 << 62
+_LINK_STUDENT = "INSERT OR IGNORE INTO student_sessions (session_id, student_id) VALUES (?, ?)"
+_STUDENT_SESSIONS = "SELECT session_id FROM student_sessions WHERE student_id = ?"
+_UPSERT_TOPIC = """INSERT INTO topics (name, strength, concept_summary, last_touched_at, updated_at)
+                   VALUES (?, ?, ?, datetime('now'), datetime('now'))
+                   ON CONFLICT(name) DO UPDATE SET
+                     strength = excluded.strength,
+                     concept_summary = excluded.concept_summary,
+                     last_touched_at = datetime('now'),
+                     updated_at = datetime('now')"""
+_GET_TOPIC = "SELECT strength, concept_summary FROM topics WHERE name = ?"
+_INSERT_TURN = """INSERT INTO teaching_turns (session_id, turn_type, concept, user_answer, is_correct)
+                   VALUES (?, ?, ?, ?, ?)"""
 
 
 class MemoryService:
-    """Store conversation history and weak/strong topics. Single-user MVP."""
+    """
+    Store conversation history and weak/strong topics. Single-user MVP.
+    Cheap to construct per WebSocket: all instances share the process-wide pool for db_path.
+    """
 
     def __init__(self, db_path: Optional[str] = None):
-        self.db_path = db_path or _db_path()
-        self._init_done = False
+        self.db: Database = get_database(db_path)
+        self.db_path = self.db.path
 
     async def _ensure_schema(self) -> None:
-        if self._init_done:
-            return
-        schema = (Path(__file__).resolve().parent.parent.parent / "schemas" / "schema.sql").read_text()
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.executescript(schema)
-            await db.commit()
-        self._init_done = True
+        await self.db.open()
 
     async def append_message(self, session_id: str, role: str, content: str) -> None:
-        await self._ensure_schema()
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                "INSERT INTO conversations (session_id, role, content) VALUES (?, ?, ?)",
-                (session_id, role, content),
-            )
-            await db.commit()
+        # Write-behind: committed with other sessions' writes in the next group commit.
+        await self.db.open()
+        self.db.write_behind(_INSERT_MESSAGE, (session_id, role, content))
+
+    async def link_student(self, session_id: str, student_id: str) -> None:
+        """Mark the session as the student's, so later sessions of that student can recall it."""
+        await self.db.open()
+        self.db.write_behind(_LINK_STUDENT, (session_id, student_id))
+
+    async def student_sessions(self, student_id: str) -> List[str]:
+        """Ids of the sessions linked to the student."""
+        rows = await self.db.fetchall(_STUDENT_SESSIONS, (student_id,), after_writes=True)
+        return [r["session_id"] for r in rows]
 
     async def get_recent_messages(
         self, session_id: str, limit: int = 20
     ) -> List[Tuple[str, str]]:
         """Returns list of (role, content)."""
-        await self._ensure_schema()
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                """SELECT role, content FROM conversations
-                   WHERE session_id = ? ORDER BY created_at DESC LIMIT ?""",
-                (session_id, limit),
-            ) as cur:
-                rows = await cur.fetchall()
+        rows = await self.db.fetchall(_RECENT_MESSAGES, (session_id, limit), after_writes=True)
         out = [(r["role"], r["content"]) for r in reversed(rows)]
         return out
 
+    async def get_history(
+        self, session_id: str, limit: int = 200, before_id: Optional[int] = None, include_archived: bool = False
+    ) -> List[Tuple[int, str, str]]:
+        """
+        Returns up to `limit` most recent (id, role, content) with id < before_id, oldest first.
+        Pass the first id of a page as `before_id` to get the page before it (keyset pagination).
+        With include_archived, pages continue into the session's archived segments.
+        """
+        before = before_id if before_id is not None else _NO_BOUND
+        rows = await self.db.fetchall(_HISTORY, (session_id, before, limit), after_writes=True)
+        out = [(r["id"], r["role"], r["content"]) for r in reversed(rows)]
+        if include_archived and len(out) < limit:
+            from app.services.archive import get_archive
+            older = await get_archive(self.db).read(session_id, limit - len(out), out[0][0] if out else before)
+            out = older + out
+        return out
+
     async def upsert_topic(self, name: str, strength: str, concept_summary: Optional[str] = None) -> None:
-        await self._ensure_schema()
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """INSERT INTO topics (name, strength, concept_summary, last_touched_at, updated_at)
-                   VALUES (?, ?, ?, datetime('now'), datetime('now'))
-                   ON CONFLICT(name) DO UPDATE SET
-                     strength = excluded.strength,
-                     concept_summary = excluded.concept_summary,
-                     last_touched_at = datetime('now'),
-                     updated_at = datetime('now')""",
-                (name, strength, concept_summary or ""),
-            )
-            await db.commit()
+        await self.db.execute(_UPSERT_TOPIC, (name, strength, concept_summary or ""))
 
     async def get_topic(self, name: str) -> Optional[Tuple[str, str]]:
         """Returns (strength, concept_summary) or None."""
-        await self._ensure_schema()
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
-            async with db.execute(
-                "SELECT strength, concept_summary FROM topics WHERE name = ?", (name,)
-            ) as cur:
-                row = await cur.fetchone()
+        row = await self.db.fetchone(_GET_TOPIC, (name,), after_writes=True)
         if row is None:
             return None
         return (row["strength"], row["concept_summary"] or "")
@@ -93,11 +98,8 @@ class MemoryService:
         user_answer: Optional[str] = None,
         is_correct: Optional[bool] = None,
     ) -> None:
-        await self._ensure_schema()
-        async with aiosqlite.connect(self.db_path) as db:
-            await db.execute(
-                """INSERT INTO teaching_turns (session_id, turn_type, concept, user_answer, is_correct)
-                   VALUES (?, ?, ?, ?, ?)""",
-                (session_id, turn_type, concept or "", user_answer or "", 1 if is_correct else 0 if is_correct is not None else None),
-            )
-            await db.commit()
+        await self.db.open()
+        self.db.write_behind(
+            _INSERT_TURN,
+            (session_id, turn_type, concept or "", user_answer or "", 1 if is_correct else 0 if is_correct is not None else None),
+        )
@@ -0,0 +1,104 @@
+# backend/app/services/piper_worker.py — long-lived Piper process: voice loaded once, text in, PCM out
+#
+# Spawned by PiperPool (tts_service.py) as: python piper_worker.py --model <voice.onnx>
+# Protocol:
+#   stdin  — one JSON object per line: {"text": "..."} or {"ping": true}
+#   stdout — frames of 1-byte kind + 4-byte big-endian length + payload:
+#            R = ready (JSON {"sample_rate": N}), A = 16-bit mono PCM, P = pong, E = error (utf-8),
+#            X = aborted
+#   SIGUSR1 — abort the request being synthesized (at Piper's next chunk); it is answered with X.
+#            Every request gets exactly one frame, so the parent stays in sync without a restart.
+# Nothing else may be written to stdout, so print() is redirected to stderr.
+
+import argparse
+import json
+import signal
+import struct
+import sys
+
+_busy = False
+
+
+class _Aborted(BaseException):
+    """Raised by the SIGUSR1 handler while a request is being synthesized."""
+
+
+def _on_abort(signum, frame) -> None:
+    # Between requests there is nothing to abort; the parent still reads this request's frame.
+    if _busy:
+        raise _Aborted()
+
+
+def _load_voice(model: str, use_cuda: bool):
+    from piper import PiperVoice
+    return PiperVoice.load(model, use_cuda=use_cuda)
+
+
+def _synthesize(voice, text: str, opts: dict) -> bytes:
+    # piper-tts >= 1.3 yields AudioChunk objects; 1.2 has synthesize_stream_raw yielding bytes.
+    if hasattr(voice, "synthesize_stream_raw"):
+        return b"".join(voice.synthesize_stream_raw(text, **opts))
+    syn_config = None
+    if opts:
+        from piper import SynthesisConfig
+        syn_config = SynthesisConfig(**opts)
+    return b"".join(chunk.audio_int16_bytes for chunk in voice.synthesize(text, syn_config=syn_config))
+
+
+def main() -> int:
+    global _busy
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", required=True)
+    ap.add_argument("--speaker", type=int, default=None)
+    ap.add_argument("--length-scale", type=float, default=None)
+    ap.add_argument("--cuda", action="store_true")
+    args = ap.parse_args()
+
+    out = sys.stdout.buffer
+    sys.stdout = sys.stderr
+
+    def frame(kind: bytes, payload: bytes = b"") -> None:
+        out.write(kind + struct.pack(">I", len(payload)) + payload)
+        out.flush()
+
+    try:
+        voice = _load_voice(args.model, args.cuda)
+    except Exception as e:
+        frame(b"E", f"Piper voice load failed: {e}".encode("utf-8"))
+        return 1
+
+    opts = {}
+    if args.speaker is not None:
+        opts["speaker_id"] = args.speaker
+    if args.length_scale is not None:
+        opts["length_scale"] = args.length_scale
+
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, _on_abort)
+    frame(b"R", json.dumps({"sample_rate": voice.config.sample_rate}).encode("utf-8"))
+
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            req = json.loads(line)
+            if req.get("ping"):
+                frame(b"P")
+                continue
+            _busy = True
+            try:
+                audio = _synthesize(voice, req.get("text") or "", opts)
+            finally:
+                _busy = False
+            frame(b"A", audio)
+        except _Aborted:
+            _busy = False
+            frame(b"X")
+        except Exception as e:
+            frame(b"E", str(e).encode("utf-8"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,181 @@
+# backend/app/services/response_cache.py — reuse generated replies for concept openers and repeated questions
+#
+# Most sessions start with the same few concepts (EXAMPLE_CONCEPTS on /concepts), and
+# each one used to cost a full generation. Replies are cached per (kind, normalized key):
+# an exact lookup first, then the nearest cached key by embedding similarity (the
+# semantic index's model) above TUTOR_RESPONSE_CACHE_MIN_SCORE.
+#
+# Each key collects up to TUTOR_RESPONSE_CACHE_VARIANTS replies before it starts serving
+# them (picked at random), so students do not all hear the same words. Variants expire
+# after their TTL; keys are evicted least recently used beyond TUTOR_RESPONSE_CACHE_ENTRIES.
+# A cached reply is replayed through the normal token + TTS path (replay()), and its
+# sentences hit the TTS audio cache, so the audio is not synthesized again either.
+
+import asyncio
+import random
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import AsyncIterator, List, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("cache.response")
+
+_WORD = re.compile(r"\S+\s*|\s+")
+_PUNCT = re.compile(r"[^\w\s]")
+
+
+def normalize_key(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a prompt."""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return " ".join(_PUNCT.sub(" ", text).split())
+
+
+class CacheLookup:
+    """Result of ResponseCache.lookup; pass it back to store() after generating on a miss."""
+
+    def __init__(self, kind: str, key: str, text: Optional[str] = None, tier: Optional[str] = None, vec=None):
+        self.kind = kind
+        self.key = key
+        self.text = text
+        self.tier = tier     # "exact" | "semantic" on a hit
+        self.vec = vec
+
+
+class _Entry:
+    def __init__(self, vec: Optional[np.ndarray]):
+        self.vec = vec
+        self.variants: List[Tuple[str, float]] = []   # (reply, expires_at)
+
+    def live(self, now: float) -> List[str]:
+        self.variants = [(t, exp) for t, exp in self.variants if exp > now]
+        return [t for t, _ in self.variants]
+
+
+class ResponseCache:
+    def __init__(self, max_entries: int = 512, variants: int = 3, min_score: float = 0.92, embed=None):
+        self.max_entries = max_entries
+        self.variants = max(1, variants)
+        self.min_score = min_score
+        self._embed = embed
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def lookup(self, kind: str, prompt: str) -> CacheLookup:
+        key = normalize_key(prompt)
+        now = time.monotonic()
+        entry = self._entries.get((kind, key))
+        if entry is not None:
+            result = self._serve(kind, key, entry, now, "exact")
+            if result is not None:
+                return result
+            return self._miss(kind, key, entry.vec)
+        vec = await self._vector(key)
+        if vec is not None and self.min_score < 1.0:
+            match = self._nearest(kind, vec)
+            if match is not None:
+                result = self._serve(kind, match, self._entries[(kind, match)], now, "semantic")
+                if result is not None:
+                    return result
+                # Close enough to count as the same prompt: collect the new variant there.
+                return self._miss(kind, match, vec)
+        return self._miss(kind, key, vec)
+
+    def store(self, lookup: CacheLookup, reply: str, ttl_s: float) -> None:
+        if not reply.strip() or ttl_s <= 0:
+            return
+        entry = self._entries.get((lookup.kind, lookup.key))
+        if entry is None:
+            entry = _Entry(lookup.vec)
+            self._entries[(lookup.kind, lookup.key)] = entry
+        live = entry.live(time.monotonic())
+        if len(live) >= self.variants:
+            return
+        # Repeats count too: with greedy sampling every variant is the same reply.
+        entry.variants.append((reply, time.monotonic() + ttl_s))
+        self._entries.move_to_end((lookup.kind, lookup.key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _serve(self, kind: str, key: str, entry: _Entry, now: float, tier: str) -> Optional[CacheLookup]:
+        live = entry.live(now)
+        if not live:
+            del self._entries[(kind, key)]
+            return None
+        if len(live) < self.variants:
+            return None      # still collecting variety: generate another one
+        self._entries.move_to_end((kind, key))
+        if tier == "exact":
+            self.hits_exact += 1
+        else:
+            self.hits_semantic += 1
+        return CacheLookup(kind, key, random.choice(live), tier, entry.vec)
+
+    def _miss(self, kind: str, key: str, vec) -> CacheLookup:
+        self.misses += 1
+        return CacheLookup(kind, key, vec=vec)
+
+    async def _vector(self, key: str) -> Optional[np.ndarray]:
+        if self._embed is None:
+            return None
+        try:
+            vecs = await self._embed([key])
+        except Exception as e:
+            log.warning("Embedding failed, exact matches only: %s", e)
+            return None
+        return None if vecs is None else vecs[0]
+
+    def _nearest(self, kind: str, vec: np.ndarray) -> Optional[str]:
+        keys = [k for (kd, k), e in self._entries.items() if kd == kind and e.vec is not None]
+        if not keys:
+            return None
+        mat = np.stack([self._entries[(kind, k)].vec for k in keys])
+        scores = mat @ vec      # embeddings are normalized: dot product = cosine
+        i = int(np.argmax(scores))
+        return keys[i] if scores[i] >= self.min_score else None
+
+
+async def replay(text: str) -> AsyncIterator[str]:
+    """A cached reply as word-sized tokens, for the same send/TTS path as generate_stream."""
+    for i, m in enumerate(_WORD.finditer(text)):
+        if i % 16 == 15:
+            await asyncio.sleep(0)   # let other sessions' frames out between bursts
+        yield m.group(0)
+
+
+_cache: Optional[ResponseCache] = None
+_disabled = False
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """Process-wide cache, or None when disabled (TUTOR_RESPONSE_CACHE=0)."""
+    global _cache, _disabled
+    if _cache is None and not _disabled:
+        s = get_settings()
+        if not s.response_cache:
+            _disabled = True
+            return None
+        from app.services.semantic_index import embed_texts
+        _cache = ResponseCache(
+            max_entries=s.response_cache_entries,
+            variants=s.response_cache_variants,
+            min_score=s.response_cache_min_score,
+            embed=embed_texts if s.semantic_index else None,
+        )
+    return _cache
+
+
+metrics.gauge("tutor_response_cache_entries", "Prompts with cached replies").set_function(
+    lambda: len(_cache) if _cache is not None else 0
+)
@@ -0,0 +1,446 @@
+# backend/app/services/semantic_index.py — FAISS semantic memory over conversations and topics
+#
+# A background task tails the `conversations` table past a watermark, embeds new rows in
+# batches (sentence-transformers) and appends them to an in-memory delta index. Once the
+# delta is large enough it is merged into the base index on disk, which is loaded with
+# mmap so process RSS does not grow with history. Topics are few and mutable, so they
+# live in their own small flat index and are re-embedded when `updated_at` changes.
+#
+# FAISS ids encode the source row: conversations.id * 2 (+1 for topics.id), so a hit maps
+# straight back to its SQLite row.
+
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.config import get_settings
+from app.log import get_logger
+from app.services.db import Database, get_database
+
+log = get_logger("memory.semantic")
+
+_KIND_CONVERSATION = 0
+_KIND_TOPIC = 1
+
+_NEW_MESSAGES = """SELECT id, content FROM conversations
+                  WHERE id > ? AND role != 'system' ORDER BY id LIMIT ?"""
+_CHANGED_TOPICS = """SELECT id, name, concept_summary, updated_at FROM topics
+                     WHERE updated_at >= ? ORDER BY updated_at"""
+
+
+@dataclass
+class RelatedHit:
+    kind: str              # "conversation" | "topic"
+    row_id: int
+    score: float           # cosine similarity
+    text: str
+    session_id: Optional[str] = None
+    role: Optional[str] = None
+
+
+def _encode_id(kind: int, row_id: int) -> int:
+    return row_id * 2 + kind
+
+
+def _decode_id(fid: int) -> Tuple[int, int]:
+    return fid % 2, fid // 2
+
+
+class SemanticIndex:
+    """
+    Base index (on disk, mmap, HNSW by default) + delta index (RAM, exact) + topic index.
+    All FAISS objects are guarded by one lock; search holds it only for the FAISS calls.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        directory: str,
+        model_name: str,
+        factory: str = "IDMap2,HNSW32",
+        batch_size: int = 64,
+        poll_s: float = 2.0,
+        compact_rows: int = 20000,
+        ef_search: int = 64,
+    ):
+        self.db = db
+        self.dir = Path(directory)
+        self.model_name = model_name
+        self.factory = factory
+        self.batch_size = batch_size
+        self.poll_s = poll_s
+        self.compact_rows = compact_rows
+        self.ef_search = ef_search
+        self._faiss = None
+        self._model = None
+        self.dim = 0
+        self._base = None
+        self._delta = None
+        self._topics = None
+        self._conv_watermark = 0
+        self._topic_watermark = ""
+        self._topic_versions: Dict[str, str] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.dir.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _base_path(self) -> Path:
+        return self.dir / "base.faiss"
+
+    @property
+    def _delta_path(self) -> Path:
+        return self.dir / "delta.faiss"
+
+    @property
+    def _topics_path(self) -> Path:
+        return self.dir / "topics.faiss"
+
+    @property
+    def _meta_path(self) -> Path:
+        return self.dir / "meta.json"
+
+    # -- lifecycle --------------------------------------------------------------------
+
+    def load(self) -> None:
+        """Import FAISS, load the embedding model and any persisted index (blocking; run in a thread)."""
+        import faiss
+        from sentence_transformers import SentenceTransformer
+
+        self._faiss = faiss
+        self._model = SentenceTransformer(self.model_name, device="cpu")
+        self.dim = self._model.get_sentence_embedding_dimension()
+        meta = {}
+        if self._meta_path.exists():
+            meta = json.loads(self._meta_path.read_text())
+        if meta.get("model") != self.model_name or meta.get("dim") != self.dim or meta.get("factory") != self.factory:
+            # Different embedding space: start over from the first row.
+            for p in (self._base_path, self._delta_path, self._topics_path):
+                p.unlink(missing_ok=True)
+            meta = {}
+        self._conv_watermark = int(meta.get("conv_watermark", 0))
+        self._topic_watermark = meta.get("topic_watermark", "")
+        self._topic_versions = meta.get("topic_versions", {})
+        self._base = self._read_mmap(self._base_path) if self._base_path.exists() else None
+        self._delta = self._read(self._delta_path) if self._delta_path.exists() else self._flat()
+        self._topics = self._read(self._topics_path) if self._topics_path.exists() else self._flat()
+        log.info(
+            "Semantic index ready: %d vectors (base %d, delta %d)",
+            self.size, self._base.ntotal if self._base is not None else 0, self._delta.ntotal,
+        )
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._model is not None and self._dirty:
+            await asyncio.to_thread(self.save)
+
+    @property
+    def size(self) -> int:
+        n = 0
+        for idx in (self._base, self._delta, self._topics):
+            if idx is not None:
+                n += idx.ntotal
+        return n
+
+    # -- indexing ---------------------------------------------------------------------
+
+    async def _run(self) -> None:
+        if self._model is None:
+            await asyncio.to_thread(self.load)
+        await self.db.open()
+        while True:
+            try:
+                added = await self.index_pending()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Embedding pass failed: %s", e)
+                added = 0
+            if added == 0:
+                # Caught up: persist what was added so a restart does not re-embed it.
+                if self._dirty:
+                    await asyncio.to_thread(self.save)
+                await asyncio.sleep(self.poll_s)
+
+    async def index_pending(self) -> int:
+        """Embed one batch of new conversation rows plus any changed topics; returns rows added."""
+        rows = await self.db.fetchall(_NEW_MESSAGES, (self._conv_watermark, self.batch_size))
+        topics = await self.db.fetchall(_CHANGED_TOPICS, (self._topic_watermark,))
+        # updated_at has 1 s resolution, so the boundary second is re-read; skip versions already embedded.
+        topics = [t for t in topics if self._topic_versions.get(str(t["id"])) != t["updated_at"]]
+        if not rows and not topics:
+            return 0
+        if rows:
+            ids = [_encode_id(_KIND_CONVERSATION, r["id"]) for r in rows]
+            vecs = await asyncio.to_thread(self._embed, [r["content"] for r in rows])
+            with self._lock:
+                self._delta.add_with_ids(vecs, np.asarray(ids, dtype=np.int64))
+            self._conv_watermark = rows[-1]["id"]
+        if topics:
+            ids = np.asarray([_encode_id(_KIND_TOPIC, t["id"]) for t in topics], dtype=np.int64)
+            texts = [f"{t['name']}: {t['concept_summary'] or ''}" for t in topics]
+            vecs = await asyncio.to_thread(self._embed, texts)
+            with self._lock:
+                self._topics.remove_ids(ids)
+                self._topics.add_with_ids(vecs, ids)
+            self._topic_watermark = topics[-1]["updated_at"]
+            self._topic_versions.update((str(t["id"]), t["updated_at"]) for t in topics)
+        self._dirty = True
+        if self._delta.ntotal >= self.compact_rows:
+            await asyncio.to_thread(self.compact)
+        return len(rows) + len(topics)
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        vecs = self._model.encode(
+            texts,
+            batch_size=self.batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return np.ascontiguousarray(vecs, dtype=np.float32)
+
+    def compact(self) -> None:
+        """Merge the delta into the base index, rewrite it atomically and re-open it with mmap."""
+        faiss = self._faiss
+        with self._lock:
+            n = self._delta.ntotal
+            if n == 0:
+                return
+            vecs = self._delta.index.reconstruct_n(0, n)
+            ids = faiss.vector_to_array(self._delta.id_map)[:n].copy()
+        # Build off-lock from a writable copy; searches keep using the mmapped base meanwhile.
+        base = self._read(self._base_path) if self._base_path.exists() else self._new_base()
+        base.add_with_ids(vecs, ids)
+        tmp = self._base_path.with_suffix(".tmp")
+        faiss.write_index(base, str(tmp))
+        os.replace(tmp, self._base_path)
+        del base
+        with self._lock:
+            self._base = self._read_mmap(self._base_path)
+            self._delta = self._flat()
+        self.save()
+        log.info("Compacted %d vectors into base index (%d total)", n, self._base.ntotal)
+
+    def save(self) -> None:
+        """Persist delta + topic indexes, then the watermarks that describe them."""
+        faiss = self._faiss
+        with self._lock:
+            for idx, path in ((self._delta, self._delta_path), (self._topics, self._topics_path)):
+                tmp = path.with_suffix(".tmp")
+                faiss.write_index(idx, str(tmp))
+                os.replace(tmp, path)
+            meta = {
+                "model": self.model_name,
+                "dim": self.dim,
+                "factory": self.factory,
+                "conv_watermark": self._conv_watermark,
+                "topic_watermark": self._topic_watermark,
+                "topic_versions": self._topic_versions,
+            }
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta))
+        os.replace(tmp, self._meta_path)
+        self._dirty = False
+
+    # -- search -----------------------------------------------------------------------
+
+    async def search_related(
+        self,
+        session_id: Optional[str],
+        text: str,
+        k: int = 5,
+        min_score: float = 0.0,
+        student_id: Optional[str] = None,
+    ) -> List[RelatedHit]:
+        """
+        The k most similar past messages and topics. Messages only come from other sessions
+        linked to `student_id` (none without one); messages from `session_id` itself are
+        skipped (they are already in the prompt history or its summary).
+        """
+        if self._model is None or not text.strip() or self.size == 0:
+            return []
+        scored = await asyncio.to_thread(self._search, text, k * 4)
+        scored = [(fid, s) for fid, s in scored if s >= min_score]
+        return (await self._resolve(scored, session_id, student_id))[:k]
+
+    async def embed(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Normalized embeddings from the index's model; None until the model has loaded."""
+        if self._model is None:
+            return None
+        return await asyncio.to_thread(self._embed, texts)
+
+    def _search(self, text: str, k: int) -> List[Tuple[int, float]]:
+        q = self._embed([text])
+        best: Dict[int, float] = {}
+        with self._lock:
+            for idx in (self._base, self._delta, self._topics):
+                if idx is None or idx.ntotal == 0:
+                    continue
+                scores, ids = idx.search(q, min(k, idx.ntotal))
+                for fid, s in zip(ids[0], scores[0]):
+                    if fid >= 0 and s > best.get(int(fid), -1.0):
+                        best[int(fid)] = float(s)
+        return sorted(best.items(), key=lambda kv: -kv[1])
+
+    async def _resolve(
+        self, scored: List[Tuple[int, float]], session_id: Optional[str], student_id: Optional[str] = None
+    ) -> List[RelatedHit]:
+        conv = []
+        if student_id is not None:
+            conv = [_decode_id(fid)[1] for fid, _ in scored if _decode_id(fid)[0] == _KIND_CONVERSATION]
+        topic = [_decode_id(fid)[1] for fid, _ in scored if _decode_id(fid)[0] == _KIND_TOPIC]
+        conv_rows, topic_rows = {}, {}
+        if conv:
+            marks = ",".join("?" * len(conv))
+            for r in await self.db.fetchall(
+                f"SELECT id, session_id, role, content FROM conversations WHERE id IN ({marks})", conv
+            ):
+                conv_rows[r["id"]] = r
+            missing = [i for i in conv if i not in conv_rows]
+            if missing:
+                # Moved out of `conversations` by the compactor; same fields from the archive.
+                from app.services.archive import get_archive
+                for i, (sid, role, content) in (await get_archive(self.db).fetch(missing)).items():
+                    conv_rows[i] = {"session_id": sid, "role": role, "content": content}
+        owned = set()
+        sessions = list({r["session_id"] for r in conv_rows.values()} - {session_id})
+        if sessions:
+            marks = ",".join("?" * len(sessions))
+            for r in await self.db.fetchall(
+                f"SELECT session_id FROM student_sessions WHERE student_id = ? AND session_id IN ({marks})",
+                [student_id] + sessions,
+            ):
+                owned.add(r["session_id"])
+        if topic:
+            marks = ",".join("?" * len(topic))
+            for r in await self.db.fetchall(
+                f"SELECT id, name, concept_summary FROM topics WHERE id IN ({marks})", topic
+            ):
+                topic_rows[r["id"]] = r
+        hits = []
+        for fid, score in scored:
+            kind, row_id = _decode_id(fid)
+            if kind == _KIND_CONVERSATION:
+                r = conv_rows.get(row_id)
+                if r is None or r["session_id"] not in owned:
+                    continue
+                hits.append(RelatedHit("conversation", row_id, score, r["content"], r["session_id"], r["role"]))
+            else:
+                r = topic_rows.get(row_id)
+                if r is None:
+                    continue
+                text = f"{r['name']}: {r['concept_summary']}" if r["concept_summary"] else r["name"]
+                hits.append(RelatedHit("topic", row_id, score, text))
+        return hits
+
+    # -- FAISS helpers ----------------------------------------------------------------
+
+    def _flat(self):
+        return self._faiss.IndexIDMap2(self._faiss.IndexFlatIP(self.dim))
+
+    def _new_base(self):
+        idx = self._faiss.index_factory(self.dim, self.factory, self._faiss.METRIC_INNER_PRODUCT)
+        self._tune(idx)
+        return idx
+
+    def _tune(self, idx) -> None:
+        try:
+            self._faiss.ParameterSpace().set_index_parameter(idx, "efSearch", self.ef_search)
+        except Exception:
+            pass  # not an HNSW index
+
+    def _read(self, path: Path):
+        idx = self._faiss.read_index(str(path))
+        self._tune(idx)
+        return idx
+
+    def _read_mmap(self, path: Path):
+        faiss = self._faiss
+        flags = getattr(faiss, "IO_FLAG_MMAP", 0) | getattr(faiss, "IO_FLAG_READ_ONLY", 0)
+        try:
+            idx = faiss.read_index(str(path), flags)
+        except RuntimeError:
+            # Index types without mmap support in this FAISS build are read into RAM.
+            idx = faiss.read_index(str(path))
+        self._tune(idx)
+        return idx
+
+
+_index: Optional[SemanticIndex] = None
+_disabled = False
+
+
+def get_semantic_index() -> Optional[SemanticIndex]:
+    """Process-wide index, or None when disabled (TUTOR_SEMANTIC_INDEX=0) or faiss/sentence-transformers are missing."""
+    global _index, _disabled
+    if _index is None and not _disabled:
+        s = get_settings()
+        if not s.semantic_index:
+            _disabled = True
+            return None
+        try:
+            import faiss  # noqa: F401
+            import sentence_transformers  # noqa: F401
+        except ImportError as e:
+            log.warning("Semantic index disabled: %s", e)
+            _disabled = True
+            return None
+        _index = SemanticIndex(
+            get_database(),
+            s.semantic_index_dir,
+            s.embed_model,
+            factory=s.semantic_index_factory,
+            batch_size=s.embed_batch_size,
+            poll_s=s.embed_poll_s,
+            compact_rows=s.semantic_compact_rows,
+        )
+    return _index
+
+
+def start_semantic_indexer() -> None:
+    idx = get_semantic_index()
+    if idx is not None:
+        idx.start()
+
+
+async def shutdown_semantic_index() -> None:
+    global _index
+    if _index is not None:
+        await _index.stop()
+        _index = None
+
+
+async def search_related(
+    session_id: Optional[str], text: str, k: int = 5, min_score: float = 0.0, student_id: Optional[str] = None
+) -> List[RelatedHit]:
+    """Semantic lookup for the prompt builder; empty when the index is disabled or still loading."""
+    idx = get_semantic_index()
+    if idx is None:
+        return []
+    return await idx.search_related(session_id, text, k, min_score, student_id)
+
+
+async def embed_texts(texts: List[str]) -> Optional[np.ndarray]:
+    """Embeddings in the semantic index's space; None when the index is disabled or still loading."""
+    idx = get_semantic_index()
+    if idx is None:
+        return None
+    return await idx.embed(texts)
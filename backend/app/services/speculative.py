@@ -0,0 +1,244 @@
+# backend/app/services/speculative.py — draft tokens for speculative decoding in llama.cpp
+#
+# llama-cpp-python's Llama(draft_model=...) calls the draft model with the token ids so
+# far before each decode step, evaluates the returned guesses in the same batch as the
+# next token, and keeps the prefix the target model agrees with. Greedy output is
+# unchanged; every accepted guess saves one sequential decode step.
+#
+# Two drafters (TUTOR_LLM_SPECULATIVE):
+#   prompt_lookup  continue the most recent earlier occurrence of the last n-gram. Tutor
+#                  replies repeat the concept name and phrases from the question, so this
+#                  is nearly free and often right.
+#   draft          greedy continuation from a small GGUF sharing the target's vocabulary
+#                  (TUTOR_LLM_DRAFT_MODEL_PATH), e.g. a 1B model for a 7B/8B target.
+# Both are wrapped in AdaptiveDrafter, which measures how many guesses are accepted and
+# stops drafting for a while when that rate drops below TUTOR_LLM_SPEC_MIN_ACCEPT.
+
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+import numpy as np
+
+from app import metrics
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("llm.spec")
+
+MODES = ("off", "prompt_lookup", "draft")
+_EMPTY = np.array([], dtype=np.intc)
+# Tokens of context compared to tell "same sequence, one step later" from a new prompt.
+_TAIL = 8
+
+
+class PromptLookupDrafter:
+    """N-gram lookup over the prompt and reply so far; longest n-gram and latest match first."""
+
+    def __init__(self, ngram_size: int = 3, num_pred_tokens: int = 10):
+        self.ngram_size = max(1, ngram_size)
+        self.num_pred_tokens = num_pred_tokens
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        n = input_ids.shape[0]
+        for size in range(min(self.ngram_size, n - 1), 0, -1):
+            windows = np.lib.stride_tricks.sliding_window_view(input_ids[: n - 1], size)
+            hits = np.nonzero(np.all(windows == input_ids[n - size :], axis=1))[0]
+            # The latest earlier occurrence is the likeliest to continue the same way.
+            for start in hits[::-1] + size:
+                if start < n:
+                    return input_ids[start : min(start + self.num_pred_tokens, n)].copy()
+        return _EMPTY
+
+
+class DraftModelDrafter:
+    """Greedy guesses from a small GGUF; its own KV cache is reused across steps by prefix."""
+
+    def __init__(self, model_path: str, num_pred_tokens: int = 4, n_ctx: int = 2048, n_threads: Optional[int] = None):
+        from llama_cpp import Llama
+        self.num_pred_tokens = num_pred_tokens
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, verbose=False)
+        self._eos = self.llm.token_eos()
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        if input_ids.shape[0] + self.num_pred_tokens >= self.llm.n_ctx():
+            return _EMPTY
+        out = []
+        # generate() keeps the longest common prefix of its KV cache, so each step only
+        # evaluates the tokens accepted since the previous one.
+        gen = self.llm.generate(input_ids.tolist(), temp=0.0, top_k=1, reset=True)
+        try:
+            for tok in gen:
+                if tok == self._eos:
+                    break
+                out.append(tok)
+                if len(out) >= self.num_pred_tokens:
+                    break
+        finally:
+            gen.close()
+        return np.array(out, dtype=np.intc)
+
+
+class AdaptiveDrafter:
+    """
+    The object handed to Llama(draft_model=...). Scores each proposal on the next call
+    (the accepted guesses are then part of input_ids) and returns no guesses for
+    `cooldown` steps whenever the acceptance rate over the last `window` drafted tokens
+    falls below `min_accept`; after that it probes again.
+    """
+
+    def __init__(self, inner, mode: str, min_accept: float = 0.3, window: int = 256, cooldown: int = 512):
+        self.inner = inner
+        self.mode = mode
+        self.min_accept = min_accept
+        self.window = max(1, window)
+        self.cooldown = cooldown
+        self.drafted = 0
+        self.accepted = 0
+        self.fallbacks = 0
+        self._recent: Deque[Tuple[int, int]] = deque()
+        self._recent_drafted = 0
+        self._recent_accepted = 0
+        self._paused = 0
+        self._last: Optional[Tuple[int, np.ndarray, np.ndarray]] = None
+
+    @property
+    def active(self) -> bool:
+        return self._paused == 0
+
+    @property
+    def acceptance(self) -> Optional[float]:
+        """Accepted / drafted over the recent window (None before any guesses)."""
+        if not self._recent_drafted:
+            return None
+        return self._recent_accepted / self._recent_drafted
+
+    def counts(self) -> Tuple[int, int]:
+        return self.drafted, self.accepted
+
+    def __call__(self, input_ids: np.ndarray, **kwargs: Any) -> np.ndarray:
+        self._score(input_ids)
+        if self._paused:
+            self._paused -= 1
+            if not self._paused:
+                log.info("Re-enabling %s drafting", self.mode)
+            return _EMPTY
+        draft = np.asarray(self.inner(input_ids), dtype=np.intc)
+        if draft.shape[0]:
+            n = input_ids.shape[0]
+            self._last = (n, input_ids[max(0, n - _TAIL) : n].copy(), draft)
+        return draft
+
+    def _score(self, input_ids: np.ndarray) -> None:
+        if self._last is None:
+            return
+        n, tail, draft = self._last
+        self._last = None
+        # Same sequence one step later: input_ids = previous ids + accepted guesses + 1 new token.
+        if input_ids.shape[0] <= n or not np.array_equal(input_ids[max(0, n - _TAIL) : n], tail):
+            return
+        new = input_ids[n : n + draft.shape[0]]
+        mismatch = np.nonzero(new != draft[: new.shape[0]])[0]
+        accepted = int(mismatch[0]) if mismatch.shape[0] else int(new.shape[0])
+        self._observe(int(draft.shape[0]), accepted)
+
+    def _observe(self, drafted: int, accepted: int) -> None:
+        self.drafted += drafted
+        self.accepted += accepted
+        self._recent.append((drafted, accepted))
+        self._recent_drafted += drafted
+        self._recent_accepted += accepted
+        while self._recent and self._recent_drafted - self._recent[0][0] >= self.window:
+            d, a = self._recent.popleft()
+            self._recent_drafted -= d
+            self._recent_accepted -= a
+        if self._recent_drafted >= self.window and self.acceptance < self.min_accept:
+            log.warning(
+                "%s acceptance %.0f%% < %.0f%%; drafting paused for %d steps",
+                self.mode, 100 * self.acceptance, 100 * self.min_accept, self.cooldown,
+            )
+            self.fallbacks += 1
+            self._paused = self.cooldown
+            self._recent.clear()
+            self._recent_drafted = self._recent_accepted = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "active": self.active,
+            "drafted": self.drafted,
+            "accepted": self.accepted,
+            "acceptance": round(self.accepted / self.drafted, 4) if self.drafted else None,
+            "recent_acceptance": None if self.acceptance is None else round(self.acceptance, 4),
+            "fallbacks": self.fallbacks,
+        }
+
+
+def make_drafter(
+    mode: str,
+    draft_model_path: Optional[str] = None,
+    num_pred_tokens: int = 0,
+    ngram_size: int = 3,
+    min_accept: float = 0.3,
+    window: int = 256,
+    cooldown: int = 512,
+    n_ctx: int = 2048,
+) -> Optional[AdaptiveDrafter]:
+    """AdaptiveDrafter for `mode`, or None for "off". min_accept=0 never falls back."""
+    if mode not in MODES:
+        raise ValueError(f"Unknown speculative mode {mode!r}; choose from {MODES}")
+    if mode == "off":
+        return None
+    if mode == "prompt_lookup":
+        inner = PromptLookupDrafter(ngram_size, num_pred_tokens or 10)
+    else:
+        if not draft_model_path:
+            raise ValueError("Speculative mode 'draft' needs TUTOR_LLM_DRAFT_MODEL_PATH")
+        inner = DraftModelDrafter(draft_model_path, num_pred_tokens or 4, n_ctx=n_ctx)
+    return AdaptiveDrafter(inner, mode, min_accept, window, cooldown)
+
+
+_drafter: Optional[AdaptiveDrafter] = None
+
+
+def get_drafter() -> Optional[AdaptiveDrafter]:
+    """The drafter for the shared Llama (built once, on the inference thread)."""
+    global _drafter
+    s = get_settings()
+    if _drafter is None and s.llm_speculative != "off":
+        if s.llm_batch_slots > 1:
+            log.warning("TUTOR_LLM_SPECULATIVE is ignored with TUTOR_LLM_BATCH_SLOTS > 1")
+            return None
+        _drafter = make_drafter(
+            s.llm_speculative,
+            draft_model_path=s.llm_draft_model_path,
+            num_pred_tokens=s.llm_draft_tokens,
+            ngram_size=s.llm_ngram_size,
+            min_accept=s.llm_spec_min_accept,
+            window=s.llm_spec_window,
+            cooldown=s.llm_spec_cooldown,
+            n_ctx=s.llama_n_ctx,
+        )
+        log.info("Speculative decoding: %s", s.llm_speculative)
+    return _drafter
+
+
+def current_drafter() -> Optional[AdaptiveDrafter]:
+    """The drafter attached to the loaded Llama, if any (never builds one)."""
+    return _drafter
+
+
+def current_mode() -> str:
+    """Label for decode metrics: the configured mode, or "fallback" while drafting is paused."""
+    if _drafter is None:
+        return "off"
+    return _drafter.mode if _drafter.active else "fallback"
+
+
+def _stat(key: str):
+    return lambda: (_drafter.stats()[key] or 0) if _drafter is not None else 0
+
+
+metrics.counter("tutor_llm_draft_tokens_total", "Tokens proposed by the speculative drafter").set_function(_stat("drafted"))
+metrics.counter("tutor_llm_draft_accepted_total", "Drafted tokens the target model accepted").set_function(_stat("accepted"))
+metrics.counter("tutor_llm_draft_fallbacks_total", "Times drafting was paused for low acceptance").set_function(_stat("fallbacks"))
+metrics.gauge("tutor_llm_draft_acceptance_ratio", "Acceptance over the recent window").set_function(_stat("recent_acceptance"))
@@ -1,8 +1,6 @@
 # backend/app/services/speech_service.py — microphone input → Whisper STT (local)
 
-import io
 import os
-from pathlib import Path
 from typing import Optional
 
 # Whisper is loaded lazily to avoid slow import when not used
@@ -20,37 +18,31 @@ def _load_whisper(model_name: str = "base", device: Optional[str] = None):
 
 def transcribe_audio_bytes(audio_bytes: bytes, model_name: str = "base", device: Optional[str] = None) -> str:
     """
-    Transcribe raw audio bytes (e.g. from WebSocket). Handles .webm from browser mic;
-    converts to wav via pydub if needed, then runs Whisper.
+    Transcribe raw audio bytes (e.g. from WebSocket) synchronously. WebM/WAV is decoded
+    to 16 kHz float32 through an ffmpeg pipe in memory, then passed to Whisper.
+    The server uses the batched STT worker (stt_worker.py) instead.
     """
-    import tempfile
-    suffix = ".webm" if audio_bytes[:4] in (b"\x1aE\xdf\xa3", b"\x1a\x45\xdf\xa3") else ".wav"
-    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as f:
-        f.write(audio_bytes)
-        path = f.name
-    to_remove = [path]
-    try:
-        # Convert to wav 16k mono if input is webm (pydub needs ffmpeg)
-        try:
-            from pydub import AudioSegment
-            seg = AudioSegment.from_file(path)
-            seg = seg.set_frame_rate(16000).set_channels(1)
-            wav_path = path + ".wav"
-            seg.export(wav_path, format="wav")
-            path = wav_path
-            to_remove.append(wav_path)
-        except Exception:
-            pass
-        model = _load_whisper(model_name, device)
-        r = model.transcribe(path, language=None, fp16=(device == "cuda"))
-        return (r.get("text") or "").strip()
-    finally:
-        for p in to_remove:
-            if p and os.path.exists(p):
-                try:
-                    os.unlink(p)
-                except Exception:
-                    pass
+    from app.services.stt_worker import decode_audio_bytes
+    audio = decode_audio_bytes(audio_bytes, os.environ.get("TUTOR_FFMPEG_PATH", "ffmpeg"))
+    return transcribe_pcm(audio, model_name, device)
+
+
+def transcribe_pcm(
+    audio,
+    model_name: str = "base",
+    device: Optional[str] = None,
+    prompt: Optional[str] = None,
+) -> str:
+    """Transcribe 16 kHz mono float32 samples already in memory (used by the streaming path)."""
+    model = _load_whisper(model_name, device)
+    r = model.transcribe(
+        audio,
+        language=None,
+        fp16=(device == "cuda"),
+        initial_prompt=prompt,
+        condition_on_previous_text=False,
+    )
+    return (r.get("text") or "").strip()
 
 
 def transcribe_file(file_path: str, model_name: str = "base", device: Optional[str] = None) -> str:
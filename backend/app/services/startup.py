@@ -0,0 +1,212 @@
+# backend/app/services/startup.py — parallel model preload, warm-up and readiness state
+#
+# The lifespan starts one background task that loads every engine at once (llama.cpp on
+# its inference thread, Whisper in the STT worker process, Piper in its worker pool, the
+# embedding model in a thread), then pushes one tiny request through each so the first
+# real student does not pay for lazy initialisation. /ready reports the result.
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.config import get_settings
+from app.log import get_logger
+from app.services.stub_engines import stubs_enabled
+
+log = get_logger("startup")
+
+PENDING = "pending"
+LOADING = "loading"
+WARMING = "warming"
+READY = "ready"
+FAILED = "failed"
+DISABLED = "disabled"
+
+
+class Component:
+    """Load/warm-up status of one engine, as reported by /ready."""
+
+    def __init__(self, name: str, required: bool = True):
+        self.name = name
+        self.required = required
+        self.status = PENDING
+        self.load_s: Optional[float] = None
+        self.warmup_s: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in (READY, DISABLED) or not self.required
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "required": self.required,
+            "load_s": self.load_s,
+            "warmup_s": self.warmup_s,
+            "error": self.error,
+        }
+
+
+class StartupOrchestrator:
+    """Runs each component's load then warm-up concurrently; ready once every required one is."""
+
+    def __init__(self, warmup: bool = True, timeout: float = 300.0):
+        self.warmup = warmup
+        self.timeout = timeout
+        self.components: Dict[str, Component] = {}
+        self._steps: Dict[str, tuple] = {}
+        self._started_at = time.monotonic()
+        self._task: Optional[asyncio.Task] = None
+        self.finished_s: Optional[float] = None
+
+    def add(
+        self,
+        name: str,
+        load: Callable[[], Awaitable[None]],
+        warm: Optional[Callable[[], Awaitable[None]]] = None,
+        required: bool = True,
+        enabled: bool = True,
+    ) -> None:
+        comp = Component(name, required)
+        if not enabled:
+            comp.status = DISABLED
+        self.components[name] = comp
+        self._steps[name] = (load, warm)
+
+    @property
+    def ready(self) -> bool:
+        return self.finished_s is not None and all(c.ok for c in self.components.values())
+
+    def start(self) -> None:
+        self._started_at = time.monotonic()
+        self._task = asyncio.create_task(self._run())
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def _run(self) -> None:
+        await asyncio.gather(*(self._bring_up(name) for name in self.components))
+        self.finished_s = round(time.monotonic() - self._started_at, 3)
+        state = "ready" if self.ready else "NOT ready"
+        log.info("%s after %ss: %s", state, self.finished_s, ", ".join(
+            f"{c.name}={c.status}" for c in self.components.values()
+        ))
+
+    async def _bring_up(self, name: str) -> None:
+        comp = self.components[name]
+        if comp.status == DISABLED:
+            return
+        load, warm = self._steps[name]
+        try:
+            comp.status = LOADING
+            t0 = time.monotonic()
+            await asyncio.wait_for(load(), self.timeout)
+            comp.load_s = round(time.monotonic() - t0, 3)
+            if warm is not None and self.warmup:
+                comp.status = WARMING
+                t0 = time.monotonic()
+                await asyncio.wait_for(warm(), self.timeout)
+                comp.warmup_s = round(time.monotonic() - t0, 3)
+            comp.status = READY
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            comp.status = FAILED
+            comp.error = f"{type(e).__name__}: {e}"
+            log.error("%s failed: %s", name, comp.error)
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "elapsed_s": round(time.monotonic() - self._started_at, 3),
+            "finished_s": self.finished_s,
+            "components": {name: c.as_dict() for name, c in self.components.items()},
+        }
+
+
+# -- engine steps ---------------------------------------------------------------------
+# Engine modules are imported inside the steps so that importing app.main stays light
+# (no llama_cpp / whisper / torch until the background task actually loads them).
+
+async def _load_db() -> None:
+    from app.services.archive import start_maintenance
+    from app.services.db import get_database
+    await get_database().open()
+    start_maintenance()
+
+
+async def _load_llm() -> None:
+    # Model load + system-prompt prefix evaluation, on the inference thread itself.
+    from app.prompts.tutoring_prompts import SYSTEM_PROMPT
+    from app.services.llm_service import warm_prefix
+    await warm_prefix(SYSTEM_PROMPT)
+
+
+async def _warm_llm() -> None:
+    from app.prompts.tutoring_prompts import SYSTEM_PROMPT
+    from app.services.llm_service import generate_stream
+    async for _ in generate_stream("Say hi.", SYSTEM_PROMPT, [], max_tokens=2, temperature=0.0):
+        pass
+
+
+async def _load_stt() -> None:
+    from app.services.stt_worker import get_stt_worker
+    worker = get_stt_worker()
+    if not await asyncio.to_thread(worker.wait_ready, get_settings().startup_timeout_s):
+        raise RuntimeError("Whisper worker did not come up")
+
+
+async def _warm_stt() -> None:
+    import numpy as np
+    from app.services.stt_worker import SAMPLE_RATE, get_stt_worker
+    await get_stt_worker().transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+
+async def _load_tts() -> None:
+    from app.services.tts_service import get_piper_pool
+    await get_piper_pool().start()
+
+
+async def _warm_tts() -> None:
+    # Straight to the pool: a cache hit would skip the ONNX session warm-up.
+    from app.services.tts_service import get_piper_pool
+    await get_piper_pool().synthesize("Hello.")
+
+
+async def _load_semantic_index() -> None:
+    from app.services.semantic_index import get_semantic_index
+    idx = get_semantic_index()
+    if idx is None:
+        raise RuntimeError("faiss / sentence-transformers not installed")
+    await asyncio.to_thread(idx.load)
+    idx.start()
+
+
+def _piper_configured() -> bool:
+    from app.services.tts_service import _resolve_model
+    try:
+        _resolve_model()
+        return True
+    except FileNotFoundError:
+        return False
+
+
+_orchestrator: Optional[StartupOrchestrator] = None
+
+
+def get_orchestrator() -> StartupOrchestrator:
+    """The process-wide orchestrator with the tutor's engines registered."""
+    global _orchestrator
+    if _orchestrator is None:
+        s = get_settings()
+        o = StartupOrchestrator(warmup=s.startup_warmup, timeout=s.startup_timeout_s)
+        o.add("db", _load_db)
+        o.add("llm", _load_llm, _warm_llm, enabled=bool(s.llama_model_path) or stubs_enabled("llm"))
+        o.add("stt", _load_stt, _warm_stt)
+        o.add("tts", _load_tts, _warm_tts, enabled=_piper_configured() or stubs_enabled("tts"))
+        # Retrieval only enriches prompts; a node without it can still serve.
+        o.add("semantic_index", _load_semantic_index, required=False, enabled=s.semantic_index)
+        _orchestrator = o
+    return _orchestrator
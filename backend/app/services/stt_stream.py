@@ -0,0 +1,274 @@
+# backend/app/services/stt_stream.py — incremental speech-to-text for one utterance at a time
+#
+# Browser audio chunks (WebM/Opus from MediaRecorder, or WAV) are piped into one ffmpeg
+# process per utterance and come out as 16 kHz mono PCM in memory. Whisper runs on
+# sliding windows over that PCM: partial transcripts while the user speaks, and on
+# end-of-utterance only the last window is left to decode.
+
+import asyncio
+import re
+from typing import Awaitable, Callable, Optional
+
+import numpy as np
+
+from app import tracing
+
+SAMPLE_RATE = 16000
+
+TranscribeFn = Callable[[np.ndarray, Optional[str]], Awaitable[str]]
+
+
+class FFmpegPCMDecoder:
+    """Feed container bytes in, read 16-bit 16 kHz mono PCM out; no temp files."""
+
+    def __init__(self, ffmpeg_bin: str = "ffmpeg"):
+        self.ffmpeg_bin = ffmpeg_bin
+        self.pcm = bytearray()
+        self.updated = asyncio.Event()
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        self._proc = await asyncio.create_subprocess_exec(
+            self.ffmpeg_bin, "-loglevel", "error", "-i", "pipe:0",
+            "-f", "s16le", "-ac", "1", "-ar", str(SAMPLE_RATE), "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._reader = asyncio.create_task(self._read())
+
+    async def feed(self, data: bytes) -> None:
+        if self._proc is None:
+            await self.start()
+        if self._proc.stdin.is_closing():
+            return
+        try:
+            self._proc.stdin.write(data)
+            await self._proc.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def close(self) -> None:
+        """Signal end of input and wait until ffmpeg has flushed all PCM."""
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        await self._reader
+        await self._proc.wait()
+
+    async def kill(self) -> None:
+        if self._proc is not None and self._proc.returncode is None:
+            self._proc.kill()
+            await self._proc.wait()
+        if self._reader is not None:
+            self._reader.cancel()
+
+    @property
+    def samples(self) -> int:
+        return len(self.pcm) // 2
+
+    def audio(self, start: int, end: Optional[int] = None) -> np.ndarray:
+        """Samples [start, end) as float32 in [-1, 1]."""
+        end = self.samples if end is None else min(end, self.samples)
+        raw = bytes(self.pcm[start * 2 : end * 2])
+        return np.frombuffer(raw, dtype=np.int16).astype(np.float32) / 32768.0
+
+    async def _read(self) -> None:
+        while True:
+            chunk = await self._proc.stdout.read(8192)
+            if not chunk:
+                break
+            self.pcm.extend(chunk)
+            self.updated.set()
+        self.updated.set()
+
+
+class PCMDecoder:
+    """
+    Same interface as FFmpegPCMDecoder for clients that already send 16 kHz mono s16le
+    (optionally behind a WAV header), e.g. the benchmark harness; no ffmpeg needed.
+    """
+
+    def __init__(self):
+        self.pcm = bytearray()
+        self.updated = asyncio.Event()
+        self._head = bytearray()
+        self._header_done = False
+
+    async def feed(self, data: bytes) -> None:
+        if not self._header_done:
+            self._head.extend(data)
+            if len(self._head) < 44 and self._head[:4] in (b"RIFF", b"RIF", b"RI", b"R"):
+                return
+            data, self._head = self._strip_wav_header(bytes(self._head)), bytearray()
+            self._header_done = True
+        self.pcm.extend(data)
+        self.updated.set()
+
+    @staticmethod
+    def _strip_wav_header(data: bytes) -> bytes:
+        if data[:4] != b"RIFF":
+            return data
+        pos = data.find(b"data")
+        return data[pos + 8 :] if pos >= 0 else data[44:]
+
+    async def close(self) -> None:
+        if len(self.pcm) % 2:
+            del self.pcm[-1]
+        self.updated.set()
+
+    async def kill(self) -> None:
+        pass
+
+    @property
+    def samples(self) -> int:
+        return len(self.pcm) // 2
+
+    audio = FFmpegPCMDecoder.audio
+
+
+_WORD = re.compile(r"[^\w']+")
+
+
+def merge_overlap(committed: str, new: str, max_words: int = 12) -> str:
+    """Append `new` to `committed`, dropping words the overlapping audio transcribed twice."""
+    a, b = committed.split(), new.split()
+    if not a:
+        return new.strip()
+    norm = lambda w: _WORD.sub("", w.lower())
+    for k in range(min(max_words, len(a), len(b)), 0, -1):
+        if [norm(w) for w in a[-k:]] == [norm(w) for w in b[:k]]:
+            b = b[k:]
+            break
+    return " ".join(a + b)
+
+
+class SpeechStream:
+    """
+    One utterance: feed() audio chunks as they arrive; partial transcripts go to
+    `on_partial`, the final text to `on_final` once the client sends end-of-utterance,
+    trailing silence is detected, or no audio arrives for `idle_s`.
+    """
+
+    def __init__(
+        self,
+        transcribe: TranscribeFn,
+        on_partial: Callable[[str], Awaitable[None]],
+        on_final: Callable[[str], Awaitable[None]],
+        on_error: Optional[Callable[[Exception], Awaitable[None]]] = None,
+        window_s: float = 8.0,
+        overlap_s: float = 1.5,
+        step_s: float = 1.0,
+        silence_s: float = 0.8,
+        idle_s: float = 1.5,
+        ffmpeg_bin: str = "ffmpeg",
+        raw_pcm: bool = False,
+    ):
+        self._transcribe = transcribe
+        self._on_partial = on_partial
+        self._on_final = on_final
+        self._on_error = on_error
+        self.window = int(window_s * SAMPLE_RATE)
+        self.overlap = int(min(overlap_s, window_s / 2) * SAMPLE_RATE)
+        self.step = int(step_s * SAMPLE_RATE)
+        self.silence = int(silence_s * SAMPLE_RATE)
+        self.idle_s = idle_s
+        self._decoder = PCMDecoder() if raw_pcm else FFmpegPCMDecoder(ffmpeg_bin)
+        self._ended = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._committed = ""
+        self._commit_pos = 0   # first sample not yet covered by committed text
+        self._decoded_upto = 0
+        self._heard_speech = False
+
+    @property
+    def done(self) -> bool:
+        return self._task is not None and self._task.done()
+
+    async def feed(self, chunk: bytes) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+        await self._decoder.feed(chunk)
+
+    def end(self) -> None:
+        self._ended.set()
+
+    async def cancel(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        await self._decoder.kill()
+
+    async def _run(self) -> None:
+        try:
+            while not self._ended.is_set():
+                self._decoder.updated.clear()
+                try:
+                    await asyncio.wait_for(self._wait_audio_or_end(), self.idle_s)
+                except asyncio.TimeoutError:
+                    break
+                if self._trailing_silence():
+                    break
+                if self._decoder.samples - self._decoded_upto >= self.step:
+                    await self._advance()
+            # What is left to decode once the user stops: ffmpeg's flush, then the last window.
+            with tracing.span("audio_decode", samples=self._decoder.samples):
+                await self._decoder.close()
+            with tracing.span("stt_final"):
+                final = merge_overlap(self._committed, await self._window_text(self._commit_pos, None))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if self._on_error is not None:
+                await self._on_error(e)
+            return
+        finally:
+            await self._decoder.kill()
+        await self._on_final(final.strip())
+
+    async def _wait_audio_or_end(self) -> None:
+        ended = asyncio.create_task(self._ended.wait())
+        updated = asyncio.create_task(self._decoder.updated.wait())
+        try:
+            await asyncio.wait({ended, updated}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            ended.cancel()
+            updated.cancel()
+
+    async def _advance(self) -> None:
+        """Commit full windows, then send a partial for the still-open tail."""
+        total = self._decoder.samples
+        while total - self._commit_pos >= self.window:
+            text = await self._window_text(self._commit_pos, self._commit_pos + self.window)
+            self._committed = merge_overlap(self._committed, text)
+            self._commit_pos += self.window - self.overlap
+        self._decoded_upto = total
+        try:
+            tail = await self._window_text(self._commit_pos, total)
+        except Exception:
+            # Partials are best effort (e.g. STT queue full); the final pass still covers this audio.
+            return
+        partial = merge_overlap(self._committed, tail).strip()
+        if partial:
+            await self._on_partial(partial)
+
+    async def _window_text(self, start: int, end: Optional[int]) -> str:
+        audio = self._decoder.audio(start, end)
+        if audio.size < SAMPLE_RATE // 10:
+            return ""
+        # The end of the committed text primes Whisper across the window boundary.
+        prompt = " ".join(self._committed.split()[-20:]) or None
+        return (await self._transcribe(audio, prompt)).strip()
+
+    def _trailing_silence(self, threshold: float = 0.01) -> bool:
+        if self.silence <= 0 or self._decoder.samples < self.silence:
+            return False
+        tail = self._decoder.audio(self._decoder.samples - self.silence)
+        rms = float(np.sqrt(np.mean(tail * tail))) if tail.size else 0.0
+        if rms >= threshold:
+            self._heard_speech = True
+            return False
+        return self._heard_speech
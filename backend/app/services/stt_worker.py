@@ -0,0 +1,257 @@
+# backend/app/services/stt_worker.py — Whisper in a dedicated process, batched across sessions
+#
+# The parent decodes audio bytes to float32 in memory (ffmpeg pipe, in a thread) and
+# sends arrays to one worker process that loaded Whisper once. The worker drains every
+# request that arrives within a short window and runs clips up to 30 s through the
+# encoder/decoder as one batch of mel spectrograms.
+
+import asyncio
+import itertools
+import multiprocessing as mp
+import queue
+import subprocess
+import threading
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("stt")
+
+SAMPLE_RATE = 16000
+_MAX_BATCH_SECONDS = 30
+
+
+class STTBusyError(RuntimeError):
+    """Raised when the STT queue is at its depth limit; callers should back off."""
+
+
+def decode_audio_bytes(data: bytes, ffmpeg_bin: str = "ffmpeg", sr: int = SAMPLE_RATE) -> np.ndarray:
+    """Any container ffmpeg understands (WebM, WAV, ...) -> mono float32 at `sr`, without temp files."""
+    proc = subprocess.run(
+        [ffmpeg_bin, "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "-ar", str(sr), "pipe:1"],
+        input=data,
+        capture_output=True,
+        timeout=60,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg decode failed: {proc.stderr.decode(errors='replace').strip()}")
+    return np.frombuffer(proc.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+
+# -- worker process -------------------------------------------------------------------
+
+def _transcribe_batch(model, whisper, torch, items: List[Tuple[int, np.ndarray, Optional[str]]], fp16: bool):
+    """One encoder pass for every clip that fits in Whisper's 30 s window; longer clips go one by one."""
+    out = []
+    short = [it for it in items if len(it[1]) <= _MAX_BATCH_SECONDS * SAMPLE_RATE]
+    for req_id, audio, prompt in items:
+        if len(audio) > _MAX_BATCH_SECONDS * SAMPLE_RATE:
+            r = model.transcribe(audio, fp16=fp16, initial_prompt=prompt, condition_on_previous_text=False)
+            out.append((req_id, (r.get("text") or "").strip(), None))
+    # DecodingOptions.prompt applies to the whole batch, so group by prompt.
+    short.sort(key=lambda it: it[2] or "")
+    for prompt, group in itertools.groupby(short, key=lambda it: it[2]):
+        group = list(group)
+        n_mels = getattr(model.dims, "n_mels", 80)
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(audio)), n_mels=n_mels)
+            for _, audio, _ in group
+        ]).to(model.device)
+        results = whisper.decode(model, mel, whisper.DecodingOptions(fp16=fp16, prompt=prompt))
+        for (req_id, _, _), r in zip(group, results):
+            out.append((req_id, (r.text or "").strip(), None))
+    return out
+
+
+def _worker_main(requests, responses, model_name: str, device: str, max_batch: int, batch_window: float) -> None:
+    import torch
+    import whisper
+    if device == "auto":
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+    model = whisper.load_model(model_name, device=device)
+    fp16 = device == "cuda"
+    responses.put(("ready", None, None))
+    while True:
+        first = requests.get()
+        if first is None:
+            return
+        batch = [first]
+        # Collect whatever else arrives within the window (other sessions' utterances).
+        while len(batch) < max_batch:
+            try:
+                item = requests.get(timeout=batch_window)
+            except queue.Empty:
+                break
+            if item is None:
+                requests.put(None)
+                break
+            batch.append(item)
+        try:
+            for resp in _transcribe_batch(model, whisper, torch, batch, fp16):
+                responses.put(resp)
+        except Exception as e:
+            for req_id, _, _ in batch:
+                responses.put((req_id, None, str(e)))
+
+
+# -- parent side ----------------------------------------------------------------------
+
+class STTWorker:
+    """Awaitable front end for the worker process, with a queue-depth limit and restart on crash."""
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str,
+        max_queue: int = 32,
+        max_batch: int = 8,
+        batch_window_ms: int = 15,
+        ffmpeg_bin: str = "ffmpeg",
+    ):
+        self.model_name = model_name
+        self.device = device
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.batch_window = batch_window_ms / 1000
+        self.ffmpeg_bin = ffmpeg_bin
+        self._ctx = mp.get_context("spawn")
+        self._proc = None
+        self._requests = None
+        self._responses = None
+        self._listener: Optional[threading.Thread] = None
+        self._pending: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._stopping = False
+        self.ready = threading.Event()
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._pending)
+
+    def start(self) -> None:
+        with self._lock:
+            if self._proc is not None and self._proc.is_alive():
+                return
+            self.ready.clear()
+            self._requests = self._ctx.Queue()
+            self._responses = self._ctx.Queue()
+            self._proc = self._ctx.Process(
+                target=_worker_main,
+                args=(self._requests, self._responses, self.model_name, self.device, self.max_batch, self.batch_window),
+                name="stt-worker",
+                daemon=True,
+            )
+            self._proc.start()
+            self._listener = threading.Thread(target=self._listen, args=(self._proc, self._responses), daemon=True)
+            self._listener.start()
+
+    async def transcribe(self, audio: Union[bytes, np.ndarray], prompt: Optional[str] = None) -> str:
+        if len(self._pending) >= self.max_queue:
+            raise STTBusyError(f"STT queue full ({self.max_queue} pending)")
+        if isinstance(audio, (bytes, bytearray)):
+            audio = await asyncio.to_thread(decode_audio_bytes, bytes(audio), self.ffmpeg_bin)
+        self.start()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        req_id = next(self._ids)
+        self._pending[req_id] = (loop, fut)
+        try:
+            self._requests.put((req_id, np.ascontiguousarray(audio, dtype=np.float32), prompt))
+            return await fut
+        finally:
+            self._pending.pop(req_id, None)
+
+    def wait_ready(self, timeout: float) -> bool:
+        """Block until the worker has loaded Whisper; False on timeout or if the process died."""
+        deadline = time.monotonic() + timeout
+        while not self.ready.wait(0.2):
+            proc = self._proc
+            if proc is None or not proc.is_alive() or time.monotonic() > deadline:
+                return False
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping = True
+        if self._proc is not None:
+            try:
+                self._requests.put(None)
+            except Exception:
+                pass
+            self._proc.join(timeout)
+            if self._proc.is_alive():
+                self._proc.kill()
+        self._fail_pending(RuntimeError("STT worker stopped"))
+
+    def _listen(self, proc, responses) -> None:
+        while True:
+            try:
+                req_id, text, error = responses.get(timeout=1.0)
+            except queue.Empty:
+                if not proc.is_alive():
+                    break
+                continue
+            if req_id == "ready":
+                self.ready.set()
+                continue
+            entry = self._pending.get(req_id)
+            if entry is None:
+                continue
+            loop, fut = entry
+            if error is not None:
+                loop.call_soon_threadsafe(_settle, fut, None, RuntimeError(f"Whisper failed: {error}"))
+            else:
+                loop.call_soon_threadsafe(_settle, fut, text, None)
+        # Worker died: fail in-flight requests; the next transcribe() starts a fresh process.
+        if not self._stopping:
+            log.error("Worker exited with code %s; restarting on next request", proc.exitcode)
+            self._fail_pending(RuntimeError("STT worker crashed"))
+
+    def _fail_pending(self, exc: Exception) -> None:
+        for loop, fut in list(self._pending.values()):
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_settle, fut, None, exc)
+
+
+def _settle(fut: asyncio.Future, result, exc) -> None:
+    if fut.done():
+        return
+    if exc is not None:
+        fut.set_exception(exc)
+    else:
+        fut.set_result(result)
+
+
+_worker: Optional[STTWorker] = None
+
+
+def get_stt_worker() -> STTWorker:
+    global _worker
+    if _worker is None:
+        s = get_settings()
+        from app.services.stub_engines import stubs_enabled
+        if stubs_enabled("stt"):
+            from app.services.stub_engines import StubSTTWorker
+            _worker = StubSTTWorker(max_queue=s.stt_max_queue)
+            return _worker
+        _worker = STTWorker(
+            s.whisper_model,
+            s.whisper_device,
+            max_queue=s.stt_max_queue,
+            max_batch=s.stt_max_batch,
+            batch_window_ms=s.stt_batch_window_ms,
+            ffmpeg_bin=s.ffmpeg_bin,
+        )
+        _worker.start()
+    return _worker
+
+
+def shutdown_stt_worker() -> None:
+    global _worker
+    if _worker is not None:
+        _worker.stop()
+        _worker = None
@@ -0,0 +1,204 @@
+# backend/app/services/stub_engines.py — deterministic stand-ins for llama.cpp, Piper and Whisper
+#
+# Enabled with TUTOR_STUB_ENGINES=all (or a comma list of llm,tts,stt). Each stub plugs in
+# at the same seam as the real engine (inference worker, Piper pool, STT worker), so the
+# WebSocket handler, token queue, TTS pipeline and output channel all run for real; only
+# the model math is replaced by sleeps that follow a timing profile (TUTOR_STUB_PROFILE).
+# Outputs depend only on the input text, so runs are comparable.
+
+import asyncio
+import hashlib
+import math
+import queue
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from app.config import get_settings
+
+# Per-engine costs. "cpu" approximates a 7B Q4 model on a laptop CPU with Whisper base,
+# "gpu" the same stack on a mid-range GPU.
+PROFILES: Dict[str, Dict[str, float]] = {
+    "cpu": {
+        "llm_prefill_ms_per_token": 4.0,
+        "llm_decode_ms_per_token": 90.0,
+        "llm_load_s": 2.0,
+        "tts_ms_per_char": 2.5,
+        "tts_overhead_ms": 40.0,
+        "stt_rtf": 0.25,          # seconds of compute per second of audio
+        "stt_overhead_ms": 60.0,
+    },
+    "gpu": {
+        "llm_prefill_ms_per_token": 0.3,
+        "llm_decode_ms_per_token": 18.0,
+        "llm_load_s": 1.0,
+        "tts_ms_per_char": 1.0,
+        "tts_overhead_ms": 15.0,
+        "stt_rtf": 0.03,
+        "stt_overhead_ms": 25.0,
+    },
+}
+
+_WORDS = (
+    "a variable is a named place in memory that holds a value you can change later . "
+    "think of it as a labelled box ; the label stays the same while the contents vary . "
+    "for example , x = 5 stores five in x . what would x hold after x = x + 1 ?"
+).split()
+
+
+def stubs_enabled(component: str) -> bool:
+    names = get_settings().stub_engines
+    return "all" in names or component in names
+
+
+def profile() -> Dict[str, float]:
+    name = get_settings().stub_profile
+    if name not in PROFILES:
+        raise ValueError(f"Unknown TUTOR_STUB_PROFILE {name!r}; choose from {sorted(PROFILES)}")
+    return PROFILES[name]
+
+
+def _seed(text: str) -> int:
+    return int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:4], "little")
+
+
+class StubLLMEngine(threading.Thread):
+    """Drop-in for InferenceWorker: one sequence at a time, prefill then paced tokens."""
+
+    def __init__(self, model_path: Optional[str] = None):
+        super().__init__(name="llm-stub", daemon=True)
+        self.p = profile()
+        self._jobs: "queue.Queue[Any]" = queue.Queue()
+        self._stopping = threading.Event()
+        self._loaded = False
+
+    def submit(self, text: str, params: Dict[str, Any], maxsize: int, **job_kw):
+        from app.services.llm_service import _Job
+        if self._stopping.is_set():
+            raise RuntimeError("LLM inference worker is shutting down")
+        job = _Job(text, params, asyncio.get_running_loop(), maxsize, **job_kw)
+        self._jobs.put(job)
+        return job
+
+    @property
+    def queue_depth(self) -> int:
+        return self._jobs.qsize()
+
+    def run(self) -> None:
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            if job.cancelled.is_set():
+                continue
+            job.started = time.perf_counter()
+            if not self._loaded:
+                time.sleep(self.p["llm_load_s"])
+                self._loaded = True
+            if job.kind == "warm":
+                time.sleep(len(job.prefix or "") / 4 * self.p["llm_prefill_ms_per_token"] / 1000)
+                job.push("done")
+                continue
+            # Prefill cost of the whole prompt (no KV reuse modelled), then decode.
+            time.sleep(len(job.text) / 4 * self.p["llm_prefill_ms_per_token"] / 1000)
+            seed = _seed(job.text)
+            if job.kind == "classify":
+                # Deterministic verdict: two thirds of the answers are "right".
+                names = [name for name, _ in job.params["labels"]]
+                scores = dict.fromkeys(names, -3.0)
+                scores[names[0] if seed % 3 else names[-1]] = -0.1
+                job.push("verdict", scores)
+                job.push("done")
+                continue
+            max_tokens = int(job.params.get("max_tokens", 128))
+            n = min(max_tokens, 24 + seed % 40)
+            delay = self.p["llm_decode_ms_per_token"] / 1000
+            for i in range(n):
+                time.sleep(delay)
+                if self._stopping.is_set() or not job.push("token", " " + _WORDS[(seed + i) % len(_WORDS)]):
+                    break
+            else:
+                # Replies end in a question, so the next answer goes through grading.
+                job.push("token", "?")
+            job.push("done")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stopping.set()
+        self._jobs.put(None)
+        if self.is_alive():
+            self.join(timeout)
+
+
+def _tone_wav(seconds: float, sample_rate: int = 22050) -> bytes:
+    from app.services.tts_service import pcm_to_wav
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pcm = (0.1 * np.sin(2 * math.pi * 220 * t) * 32767).astype(np.int16).tobytes()
+    return pcm_to_wav(pcm, sample_rate)
+
+
+class StubPiperPool:
+    """Drop-in for PiperPool: synthesis time and audio length both scale with the text."""
+
+    def __init__(self, size: int = 2):
+        self.p = profile()
+        self.model = "stub"
+        self.params: Dict[str, str] = {"stub_profile": get_settings().stub_profile}
+        self.sample_rate = 22050
+        self._slots = asyncio.Semaphore(max(1, size))
+
+    async def start(self) -> None:
+        pass
+
+    async def synthesize(self, text: str) -> bytes:
+        async with self._slots:
+            await asyncio.sleep((self.p["tts_overhead_ms"] + len(text) * self.p["tts_ms_per_char"]) / 1000)
+        # ~15 characters of speech per second
+        return await asyncio.to_thread(_tone_wav, max(0.2, len(text) / 15), self.sample_rate)
+
+    async def close(self) -> None:
+        pass
+
+
+class StubSTTWorker:
+    """Drop-in for STTWorker: cost is overhead + audio duration x real-time factor."""
+
+    def __init__(self, max_queue: int = 32):
+        self.p = profile()
+        self.max_queue = max_queue
+        self.ready = threading.Event()
+        self.ready.set()
+        self._pending = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._pending
+
+    def start(self) -> None:
+        pass
+
+    def wait_ready(self, timeout: float) -> bool:
+        return True
+
+    async def transcribe(self, audio, prompt: Optional[str] = None) -> str:
+        from app.services.stt_worker import SAMPLE_RATE, STTBusyError
+        if self._pending >= self.max_queue:
+            raise STTBusyError(f"STT queue full ({self.max_queue} pending)")
+        if isinstance(audio, (bytes, bytearray)):
+            seconds = max(0, len(audio) - 44) / 2 / SAMPLE_RATE
+        else:
+            seconds = len(audio) / SAMPLE_RATE
+        self._pending += 1
+        try:
+            await asyncio.sleep((self.p["stt_overhead_ms"] + seconds * 1000 * self.p["stt_rtf"]) / 1000)
+        finally:
+            self._pending -= 1
+        # About 2.5 words per second of speech, deterministic in the duration.
+        n = max(1, int(seconds * 2.5))
+        start = int(seconds * 10) % len(_WORDS)
+        return " ".join(_WORDS[(start + i) % len(_WORDS)] for i in range(n))
+
+    def stop(self, timeout: float = 5.0) -> None:
+        pass
+
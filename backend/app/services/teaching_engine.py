@@ -1,26 +1,87 @@
-# backend/app/services/teaching_engine.py
-from typing import List, Optional, Tuple
+# backend/app/services/teaching_engine.py — explain → ask → grade → correct loop per session
+#
+#   idle ──start_concept──> explain ──reply ends in a question──> ask
+#   ask ──student answers──> grade ──verdict──> correct ──reply ends in a question──> ask
+#
+# "explain" and "correct" are generated and streamed; "grade" is one forward pass
+# (grading.py). A reply without a question, or a student question while in "ask",
+# falls back to free conversation.
+import re
+from typing import Optional
+
 from app.prompts.tutoring_prompts import (
     EXPLAIN_PROMPT,
     QUESTION_PROMPT,
+    CORRECT_PROMPT,
     CORRECTION_PROMPT,
 )
 
-# Keep the state class as is
+IDLE = "idle"
+EXPLAIN = "explain"
+ASK = "ask"
+GRADE = "grade"
+CORRECT = "correct"
+
+_SENTENCE = re.compile(r"[^.!?\n]*\?")
+
+
+def extract_question(reply: str) -> Optional[str]:
+    """The last sentence of a reply that ends with "?", if any."""
+    found = _SENTENCE.findall(reply or "")
+    return found[-1].strip() if found else None
+
+
 class TeachingState:
     def __init__(self):
         self.current_concept: Optional[str] = None
         self.last_question: Optional[str] = None
         self.waiting_for_answer: bool = False
+        self.phase: str = IDLE
+        self.streak: int = 0   # consecutive correct answers on the current concept
+
+    def start(self, concept: str) -> None:
+        self.current_concept = concept
+        self.last_question = None
+        self.waiting_for_answer = False
+        self.streak = 0
+        self.phase = EXPLAIN
+
+    def replied(self, reply: str) -> None:
+        """After an explanation or correction: wait for an answer if the reply asked something."""
+        question = extract_question(reply)
+        if question is None and self.phase == ASK:
+            return   # side conversation; the open question still stands
+        self.last_question = question
+        self.waiting_for_answer = self.last_question is not None and self.current_concept is not None
+        self.phase = ASK if self.waiting_for_answer else IDLE
+
+    def expects_answer(self, text: str) -> bool:
+        # A question back ("what do you mean?") is conversation, not an answer to grade.
+        return self.phase == ASK and not text.rstrip().endswith("?")
+
+    def grading(self) -> None:
+        self.phase = GRADE
+        self.waiting_for_answer = False
+
+    def graded(self, correct: bool) -> None:
+        self.streak = self.streak + 1 if correct else 0
+        self.phase = CORRECT
+
+    def abort(self) -> None:
+        """A step failed: drop back to free conversation."""
+        self.waiting_for_answer = False
+        self.phase = IDLE
+
 
 def get_explanation_prompt(concept: str) -> str:
     """Returns the prompt string for explaining a concept."""
     return EXPLAIN_PROMPT.format(concept=concept)
 
 def get_check_answer_prompt(question: str, user_answer: str) -> str:
-    """Returns the prompt string for checking an answer."""
+    """Returns the prompt string for grading an answer (scored from logits, see grading.py)."""
     return QUESTION_PROMPT.format(question=question, user_answer=user_answer)
 
-def get_correction_prompt(concept: str) -> str:
-    """Returns the prompt string for correcting a concept."""
-    return CORRECTION_PROMPT.format(concept=concept)
\ No newline at end of file
+def get_correction_prompt(concept: str, question: str, user_answer: str, correct: bool) -> str:
+    """Returns the prompt for the short reply after grading: praise or correction, then a new question."""
+    template = CORRECT_PROMPT if correct else CORRECTION_PROMPT
+    return template.format(concept=concept, question=question, user_answer=user_answer)
@@ -0,0 +1,171 @@
+# backend/app/services/tts_pipeline.py — overlap Piper synthesis with LLM token generation
+
+import asyncio
+import base64
+import re
+from typing import Awaitable, Callable, List, Optional
+
+from app import tracing
+from app.log import get_logger
+from app.services.audio_transport import AudioFormat
+from app.services.tts_service import piper_tts_async
+
+log = get_logger("tts.pipeline")
+
+# A sentence ends at . ! ? (optionally followed by closing quotes/brackets) and then whitespace.
+# Requiring the whitespace keeps "3.14" and "e.g." mid-token from splitting early.
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s")
+_CLAUSE_END = re.compile(r"[,;:—]\s")
+
+
+class SentenceSegmenter:
+    """
+    Cut a token stream into speakable segments as soon as they are complete.
+    Sentence boundaries are preferred; clause boundaries (, ; :) are used once a
+    segment is long enough, and very long runs are cut at the last space.
+    """
+
+    def __init__(self, min_chars: int = 20, max_chars: int = 200):
+        self.min_chars = max(1, min_chars)
+        self.max_chars = max(self.min_chars, max_chars)
+        self._buf = ""
+
+    def feed(self, token: str) -> List[str]:
+        self._buf += token
+        out: List[str] = []
+        while True:
+            seg = self._cut()
+            if seg is None:
+                break
+            out.append(seg)
+        return out
+
+    def flush(self) -> Optional[str]:
+        seg = self._buf.strip()
+        self._buf = ""
+        return seg or None
+
+    def _cut(self) -> Optional[str]:
+        buf = self._buf
+        end = self._boundary(_SENTENCE_END, buf, self.min_chars)
+        if end is None:
+            end = self._boundary(_CLAUSE_END, buf, self.min_chars * 2)
+        if end is None and len(buf) >= self.max_chars:
+            space = buf.rfind(" ", self.min_chars, self.max_chars)
+            end = space + 1 if space > 0 else self.max_chars
+        if end is None:
+            return None
+        seg, self._buf = buf[:end].strip(), buf[end:]
+        return seg or None
+
+    @staticmethod
+    def _boundary(pattern, buf: str, min_len: int) -> Optional[int]:
+        for m in pattern.finditer(buf):
+            if len(buf[: m.end()].strip()) >= min_len:
+                return m.end()
+        return None
+
+
+class TTSPipeline:
+    """
+    Streaming stage between generate_stream and the socket: tokens go in, ordered audio
+    comes out while the LLM keeps generating. With a negotiated `audio_format` each
+    segment is a `tts_segment` header plus binary chunks; otherwise one JSON `tts_chunk`.
+    """
+
+    def __init__(
+        self,
+        send_fn: Callable[[dict], Awaitable[None]],
+        min_chars: int = 20,
+        max_chars: int = 200,
+        synthesize: Callable[[str], Awaitable[bytes]] = piper_tts_async,
+        max_inflight: int = 1,
+        audio_format: Optional[AudioFormat] = None,
+    ):
+        self._send = send_fn
+        self._format = audio_format
+        self._synthesize = synthesize
+        self._segmenter = SentenceSegmenter(min_chars, max_chars)
+        self._slots = asyncio.Semaphore(max(1, max_inflight))
+        # Synthesis tasks in segment order; the sender awaits them one by one.
+        self._pending: "asyncio.Queue[Optional[tuple]]" = asyncio.Queue()
+        self._sender = asyncio.create_task(self._send_in_order())
+        # Every synthesis task, including ones the sender has already dequeued, for cancel().
+        self._tasks: List[asyncio.Task] = []
+        self._seq = 0
+
+    def feed(self, token: str) -> None:
+        for seg in self._segmenter.feed(token):
+            self._submit(seg)
+
+    async def finish(self) -> int:
+        """Flush the trailing text, wait until every segment is sent; returns segment count."""
+        tail = self._segmenter.flush()
+        if tail:
+            self._submit(tail)
+        self._pending.put_nowait(None)
+        try:
+            # Shielded: a cancellation reaching the sender first would free its Piper slot
+            # for the next queued segment before cancel() gets to it.
+            await asyncio.shield(self._sender)
+        except asyncio.CancelledError:
+            await self.cancel()
+            raise
+        return self._seq
+
+    async def cancel(self) -> None:
+        """Stop sending and cancel all synthesis, queued or waiting for a slot (Piper aborts what is running)."""
+        self._sender.cancel()
+        for task in self._tasks:
+            task.cancel()
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+
+    def _submit(self, text: str) -> None:
+        task = asyncio.create_task(self._synth(text))
+        self._tasks.append(task)
+        task.add_done_callback(self._tasks.remove)
+        self._pending.put_nowait((self._seq, text, task))
+        self._seq += 1
+
+    async def _synth(self, text: str) -> bytes:
+        async with self._slots:
+            with tracing.span("tts", chars=len(text)):
+                return await self._synthesize(text)
+
+    async def _send_in_order(self) -> None:
+        while True:
+            item = await self._pending.get()
+            if item is None:
+                return
+            seq, text, task = item
+            try:
+                audio = await task
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.error("Segment %d failed: %s", seq, e)
+                continue
+            if self._format is None:
+                await self._send({
+                    "type": "tts_chunk",
+                    "seq": seq,
+                    "text": text,
+                    "data": base64.b64encode(audio).decode("ascii"),
+                })
+                continue
+            # Off the loop: Opus encoding of a long sentence takes tens of milliseconds.
+            with tracing.span("tts_encode", codec=self._format.codec):
+                rate, frames = await asyncio.to_thread(self._format.frames, seq, audio)
+            await self._send({
+                "type": "tts_segment",
+                "seq": seq,
+                "text": text,
+                "format": self._format.codec,
+                "sample_rate": rate,
+                "chunks": len(frames),
+            })
+            for frame in frames:
+                await self._send(frame)
@@ -1,11 +1,26 @@
 # backend/app/services/tts_service.py — text to speech via Piper (local)
 
 import asyncio
+import io
+import json
 import os
+import signal
+import struct
 import subprocess
+import sys
 import tempfile
+import wave
 from pathlib import Path
-from typing import Optional
+from typing import Dict, List, Optional, Set
+
+from app.config import get_settings
+from app.log import get_logger
+from app.services.audio_cache import get_audio_cache
+
+log = get_logger("tts")
+
+# Sent to a worker to abort the sentence it is synthesizing (not available on Windows).
+_ABORT_SIGNAL = getattr(signal, "SIGUSR1", None)
 
 
 def _default_piper_model() -> str:
@@ -31,16 +46,12 @@ def piper_tts(
     model_path: Optional[str] = None,
 ) -> bytes:
     """
-    Run Piper TTS: text -> WAV bytes.
+    Run Piper TTS once via the CLI: text -> WAV bytes.
     Piper is called as: piper --model <model> --output_file <out> [stdin with text]
+    Kept for scripts and one-off use; the server goes through PiperPool.
     """
     piper_bin = piper_bin or os.environ.get("TUTOR_PIPER_PATH", "piper")
-    model = model_path or os.environ.get("TUTOR_PIPER_MODEL_PATH") or _default_piper_model()
-    if not model or not Path(model).exists():
-        # Fallback: return empty and let caller handle (or use a placeholder tone)
-        raise FileNotFoundError(
-            "Piper model not found. Place .onnx (and .onnx.json) in models/piper/ or set TUTOR_PIPER_MODEL_PATH."
-        )
+    model = _resolve_model(model_path)
     use_file = out_path
     if not use_file:
         fd, use_file = tempfile.mkstemp(suffix=".wav")
@@ -66,14 +77,291 @@ def piper_tts(
                 pass
 
 
-async def piper_tts_async(
-    text: str,
-    piper_bin: Optional[str] = None,
-    model_path: Optional[str] = None,
-) -> bytes:
-    """Async wrapper around Piper (runs in thread)."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(
-        None,
-        lambda: piper_tts(text, piper_bin=piper_bin, model_path=model_path),
-    )
+def _resolve_model(model_path: Optional[str] = None) -> str:
+    model = model_path or os.environ.get("TUTOR_PIPER_MODEL_PATH") or _default_piper_model()
+    if not model or not Path(model).exists():
+        raise FileNotFoundError(
+            "Piper model not found. Place .onnx (and .onnx.json) in models/piper/ or set TUTOR_PIPER_MODEL_PATH."
+        )
+    return model
+
+
+def pcm_to_wav(pcm: bytes, sample_rate: int) -> bytes:
+    """Wrap 16-bit mono PCM in a WAV header (in memory)."""
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    return buf.getvalue()
+
+
+class PiperWorker:
+    """One warm piper_worker.py process. Not safe for concurrent use; the pool hands it out exclusively."""
+
+    def __init__(self, model: str, params: Optional[Dict[str, str]] = None):
+        self.model = model
+        self.params = params or {}
+        self.sample_rate = 22050
+        self._proc: Optional[asyncio.subprocess.Process] = None
+        self._awaiting = False                  # a request was written and its frame not fully read
+        self._header: Optional[bytes] = None    # header of a frame whose payload is still unread
+
+    @property
+    def alive(self) -> bool:
+        return self._proc is not None and self._proc.returncode is None
+
+    async def start(self, timeout: float) -> None:
+        args = ["--model", self.model]
+        if self.params.get("speaker"):
+            args += ["--speaker", self.params["speaker"]]
+        if self.params.get("length_scale"):
+            args += ["--length-scale", self.params["length_scale"]]
+        self._proc = await asyncio.create_subprocess_exec(
+            sys.executable,
+            str(Path(__file__).with_name("piper_worker.py")),
+            *args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            cwd=str(Path(self.model).parent),
+        )
+        self._awaiting = True
+        kind, payload = await asyncio.wait_for(self._read_frame(), timeout)
+        self._awaiting = False
+        if kind != b"R":
+            await self.close()
+            raise RuntimeError(payload.decode("utf-8", "replace") or "Piper worker failed to start")
+        self.sample_rate = int(json.loads(payload)["sample_rate"])
+
+    async def synthesize(self, text: str) -> bytes:
+        """Text -> raw 16-bit PCM."""
+        kind, payload = await self._request({"text": text})
+        if kind == b"E":
+            raise RuntimeError(f"Piper TTS failed: {payload.decode('utf-8', 'replace')}")
+        return payload
+
+    async def ping(self) -> bool:
+        kind, _ = await self._request({"ping": True})
+        return kind == b"P"
+
+    async def abort(self, timeout: float) -> bool:
+        """
+        Settle a request whose caller went away: stop the synthesis and consume its reply,
+        so the worker serves again with its voice still loaded. False if it cannot.
+        """
+        if not self._awaiting:
+            return self.alive
+        if not self.alive:
+            return False
+        try:
+            if self._header is not None:
+                # The reply was already arriving; just read the rest of it.
+                (length,) = struct.unpack(">I", self._header[1:])
+                await asyncio.wait_for(self._proc.stdout.readexactly(length), timeout)
+            elif _ABORT_SIGNAL is not None:
+                self._proc.send_signal(_ABORT_SIGNAL)
+                await asyncio.wait_for(self._read_frame(), timeout)
+            else:
+                # No SIGUSR1 (Windows): the sentence cannot be cut short, so the pool restarts the worker.
+                return False
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError):
+            return False
+        self._awaiting = False
+        self._header = None
+        return True
+
+    async def close(self) -> None:
+        self._awaiting = False
+        self._header = None
+        proc, self._proc = self._proc, None
+        if proc is None or proc.returncode is not None:
+            return
+        try:
+            proc.kill()
+            await proc.wait()
+        except ProcessLookupError:
+            pass
+
+    async def _request(self, req: dict):
+        if not self.alive:
+            raise RuntimeError("Piper worker is not running")
+        self._awaiting = True
+        self._proc.stdin.write((json.dumps(req) + "\n").encode("utf-8"))
+        await self._proc.stdin.drain()
+        frame = await self._read_frame()
+        self._awaiting = False
+        return frame
+
+    async def _read_frame(self):
+        header = await self._proc.stdout.readexactly(5)
+        self._header = header
+        (length,) = struct.unpack(">I", header[1:])
+        payload = await self._proc.stdout.readexactly(length) if length else b""
+        self._header = None
+        return header[:1], payload
+
+
+class PiperPool:
+    """
+    Fixed-size pool of warm Piper workers for one voice model.
+    Dead or timed-out workers are killed and replaced; idle workers are pinged periodically.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        size: int = 2,
+        timeout: float = 30.0,
+        health_interval: float = 10.0,
+        params: Optional[Dict[str, str]] = None,
+    ):
+        self.model = model
+        self.params = params or {}
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.health_interval = health_interval
+        self.sample_rate = 22050
+        self._workers: List[PiperWorker] = []
+        self._idle: "asyncio.Queue[PiperWorker]" = asyncio.Queue()
+        self._health_task: Optional[asyncio.Task] = None
+        self._settling: Set[asyncio.Task] = set()
+        self._started = False
+        self._lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        async with self._lock:
+            if self._started:
+                return
+            workers = [PiperWorker(self.model, self.params) for _ in range(self.size)]
+            await asyncio.gather(*(w.start(self.timeout) for w in workers))
+            self.sample_rate = workers[0].sample_rate
+            for w in workers:
+                self._workers.append(w)
+                self._idle.put_nowait(w)
+            if self.health_interval > 0:
+                self._health_task = asyncio.create_task(self._health_loop())
+            self._started = True
+
+    async def synthesize(self, text: str) -> bytes:
+        """Text -> WAV bytes."""
+        await self.start()
+        worker = await self._idle.get()
+        ok = False
+        try:
+            if not worker.alive:
+                await self._restart(worker)
+            pcm = await asyncio.wait_for(worker.synthesize(text), self.timeout)
+            ok = True
+            return pcm_to_wav(pcm, worker.sample_rate)
+        except RuntimeError:
+            # Worker answered with an error frame: the stream is still in sync.
+            ok = worker.alive
+            raise
+        except asyncio.CancelledError:
+            # The turn was cancelled: abort the sentence, keep the voice loaded, and hand the
+            # worker back once it has answered (in the background; the caller is gone).
+            task = asyncio.create_task(self._settle(worker))
+            self._settling.add(task)
+            task.add_done_callback(self._settling.discard)
+            worker = None
+            raise
+        finally:
+            if worker is not None:
+                # Timeouts leave a half-read frame behind: replace the worker.
+                if not ok:
+                    await worker.close()
+                self._idle.put_nowait(worker)
+
+    async def close(self) -> None:
+        if self._health_task:
+            self._health_task.cancel()
+            self._health_task = None
+        for task in list(self._settling):
+            task.cancel()
+        await asyncio.gather(*(w.close() for w in self._workers), return_exceptions=True)
+        self._workers.clear()
+        self._started = False
+
+    async def _settle(self, worker: PiperWorker) -> None:
+        try:
+            if not await worker.abort(self.timeout):
+                await self._restart(worker)
+        except Exception as e:
+            await worker.close()
+            log.error("Piper worker restart failed: %s", e)
+        finally:
+            self._idle.put_nowait(worker)
+
+    async def _restart(self, worker: PiperWorker) -> None:
+        await worker.close()
+        await worker.start(self.timeout)
+        log.info("Restarted Piper worker")
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.health_interval)
+            # Only check workers that are idle right now; busy ones prove themselves.
+            for _ in range(self._idle.qsize()):
+                worker = self._idle.get_nowait()
+                try:
+                    if not worker.alive or not await asyncio.wait_for(worker.ping(), 5.0):
+                        raise RuntimeError("unhealthy")
+                except Exception:
+                    try:
+                        await self._restart(worker)
+                    except Exception as e:
+                        log.error("Piper worker restart failed: %s", e)
+                finally:
+                    self._idle.put_nowait(worker)
+
+
+_pools: Dict[str, PiperPool] = {}
+
+
+def get_piper_pool(model_path: Optional[str] = None) -> PiperPool:
+    s = get_settings()
+    from app.services.stub_engines import stubs_enabled
+    if stubs_enabled("tts"):
+        from app.services.stub_engines import StubPiperPool
+        return _pools.setdefault("stub", StubPiperPool(s.piper_pool_size))
+    model = _resolve_model(model_path)
+    pool = _pools.get(model)
+    if pool is None:
+        pool = PiperPool(
+            model,
+            size=s.piper_pool_size,
+            timeout=s.piper_timeout,
+            health_interval=s.piper_health_interval,
+            params={"speaker": s.piper_speaker, "length_scale": s.piper_length_scale},
+        )
+        _pools[model] = pool
+    return pool
+
+
+async def shutdown_piper_pools() -> None:
+    pools = list(_pools.values())
+    _pools.clear()
+    await asyncio.gather(*(p.close() for p in pools), return_exceptions=True)
+
+
+async def piper_tts_async(text: str, model_path: Optional[str] = None) -> bytes:
+    """
+    Text -> WAV bytes via the warm worker pool (no process spawn or temp file per call).
+    Repeated phrases are served from the audio cache. The workers use the piper-tts package,
+    not the piper binary, so TUTOR_PIPER_PATH only applies to piper_tts().
+    """
+    from app.services.stub_engines import stubs_enabled
+    pool = get_piper_pool(model_path)
+    # Stub audio is a test tone: caching it would fill the real cache and skew benchmark TTS timings.
+    cache = None if stubs_enabled("tts") else get_audio_cache()
+    if cache is None:
+        return await pool.synthesize(text)
+    key = cache.key(text, pool.model, pool.params)
+    data = await asyncio.to_thread(cache.get, key)
+    if data is not None:
+        return data
+    data = await pool.synthesize(text)
+    await asyncio.to_thread(cache.put, key, data)
+    return data
@@ -0,0 +1,188 @@
+# backend/app/tracing.py — per-stage timing spans and sampled per-turn traces
+#
+# span("stt") / record("ttft", seconds) time one pipeline stage. Every measurement goes
+# into the tutor_stage_seconds{stage} histogram (served on /metrics) and, while a turn is
+# being traced, into that turn's Trace together with the session id. A session id is
+# bound once per connection with bind_session(); asyncio tasks started afterwards
+# inherit it, as they do the current turn.
+#
+# TUTOR_TRACE_SAMPLE=0.01 writes 1% of turns (and TUTOR_TRACE_SLOW_MS=n every turn slower
+# than n ms) as one JSON line each to TUTOR_TRACE_DIR/turns-YYYYMMDD.jsonl.
+
+import asyncio
+import json
+import logging
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app import metrics
+from app.log import get_logger
+
+log = get_logger("trace")
+
+STAGE_SECONDS = metrics.histogram(
+    "tutor_stage_seconds", "Time spent per pipeline stage", ["stage"]
+)
+TURN_SECONDS = metrics.histogram(
+    "tutor_turn_seconds", "Turn handling time per turn kind (voice: from the final transcript)", ["kind"]
+)
+DECODE_TPS = metrics.histogram(
+    "tutor_llm_decode_tokens_per_second", "Effective decode speed per reply, by speculative mode", ["mode"],
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 250),
+)
+ERRORS = metrics.counter("tutor_errors_total", "Failed pipeline stages", ["stage"])
+
+_session: ContextVar[Optional[str]] = ContextVar("tutor_session", default=None)
+_trace: ContextVar[Optional["Trace"]] = ContextVar("tutor_trace", default=None)
+_config: Optional[Dict[str, Any]] = None
+
+
+def _settings() -> Dict[str, Any]:
+    global _config
+    if _config is None:
+        from app.config import get_settings
+        s = get_settings()
+        _config = {"sample": s.trace_sample, "slow_s": s.trace_slow_ms / 1000, "dir": s.trace_dir}
+    return _config
+
+
+class Trace:
+    """Stages of one turn, relative to its start."""
+
+    def __init__(self, kind: str, session_id: Optional[str]):
+        self.kind = kind
+        self.session_id = session_id
+        self.ts = time.time()
+        self.t0 = time.perf_counter()
+        self.spans: List[Dict[str, Any]] = []
+        # Per-frame stages (socket sends) are summed instead of listed.
+        self.totals: Dict[str, List[float]] = {}
+
+    def add(self, stage: str, start: float, seconds: float, attrs: Dict[str, Any]) -> None:
+        span = {"stage": stage, "at_ms": round((start - self.t0) * 1000, 2), "ms": round(seconds * 1000, 2)}
+        if attrs:
+            span.update(attrs)
+        self.spans.append(span)
+
+    def accumulate(self, stage: str, seconds: float) -> None:
+        t = self.totals.setdefault(stage, [0, 0.0])
+        t[0] += 1
+        t[1] += seconds
+
+    def as_dict(self, total_s: float) -> Dict[str, Any]:
+        return {
+            "ts": round(self.ts, 3),
+            "session_id": self.session_id,
+            "kind": self.kind,
+            "total_ms": round(total_s * 1000, 2),
+            "spans": self.spans,
+            "totals": {k: {"count": n, "ms": round(s * 1000, 2)} for k, (n, s) in self.totals.items()},
+        }
+
+
+def bind_session(session_id: str) -> None:
+    """Tag everything recorded from this context (and tasks it starts) with session_id."""
+    _session.set(session_id)
+
+
+def detach() -> None:
+    """
+    Call first thing in long-lived background tasks: they copy the context of whoever
+    started them, and must not keep adding spans to that turn or tag its session.
+    """
+    _session.set(None)
+    _trace.set(None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def record(stage: str, seconds: float, start: Optional[float] = None, **attrs) -> None:
+    """Report a stage that was timed elsewhere (e.g. on an engine thread)."""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, start if start is not None else time.perf_counter() - seconds, seconds, attrs)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("%s %.1f ms session=%s %s", stage, seconds * 1000, _session.get(), attrs or "")
+
+
+@contextmanager
+def span(stage: str, **attrs) -> Iterator[Dict[str, Any]]:
+    """Time the block as `stage`; the yielded dict can take attributes found inside it."""
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except asyncio.CancelledError:
+        attrs["cancelled"] = True
+        raise
+    except Exception:
+        ERRORS.inc(stage=stage)
+        attrs["error"] = True
+        raise
+    finally:
+        record(stage, time.perf_counter() - t0, t0, **attrs)
+
+
+def start_trace(kind: str) -> Trace:
+    return Trace(kind, _session.get())
+
+
+@contextmanager
+def use(trace: Trace) -> Iterator[Trace]:
+    """Make `trace` current for the block (tasks started inside keep it) without ending it."""
+    token = _trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def turn(kind: str, trace: Optional[Trace] = None) -> Iterator[Trace]:
+    """
+    One user turn. Nested calls join the turn already running in this context; the
+    outermost one records tutor_turn_seconds and writes the trace if it is sampled.
+    """
+    active = _trace.get()
+    if active is not None and trace is None:
+        yield active
+        return
+    trace = trace or start_trace(kind)
+    token = _trace.set(trace)
+    t0 = time.perf_counter()
+    try:
+        yield trace
+    finally:
+        _trace.reset(token)
+        elapsed = time.perf_counter() - t0
+        TURN_SECONDS.observe(elapsed, kind=trace.kind)
+        _maybe_dump(trace, elapsed)
+
+
+def _maybe_dump(trace: Trace, elapsed: float) -> None:
+    cfg = _settings()
+    slow = cfg["slow_s"] > 0 and elapsed >= cfg["slow_s"]
+    if not slow and (cfg["sample"] <= 0 or random.random() >= cfg["sample"]):
+        return
+    # Voice traces start at the first audio chunk, so total_ms includes the speaking time.
+    line = json.dumps(trace.as_dict(time.perf_counter() - trace.t0))
+    path = Path(cfg["dir"]) / time.strftime("turns-%Y%m%d.jsonl")
+    try:
+        asyncio.get_running_loop().run_in_executor(None, _append, path, line)
+    except RuntimeError:
+        _append(path, line)
+
+
+def _append(path: Path, line: str) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        log.warning("Could not write trace to %s: %s", path, e)
@@ -2,15 +2,99 @@ import asyncio
 import base64
 import json
 import uuid
-import sys
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 from app.services.memory_service import MemoryService
-from app.services.speech_service import transcribe_audio_bytes
-from app.services.tts_service import piper_tts_async
+from app.services.stt_worker import get_stt_worker
+from app.services.stt_stream import SAMPLE_RATE, SpeechStream
+from app.services.tts_pipeline import TTSPipeline
+from app.services.audio_transport import negotiate
 from app.services.llm_service import generate_stream 
-from app.services.teaching_engine import TeachingState
-from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS, SYSTEM_PROMPT
+from app.services.teaching_engine import ASK, IDLE, TeachingState, get_check_answer_prompt, get_correction_prompt
+from app.services.grading import grade_answer
+from app.services.context_builder import ContextBuilder
+from app.services.response_cache import get_response_cache, replay
+from app.services.admission import get_admission
+from app.services.lesson_pack import Lesson, find_lesson
+from app.services.tts_service import piper_tts_async
+from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS, OPENING_PROMPT, SYSTEM_PROMPT
+from app import metrics, tracing
+from app.config import get_settings
+from app.log import get_logger
+
+log = get_logger("ws")
+
+CANCELLED = metrics.counter("tutor_turns_cancelled_total", "Replies cut off before they finished", ["reason"])
+
+
+class Turn:
+    """
+    One reply on a connection, run as its own task so the socket keeps being read, and
+    in flight until its frames are sent. A newer turn, the student starting to speak, or
+    a disconnect cancels it: the token stream is closed (the engine stops at its next
+    token), the TTS pipeline aborts its Piper work, the admission slot is released, and
+    the turn's frames still queued in the OutputChannel are dropped.
+    """
+
+    def __init__(self, kind: str, trace: tracing.Trace, task: asyncio.Task):
+        self.kind = kind
+        self.trace = trace
+        self.task = task
+
+    async def cancel(self, out=None) -> Optional[int]:
+        """
+        Cancel the task, wait for it to unwind and drop its queued frames; returns frames
+        dropped, or None if the turn had already finished and been sent.
+        """
+        running = not self.task.done()
+        if running:
+            self.task.cancel()
+            # wait() rather than awaiting the task: only our caller's own cancellation may propagate.
+            await asyncio.wait({self.task})
+        # A finished reply may still have audio queued for a slow client; that goes too.
+        dropped = out.cancel_turn(self.trace) if out is not None else 0
+        return dropped if running or dropped else None
+
+
+async def cancel_turn(state: Dict[str, Any], reason: str, send_fn=None) -> bool:
+    """Cancel the connection's reply in flight, if any; the client is told unless send_fn is None."""
+    turn = state.pop("turn", None)
+    if turn is None:
+        return False
+    dropped = await turn.cancel(state.get("out"))
+    if dropped is None:
+        return False
+    CANCELLED.inc(reason=reason)
+    log.info("Cancelled %s turn (%s), dropped %d queued frame(s)", turn.kind, reason, dropped)
+    if send_fn is not None:
+        await send_fn({"type": "turn_cancelled", "reason": reason})
+    return True
+
+
+async def _start_turn(kind: str, run, send_fn, state: Dict[str, Any], trace: Optional[tracing.Trace] = None) -> None:
+    """Cancel the reply in flight and run `run()` as the connection's new turn, in the background."""
+    # Loop: another turn may have been started while the previous one was unwinding.
+    while "turn" in state:
+        await cancel_turn(state, "superseded", send_fn)
+    trace = trace or tracing.start_trace(kind)
+
+    async def body() -> None:
+        with tracing.turn(kind, trace):
+            try:
+                await run()
+            except asyncio.CancelledError:
+                ts = state.get("teaching_state")
+                # Cut off mid-step: an open question still stands, anything else starts over.
+                if ts is not None and ts.phase != ASK:
+                    ts.abort()
+                raise
+            except Exception as e:
+                tracing.ERRORS.inc(stage="ws")
+                log.error("Turn failed: %s", e)
+                await send_fn({"type": "error", "message": str(e)})
+                await send_fn({"type": "avatar", "state": "idle"})
+
+    state["turn"] = Turn(kind, trace, asyncio.create_task(body()))
 
 async def handle_ws_message(raw: str | bytes, send_fn, state: Dict[str, Any]) -> None:
     if isinstance(raw, bytes):
@@ -26,87 +110,344 @@ async def handle_ws_message(raw: str | bytes, send_fn, state: Dict[str, Any]) ->
     msg_type = data.get("type") or ""
     
     if msg_type == "start_session":
-        await _handle_start_session(send_fn, state)
+        await _handle_start_session(data.get("audio"), data.get("student_id"), send_fn, state)
     elif msg_type == "start_concept":
         concept = (data.get("concept") or "").strip() or "programming"
-        print(f"DEBUG: Starting concept: {concept}")
-        await _handle_start_concept(concept, send_fn, state)
+        log.debug("Starting concept: %s", concept)
+        _ensure_state(state)
+        await _start_turn("concept", lambda: _handle_start_concept(concept, send_fn, state), send_fn, state)
     elif msg_type == "user_text":
         text = (data.get("text") or "").strip()
         if text:
-            await _handle_user_text(text, send_fn, state)
+            _ensure_state(state)
+            await _start_turn("text", lambda: _handle_user_text(text, send_fn, state), send_fn, state)
+    elif msg_type == "audio_chunk":
+        # JSON fallback for clients that cannot send binary frames
+        try:
+            chunk = base64.b64decode(data.get("data") or "")
+        except ValueError:
+            await send_fn({"type": "error", "message": "Invalid audio_chunk data"})
+            return
+        if chunk:
+            await _handle_audio(chunk, send_fn, state)
+    elif msg_type == "audio_end":
+        stream = state.get("speech")
+        if stream is not None:
+            stream.end()
 
 def _ensure_state(state: Dict[str, Any]) -> None:
     if "session_id" not in state:
         state["session_id"] = str(uuid.uuid4())
+        tracing.bind_session(state["session_id"])
     if "memory" not in state:
         state["memory"] = MemoryService()
     if "teaching_state" not in state:
         state["teaching_state"] = TeachingState()
+    if "context" not in state:
+        settings = get_settings()
+        state["context"] = ContextBuilder(
+            state["memory"],
+            state["session_id"],
+            n_ctx=settings.llama_n_ctx,
+            related_k=settings.semantic_related_k,
+            related_min_score=settings.semantic_min_score,
+        )
 
-async def _handle_start_session(send_fn, state: Dict[str, Any]) -> None:
+async def _handle_start_session(audio_offer, student_id, send_fn, state: Dict[str, Any]) -> None:
     _ensure_state(state)
+    if isinstance(student_id, str) and student_id.strip():
+        # Opt-in recall: only sessions linked to the same student feed related memories.
+        state["context"].student_id = student_id.strip()
+        await state["memory"].link_student(state["session_id"], student_id.strip())
+    # Binary TTS audio if the client offered a format we support; JSON tts_chunk otherwise.
+    settings = get_settings()
+    state["audio_format"] = negotiate(audio_offer, settings.tts_chunk_ms, settings.tts_opus_bitrate)
     await send_fn({"type": "avatar", "state": "idle"})
-    await send_fn({
+    ready = {
         "type": "ready",
         "session_id": state["session_id"],
         "example_concepts": EXAMPLE_CONCEPTS,
-    })
+    }
+    if state["audio_format"] is not None:
+        ready["audio"] = state["audio_format"].describe()
+    await send_fn(ready)
+
+async def _handle_audio(chunk: bytes, send_fn, state: Dict[str, Any]) -> None:
+    """
+    Feed one chunk of the current utterance. The first chunk opens a SpeechStream; it
+    sends partial_transcript frames while audio arrives and, on end-of-utterance, the
+    final transcript goes straight into _handle_user_text.
+    """
+    _ensure_state(state)
+    stream = state.get("speech")
+    if stream is None or stream.done:
+        # The student started speaking: barge in on the reply still playing.
+        await cancel_turn(state, "speech", send_fn)
+        settings = get_settings()
+
+        async def transcribe(audio, prompt):
+            with tracing.span("stt", audio_s=round(len(audio) / SAMPLE_RATE, 2)):
+                return await get_stt_worker().transcribe(audio, prompt)
+
+        async def on_partial(text: str) -> None:
+            await send_fn({"type": "partial_transcript", "text": text})
+
+        # One trace per utterance: STT spans while the user speaks, then the reply.
+        trace = tracing.start_trace("voice")
+
+        async def on_final(text: str) -> None:
+            if state.get("speech") is stream:
+                state["speech"] = None
+            await send_fn({"type": "transcript", "text": text})
+            if text:
+                await _start_turn("voice", lambda: _handle_user_text(text, send_fn, state), send_fn, state, trace)
+                return
+            with tracing.turn("voice", trace):
+                await send_fn({"type": "avatar", "state": "idle"})
+
+        async def on_error(e: Exception) -> None:
+            if state.get("speech") is stream:
+                state["speech"] = None
+            with tracing.turn("voice", trace):
+                await send_fn({"type": "error", "message": f"Transcription failed: {e}"})
+                await send_fn({"type": "avatar", "state": "idle"})
+
+        stream = SpeechStream(
+            transcribe,
+            on_partial,
+            on_final,
+            on_error=on_error,
+            window_s=settings.stt_window_s,
+            overlap_s=settings.stt_overlap_s,
+            step_s=settings.stt_step_s,
+            silence_s=settings.stt_silence_ms / 1000,
+            idle_s=settings.stt_idle_ms / 1000,
+            ffmpeg_bin=settings.ffmpeg_bin,
+            raw_pcm=settings.stt_input == "pcm",
+        )
+        state["speech"] = stream
+        await send_fn({"type": "avatar", "state": "listening"})
+        # The stream's task starts on the first feed and keeps this turn's context.
+        with tracing.use(trace):
+            await stream.feed(chunk)
+        return
+    await stream.feed(chunk)
 
 async def _handle_start_concept(concept: str, send_fn, state: Dict[str, Any]) -> None:
     _ensure_state(state)
     ts = state["teaching_state"]
-    ts.current_concept = concept
-    ts.waiting_for_answer = False
+    ts.start(concept)
     
-    prompt = f"Explain {concept} in one sentence and ask me a short question."
-    await _stream_assistant_response(prompt, send_fn, state)
+    prompt = OPENING_PROMPT.format(concept=concept)
+    reply = await _stream_assistant_response(
+        prompt, send_fn, state, user_text=concept,
+        cache=("concept", concept, get_settings().response_cache_ttl_s),
+        lesson=find_lesson(concept),
+    )
+    if reply is None:
+        ts.abort()
+    else:
+        ts.replied(reply)
 
 async def _handle_user_text(text: str, send_fn, state: Dict[str, Any]) -> None:
     _ensure_state(state)
     ts = state["teaching_state"]
+    if ts.expects_answer(text):
+        await _grade_and_reply(text, send_fn, state)
+        return
     prompt = f"The user said: {text}. Respond briefly."
-    await _stream_assistant_response(prompt, send_fn, state)
+    cache = None
+    if ts.phase == IDLE and text.rstrip().endswith("?"):
+        # A standalone question ("what is recursion?") gets the same answer whoever asks it.
+        cache = ("question", f"{ts.current_concept or ''}|{text}", get_settings().response_cache_question_ttl_s)
+    reply = await _stream_assistant_response(prompt, send_fn, state, user_text=text, cache=cache)
+    if reply is not None:
+        ts.replied(reply)
 
-async def _stream_assistant_response(user_prompt: str, send_fn, state: Dict[str, Any]) -> None:
+async def _grade_and_reply(answer: str, send_fn, state: Dict[str, Any]) -> None:
+    """
+    Grade the answer to the open question with one forward pass, then stream only the
+    short praise or correction (which asks the next question).
+    """
+    ts = state["teaching_state"]
+    sid = state["session_id"]
+    question = ts.last_question
+    ts.grading()
+    try:
+        system, history = await state["context"].build(SYSTEM_PROMPT, get_check_answer_prompt(question, answer), 1)
+        verdict = await grade_answer(question, answer, system, history, session_id=sid)
+    except Exception as e:
+        log.error("Grading failed: %s", e)
+        ts.abort()
+        reply = await _stream_assistant_response(
+            f"The user said: {answer}. Respond briefly.", send_fn, state, user_text=answer
+        )
+        if reply is not None:
+            ts.replied(reply)
+        return
+
+    log.info("Graded answer: correct=%s confidence=%.2f (%.0f ms)", verdict.correct, verdict.confidence, verdict.ms)
+    await send_fn({"type": "grade", "correct": verdict.correct, "confidence": verdict.confidence, "ms": verdict.ms})
+    await state["memory"].record_turn(sid, "question", ts.current_concept, answer, verdict.correct)
+    ts.graded(verdict.correct)
+
+    prompt = get_correction_prompt(ts.current_concept, question, answer, verdict.correct)
+    reply = await _stream_assistant_response(
+        prompt, send_fn, state, user_text=answer, max_tokens=get_settings().grade_reply_tokens
+    )
+    if reply is None:
+        ts.abort()
+    else:
+        ts.replied(reply)
+
+async def _stream_assistant_response(
+    user_prompt: str, send_fn, state: Dict[str, Any], max_tokens: int = 128,
+    cache: Optional[Tuple[str, str, float]] = None, lesson: Optional[Lesson] = None,
+    user_text: Optional[str] = None,
+) -> Optional[str]:
+    """
+    Stream one generated reply (tokens + TTS); returns its text, or None if generation failed.
+    `user_prompt` is what the LLM sees; `user_text` is what the student typed or picked, and is
+    what the history stores (nothing for a reply the student did not ask for).
+    With cache=(kind, key, ttl_s) the reply may come from the response cache instead of the LLM;
+    a packed `lesson` is replayed with its pre-synthesized audio.
+    """
     _ensure_state(state)
-    mem = state["memory"]
     sid = state["session_id"]
+    ctx = state["context"]
 
     # 1. Show avatar talking immediately
     await send_fn({"type": "avatar", "state": "talking"})
     await send_fn({"type": "assistant_text", "text": "Thinking..."}) 
 
-    print(f"\n[LLM] Processing: {user_prompt}")
+    log.info("Processing: %s", user_prompt)
+
+    replies = get_response_cache() if cache is not None and lesson is None else None
+    hit = None
+    if replies is not None:
+        with tracing.span("response_cache") as sp:
+            hit = await replies.lookup(cache[0], cache[1])
+            sp["tier"] = hit.tier or "miss"
+
+    admission = ticket = None
+    synthesize = piper_tts_async
+    if lesson is not None:
+        stream = replay(lesson.text)
+        synthesize = lesson.synthesizer(piper_tts_async)
+    elif hit is not None and hit.text is not None:
+        stream = replay(hit.text)
+    else:
+        # Generation is what overloads the node; replays above skip admission.
+        admission = get_admission()
+        if admission is not None:
+            with tracing.span("admission") as sp:
+                ticket = await admission.admit(
+                    max_tokens, on_wait=lambda pos, eta: send_fn({"type": "busy", "position": pos, "eta_s": eta})
+                )
+                sp["level"] = admission.level
+            if ticket is None:
+                await send_fn({"type": "busy", "refused": True, "retry_after_s": admission.eta(1)})
+                await send_fn({"type": "avatar", "state": "idle"})
+                return None
+            max_tokens = ticket.max_tokens
+        # Stored history that fits the token budget; older turns live in the rolling summary.
+        # A reply bound for the response cache is served to other sessions, so it is
+        # generated from the system prompt alone, without this session's history or memories.
+        with tracing.span("prompt_assembly") as sp:
+            if hit is not None:
+                system, history = SYSTEM_PROMPT, []
+            else:
+                system, history = await ctx.build(SYSTEM_PROMPT, user_prompt, max_tokens)
+            sp["messages"] = len(history)
+        stream = generate_stream(
+            user_prompt, system, history, max_tokens=max_tokens, session_id=sid,
+            model_path=ticket.model_path if ticket is not None else None,
+        )
+    try:
+        return await _send_reply(user_text, stream, synthesize, send_fn, state, hit, cache, admission, ticket)
+    finally:
+        if ticket is not None:
+            admission.release(ticket)
+
+async def _send_reply(
+    user_text: Optional[str], stream, synthesize, send_fn, state: Dict[str, Any],
+    hit, cache: Optional[Tuple[str, str, float]], admission, ticket,
+) -> Optional[str]:
+    """Stream tokens (and TTS unless degraded to text) to the client and store the reply."""
+    mem = state["memory"]
+    sid = state["session_id"]
     full_response = ""
 
+    # Sentences are handed to Piper as soon as they complete, so audio for the
+    # first sentence is playing while the LLM is still generating the rest.
+    settings = get_settings()
+    tts = None
+    if ticket is None or ticket.tts:
+        tts = TTSPipeline(
+            send_fn,
+            min_chars=settings.tts_min_segment_chars,
+            max_chars=settings.tts_max_segment_chars,
+            synthesize=synthesize,
+            audio_format=state.get("audio_format"),
+        )
+    # Tokens go through the connection's OutputChannel, which coalesces them into
+    # frames and applies backpressure; without one, each token is its own frame.
+    out = state.get("out")
+
     try:
-        # We pass EMPTY history [] to speed up the i3 processor for now
-        async for token in generate_stream(user_prompt, SYSTEM_PROMPT, []):
-            full_response += token
-            # Send word to UI
-            await send_fn({"type": "token", "text": token})
-            # Print to terminal so we can see progress without the browser
-            print(token, end="", flush=True)
-            await asyncio.sleep(0.01) 
-            
+        try:
+            async for token in stream:
+                if not full_response:
+                    # Stored once the reply starts, so a turn cut off before it leaves no unanswered message.
+                    if user_text is not None:
+                        await mem.append_message(sid, "user", user_text)
+                    if ticket is not None:
+                        admission.first_token(ticket)
+                full_response += token
+                if out is not None:
+                    await out.token(token)
+                else:
+                    await send_fn({"type": "token", "text": token, "count": 1})
+                if tts is not None:
+                    tts.feed(token)
+        finally:
+            # Also when cancelled mid-send: closing the stream cancels its engine job.
+            await stream.aclose()
+
+    except asyncio.CancelledError:
+        if tts is not None:
+            await tts.cancel()
+        if full_response:
+            # What the student already saw stays in the history, which keeps user/assistant alternating.
+            await mem.append_message(sid, "assistant", full_response)
+        raise
     except Exception as e:
-        print(f"\n[ERROR] LLM failed: {e}")
+        if tts is not None:
+            await tts.cancel()
+        log.error("LLM failed: %s", e)
         await send_fn({"type": "error", "message": str(e)})
-        return
+        return None
 
-    print("\n[LLM] Done.")
+    log.debug("Reply: %s", full_response)
+    # A reply cut short or from the fallback model is not worth serving again.
+    degraded = ticket is not None and ("short" in ticket.modes or "fallback" in ticket.modes)
+    if hit is not None and hit.text is None and not degraded:
+        get_response_cache().store(hit, full_response, cache[2])
 
-    # 2. Memory & Audio (Audio happens AFTER text to prevent CPU overload)
     await mem.append_message(sid, "assistant", full_response)
-    
-    try:
-        print("[TTS] Generating audio...")
-        audio_data = await piper_tts_async(full_response)
-        wav_b64 = base64.b64encode(audio_data).decode("ascii")
-        await send_fn({"type": "tts_chunk", "data": wav_b64})
-        print("[TTS] Sent to frontend.")
-    except Exception as e:
-        print(f"[TTS] Error: {e}")
 
-    await send_fn({"type": "avatar", "state": "idle"})
\ No newline at end of file
+    # Remaining segments (usually just the last sentence) finish here. Decoding ends well
+    # before the audio does, so most barge-ins land in this wait.
+    if tts is not None:
+        try:
+            segments = await tts.finish()
+        except asyncio.CancelledError:
+            await tts.cancel()
+            raise
+        log.info("Sent %d TTS segment(s)", segments)
+
+    # Queued behind this turn on the inference thread, so it never delays the reply.
+    state["context"].summarize_in_background()
+
+    await send_fn({"type": "avatar", "state": "idle"})
+    return full_response
@@ -0,0 +1,208 @@
+# backend/app/websocket/output.py — per-connection output channel with token coalescing and flow control
+#
+# Everything the server sends on one WebSocket goes through an OutputChannel. A single
+# writer task drains its queue in order; each `ws.send_*` awaits the transport drain, so
+# the queue grows exactly when the client (or network) is slower than we produce. That
+# depth is what the channel watches:
+#   - tokens are buffered and sent as one `token` frame per `flush_ms` window or per
+#     `max_frame_bytes`, and merged into a still-queued token frame instead of adding one;
+#   - superseded frames (e.g. an older `partial_transcript`) are dropped from the queue;
+#   - a cancelled turn's frames still in the queue are dropped (cancel_turn), matched by
+#     the trace each frame was queued under;
+#   - above `high_water` queued frames, producers awaiting send()/token() pause until
+#     the writer catches up, which in turn pauses decoding via the LLM's bounded queue.
+
+import asyncio
+import json
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+from app import tracing
+
+Frame = Union[dict, bytes]
+
+# Only the latest of these matters to the client; queued older ones can be dropped.
+_SUPERSEDED_BY_NEWER = {"partial_transcript"}
+
+
+class OutputChannel:
+    def __init__(
+        self,
+        ws,
+        flush_ms: float = 15.0,
+        max_frame_bytes: int = 2048,
+        high_water: int = 64,
+    ):
+        self.ws = ws
+        self.flush_s = flush_ms / 1000
+        self.max_frame_bytes = max_frame_bytes
+        self.high_water = max(1, high_water)
+        # (frame, trace of the turn that produced it) so send time lands in that turn's trace
+        self._queue: Deque[Tuple[Frame, Optional[tracing.Trace]]] = deque()
+        self._wake = asyncio.Event()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._tokens: List[str] = []
+        self._token_bytes = 0
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._closed = False
+        self._sending = False   # a popped frame is still being written
+        self._writer = asyncio.create_task(self._write_loop())
+        self.stats: Dict[str, int] = {
+            "tokens": 0,
+            "token_frames": 0,
+            "frames": 0,
+            "merged": 0,
+            "dropped": 0,
+            "bytes": 0,
+            "backpressure_waits": 0,
+            "token_ns": 0,      # time spent inside token(), i.e. the channel's per-token cost
+        }
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    async def send(self, msg: Frame) -> None:
+        """Queue a frame (dict -> JSON text, bytes -> binary). Pending tokens go out first."""
+        if self._closed:
+            return
+        self._flush_tokens()
+        if isinstance(msg, dict) and msg.get("type") in _SUPERSEDED_BY_NEWER:
+            self._drop_queued(msg["type"])
+        self._enqueue(msg)
+        await self._wait_below_high_water()
+
+    async def token(self, text: str) -> None:
+        """Add one generated token; frames are cut by time window and size."""
+        t0 = time.perf_counter_ns()
+        if not self._closed and text:
+            self._tokens.append(text)
+            self._token_bytes += len(text)
+            self.stats["tokens"] += 1
+            if self._token_bytes >= self.max_frame_bytes:
+                self._flush_tokens()
+            elif self._flush_handle is None:
+                self._flush_handle = asyncio.get_running_loop().call_later(self.flush_s, self._flush_tokens)
+        self.stats["token_ns"] += time.perf_counter_ns() - t0
+        if len(self._queue) >= self.high_water:
+            await self._wait_below_high_water()
+
+    async def flush(self) -> None:
+        """Send pending tokens and wait until everything queued so far is written."""
+        self._flush_tokens()
+        while (self._queue or self._sending) and not self._closed:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def cancel_turn(self, trace: Optional[tracing.Trace]) -> int:
+        """Drop the unsent tokens and queued frames of a cancelled turn; returns frames dropped."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        # Only the turn in flight streams tokens, and it has stopped.
+        self._tokens.clear()
+        self._token_bytes = 0
+        if trace is None:
+            return 0
+        kept = deque(q for q in self._queue if q[1] is not trace)
+        dropped = len(self._queue) - len(kept)
+        self._queue = kept
+        self.stats["dropped"] += dropped
+        if len(self._queue) < self.high_water // 2:
+            self._drained.set()
+        return dropped
+
+    async def close(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        self._closed = True
+        self._wake.set()
+        self._writer.cancel()
+        try:
+            await self._writer
+        except asyncio.CancelledError:
+            pass
+        self._drained.set()
+
+    # -- internals --------------------------------------------------------------------
+
+    def _flush_tokens(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._tokens:
+            return
+        text, count = "".join(self._tokens), len(self._tokens)
+        self._tokens.clear()
+        self._token_bytes = 0
+        # The writer has not picked up the previous token frame yet: grow it instead.
+        last = self._queue[-1][0] if self._queue else None
+        if isinstance(last, dict) and last.get("type") == "token" and len(last["text"]) < self.max_frame_bytes:
+            last["text"] += text
+            last["count"] += count
+            self.stats["merged"] += count
+            return
+        self._enqueue({"type": "token", "text": text, "count": count})
+        self.stats["token_frames"] += 1
+
+    def _drop_queued(self, msg_type: str) -> None:
+        kept = deque(q for q in self._queue if not (isinstance(q[0], dict) and q[0].get("type") == msg_type))
+        self.stats["dropped"] += len(self._queue) - len(kept)
+        self._queue = kept
+
+    def _enqueue(self, frame: Frame) -> None:
+        self._queue.append((frame, tracing.current_trace()))
+        self._wake.set()
+
+    async def _wait_below_high_water(self) -> None:
+        if len(self._queue) < self.high_water or self._closed:
+            return
+        self.stats["backpressure_waits"] += 1
+        while len(self._queue) >= self.high_water // 2 and not self._closed:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def _write_loop(self) -> None:
+        while True:
+            if not self._queue:
+                self._drained.set()
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+            frame, trace = self._queue.popleft()
+            self._sending = True
+            t0 = time.perf_counter()
+            try:
+                if isinstance(frame, bytes):
+                    await self.ws.send_bytes(frame)
+                    self.stats["bytes"] += len(frame)
+                else:
+                    data = json.dumps(frame)
+                    await self.ws.send_text(data)
+                    self.stats["bytes"] += len(data)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # Client went away: stop writing, release any waiting producers.
+                tracing.ERRORS.inc(stage="ws_send")
+                self._closed = True
+                self._queue.clear()
+                self._drained.set()
+                return
+            finally:
+                self._sending = False
+            dt = time.perf_counter() - t0
+            tracing.STAGE_SECONDS.observe(dt, stage="ws_send")
+            if trace is not None:
+                trace.accumulate("ws_send", dt)
+            self.stats["frames"] += 1
+            if len(self._queue) < self.high_water // 2:
+                self._drained.set()
+
+    def summary(self) -> Dict[str, Any]:
+        s = dict(self.stats)
+        s["ns_per_token"] = round(s["token_ns"] / s["tokens"], 1) if s["tokens"] else None
+        return s
@@ -10,8 +10,49 @@ CREATE TABLE IF NOT EXISTS conversations (
   created_at TEXT DEFAULT (datetime('now'))
 );
 
+-- (session_id) carries the rowid, so it is the (session_id, id) index that history reads
+-- walk backwards and that the compactor uses to find each session's last message.
 CREATE INDEX IF NOT EXISTS idx_conversations_session ON conversations(session_id);
-CREATE INDEX IF NOT EXISTS idx_conversations_created ON conversations(created_at);
+-- No query filters on created_at alone; the index only cost a b-tree insert per message.
+DROP INDEX IF EXISTS idx_conversations_created;
+
+-- Idle sessions, moved out of `conversations` by app/services/archive.py: each segment is
+-- up to TUTOR_DB_ARCHIVE_SEGMENT_ROWS messages as zlib-compressed JSON [[id, role, content, created_at], ...].
+CREATE TABLE IF NOT EXISTS conversation_archive (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  session_id TEXT NOT NULL,
+  first_id INTEGER NOT NULL,
+  last_id INTEGER NOT NULL,
+  messages INTEGER NOT NULL,
+  started_at TEXT,
+  ended_at TEXT,
+  codec TEXT NOT NULL DEFAULT 'zlib-json',
+  body BLOB NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_archive_session ON conversation_archive(session_id, last_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_archive_ended ON conversation_archive(ended_at);
+
+-- Archived message id -> its segment (semantic-index hits and search results resolve through it).
+CREATE TABLE IF NOT EXISTS conversation_archive_map (
+  id INTEGER PRIMARY KEY,
+  segment_id INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_conversation_archive_map_segment ON conversation_archive_map(segment_id);
+
+-- Full-text index over archived messages (rowid = message id); contentless, the text lives in the segments.
+CREATE VIRTUAL TABLE IF NOT EXISTS conversation_archive_fts USING fts5(content, content='');
+
+-- Sessions a client linked to a student (start_session.student_id). Semantic recall of
+-- earlier conversations only reaches sessions of the same student.
+CREATE TABLE IF NOT EXISTS student_sessions (
+  session_id TEXT PRIMARY KEY,
+  student_id TEXT NOT NULL,
+  created_at TEXT DEFAULT (datetime('now'))
+);
+
+CREATE INDEX IF NOT EXISTS idx_student_sessions_student ON student_sessions(student_id);
 
 -- Topic strength (weak/strong) for spaced repetition / personalization
 CREATE TABLE IF NOT EXISTS topics (
@@ -0,0 +1,138 @@
+# backend/scripts/bench_speculative.py — compare speculative decoding modes on the tutor prompts
+#
+# Loads the GGUF once per mode and generates greedy replies to the EXAMPLE_CONCEPTS
+# prompts (same system prompt and template as the WebSocket handler). Greedy output must
+# be identical across modes, so the script also checks that and reports mismatches.
+#
+#   python backend/scripts/bench_speculative.py --modes off prompt_lookup
+#   python backend/scripts/bench_speculative.py --modes off prompt_lookup draft \
+#       --draft-model models/llama/tinyllama-1.1b.Q4_K_M.gguf --json spec.json
+import argparse
+import gc
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings
+from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS, OPENING_PROMPT, SYSTEM_PROMPT
+from app.services.llm_service import build_messages, create_llm, format_for_llama
+from app.services.speculative import MODES, make_drafter
+
+
+def prompts(turns: int):
+    """The concept explanation, then a follow-up that quotes it back (the common tutor shape)."""
+    out = []
+    for concept in EXAMPLE_CONCEPTS:
+        history = [("user", OPENING_PROMPT.format(concept=concept))]
+        out.append((concept, history))
+        if turns > 1:
+            out.append((concept, history + [
+                ("assistant", f"{concept.capitalize()} is a core idea. Can you tell me what {concept} means?"),
+                ("user", f"The user said: I think {concept} means something you use to solve problems. Respond briefly."),
+            ]))
+    return out
+
+
+def run_mode(mode: str, args) -> dict:
+    s = get_settings()
+    drafter = make_drafter(
+        mode,
+        draft_model_path=args.draft_model,
+        num_pred_tokens=args.draft_tokens,
+        ngram_size=args.ngram_size,
+        # Raw mode speed unless --adaptive: never pause drafting.
+        min_accept=s.llm_spec_min_accept if args.adaptive else 0.0,
+        n_ctx=s.llama_n_ctx,
+    )
+    t_load = time.perf_counter()
+    llm = create_llm(args.model, draft_model=drafter)
+    load_s = time.perf_counter() - t_load
+
+    rows = []
+    for concept, history in prompts(args.turns):
+        text = format_for_llama(build_messages(SYSTEM_PROMPT, history))
+        llm.reset()   # every prompt starts cold, so modes see the same prefill
+        before = drafter.counts() if drafter else (0, 0)
+        t0 = time.perf_counter()
+        first = None
+        pieces = []
+        for chunk in llm(text, stream=True, echo=False, max_tokens=args.max_tokens, temperature=0.0,
+                         stop=["[/INST]", "</s>"]):
+            if first is None:
+                first = time.perf_counter()
+            pieces.append(chunk["choices"][0].get("text", ""))
+        end = time.perf_counter()
+        n = len(pieces)
+        drafted, accepted = (a - b for a, b in zip(drafter.counts(), before)) if drafter else (0, 0)
+        rows.append({
+            "concept": concept,
+            "tokens": n,
+            "ttft_s": round((first or end) - t0, 4),
+            "decode_tok_s": round((n - 1) / (end - first), 2) if first and n > 1 and end > first else None,
+            "total_s": round(end - t0, 4),
+            "drafted": drafted,
+            "accepted": accepted,
+            "text": "".join(pieces),
+        })
+    del llm
+    gc.collect()
+
+    decode = [r["decode_tok_s"] for r in rows if r["decode_tok_s"]]
+    drafted = sum(r["drafted"] for r in rows)
+    tokens = sum(r["tokens"] for r in rows)
+    gen_s = sum(r["total_s"] for r in rows)
+    return {
+        "mode": mode,
+        "load_s": round(load_s, 2),
+        "prompts": len(rows),
+        "tokens": tokens,
+        "effective_tok_s": round(tokens / gen_s, 2) if gen_s else None,
+        "decode_tok_s_median": round(statistics.median(decode), 2) if decode else None,
+        "ttft_s_median": round(statistics.median(r["ttft_s"] for r in rows), 4),
+        "acceptance": round(sum(r["accepted"] for r in rows) / drafted, 4) if drafted else None,
+        "fallbacks": drafter.fallbacks if drafter else 0,
+        "rows": rows,
+    }
+
+
+def main():
+    s = get_settings()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=s.llama_model_path)
+    ap.add_argument("--draft-model", default=s.llm_draft_model_path)
+    ap.add_argument("--modes", nargs="+", default=["off", "prompt_lookup"], choices=MODES)
+    ap.add_argument("--max-tokens", type=int, default=128)
+    ap.add_argument("--draft-tokens", type=int, default=s.llm_draft_tokens)
+    ap.add_argument("--ngram-size", type=int, default=s.llm_ngram_size)
+    ap.add_argument("--turns", type=int, default=2, choices=(1, 2), help="1 = explanations only, 2 = plus a follow-up")
+    ap.add_argument("--adaptive", action="store_true", help="Allow the low-acceptance fallback (as in the server)")
+    ap.add_argument("--json", help="Write per-prompt results to this file")
+    args = ap.parse_args()
+    if not args.model or not Path(args.model).exists():
+        sys.exit(f"GGUF model not found: {args.model!r} (set --model or TUTOR_LLAMA_MODEL_PATH)")
+
+    results = [run_mode(m, args) for m in args.modes]
+
+    base = next((r for r in results if r["mode"] == "off"), None)
+    print(f"{'mode':>14} {'tokens':>7} {'eff tok/s':>10} {'decode tok/s':>13} {'ttft':>8} {'accept':>7} {'speedup':>8} {'same text':>10}")
+    for r in results:
+        speedup = same = ""
+        if base is not None and base["effective_tok_s"] and r["effective_tok_s"]:
+            speedup = f"{r['effective_tok_s'] / base['effective_tok_s']:.2f}x"
+            same_n = sum(a["text"] == b["text"] for a, b in zip(r["rows"], base["rows"]))
+            same = f"{same_n}/{len(r['rows'])}"
+        acc = "" if r["acceptance"] is None else f"{100 * r['acceptance']:.0f}%"
+        print(
+            f"{r['mode']:>14} {r['tokens']:>7} {r['effective_tok_s']!s:>10} {r['decode_tok_s_median']!s:>13} "
+            f"{r['ttft_s_median']:>8} {acc:>7} {speedup:>8} {same:>10}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
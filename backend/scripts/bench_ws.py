@@ -0,0 +1,350 @@
+# backend/scripts/bench_ws.py — end-to-end latency/concurrency benchmark over /ws
+#
+# N simulated students each open a WebSocket and run `--rounds` of: start_concept,
+# user_text and (with --audio) a spoken answer streamed as 250 ms audio chunks. Reported
+# per concurrency level: time-to-first-token, time-to-first-audio, STT latency, turn
+# latency (p50/p95/p99), aggregate tokens/s and event-loop lag on server and client.
+#
+# Against a running backend (real models):
+#   python backend/scripts/bench_ws.py --sessions 1 4 8 --audio --json run.json
+# Self-contained, no models needed: spawns the backend with deterministic stub engines
+# (app/services/stub_engines.py) on a free port:
+#   python backend/scripts/bench_ws.py --stub --profile cpu --sessions 1 4 8 --json run.json
+# Compare against an earlier run:
+#   python backend/scripts/bench_ws.py --stub --json new.json --baseline run.json
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import wave
+import io
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_backend = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_backend))
+
+from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS
+from app.services.loop_monitor import LoopLagMonitor, percentile
+
+ANSWERS = [
+    "I think it stores a value.",
+    "Is it the middle number?",
+    "Plants use sunlight to make sugar.",
+    "Things keep moving unless a force acts on them.",
+    "It lets programs talk to each other.",
+]
+CHUNK_S = 0.25
+
+
+def _dist(values: List[float]) -> Dict[str, Optional[float]]:
+    r = lambda v: None if v is None else round(v, 4)
+    return {
+        "n": len(values),
+        "p50": r(percentile(values, 50)),
+        "p95": r(percentile(values, 95)),
+        "p99": r(percentile(values, 99)),
+        "max": r(max(values)) if values else None,
+    }
+
+
+def _answer_wav(seconds: float, sample_rate: int = 16000) -> bytes:
+    """A voiced tone followed by 1 s of silence, as 16 kHz mono s16le WAV."""
+    voiced = int(seconds * sample_rate)
+    frames = bytearray()
+    for i in range(voiced + sample_rate):
+        v = int(6000 * math.sin(2 * math.pi * 180 * i / sample_rate)) if i < voiced else 0
+        frames += struct.pack("<h", v)
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(bytes(frames))
+    return buf.getvalue()
+
+
+class Student:
+    """One simulated student; records one dict per turn."""
+
+    def __init__(self, url: str, idx: int, audio_format: Optional[str], audio_wav: Optional[bytes],
+                 audio_seconds: float, pace: bool):
+        self.url = url
+        self.idx = idx
+        self.audio_format = audio_format
+        self.audio_wav = audio_wav
+        self.audio_seconds = audio_seconds
+        self.pace = pace
+        self.turns: List[dict] = []
+        self.errors: List[str] = []
+
+    async def run(self, rounds: int) -> None:
+        import websockets
+
+        async with websockets.connect(self.url, max_size=None) as ws:
+            start = {"type": "start_session"}
+            if self.audio_format:
+                start["audio"] = {"formats": [self.audio_format], "chunk_ms": 100}
+            await ws.send(json.dumps(start))
+            while True:
+                raw = await ws.recv()
+                if isinstance(raw, str) and json.loads(raw).get("type") == "ready":
+                    break
+            for r in range(rounds):
+                concept = EXAMPLE_CONCEPTS[(self.idx + r) % len(EXAMPLE_CONCEPTS)]
+                await self._turn(ws, "concept", {"type": "start_concept", "concept": concept})
+                answer = ANSWERS[(self.idx + r) % len(ANSWERS)]
+                await self._turn(ws, "text", {"type": "user_text", "text": answer})
+                if self.audio_wav is not None:
+                    await self._audio_turn(ws)
+
+    async def _turn(self, ws, kind: str, msg: dict) -> None:
+        t0 = time.perf_counter()
+        await ws.send(json.dumps(msg))
+        await self._collect(ws, kind, lambda: t0)
+
+    async def _audio_turn(self, ws) -> None:
+        """Stream the answer WAV in real time; latencies count from the end of speech."""
+        step = int(16000 * CHUNK_S) * 2
+        data = self.audio_wav
+        voiced_end = 44 + int(self.audio_seconds * 16000) * 2
+        marks = {}
+
+        async def sender():
+            for i in range(44, len(data), step):
+                # First chunk carries the WAV header.
+                await ws.send(data[: i + step] if i == 44 else data[i : i + step])
+                if "speech_end" not in marks and i + step >= voiced_end:
+                    marks["speech_end"] = time.perf_counter()
+                if self.pace:
+                    await asyncio.sleep(CHUNK_S)
+            await ws.send(json.dumps({"type": "audio_end"}))
+
+        send_task = asyncio.create_task(sender())
+        try:
+            await self._collect(ws, "audio", lambda: marks["speech_end"])
+        finally:
+            await send_task
+
+    async def _collect(self, ws, kind: str, origin) -> None:
+        """Read frames until the turn ends (avatar idle); `origin()` is the turn's start time."""
+        seen: Dict[str, float] = {}
+        tokens = frames = 0
+        while True:
+            raw = await ws.recv()
+            now = time.perf_counter()
+            if isinstance(raw, bytes):
+                seen.setdefault("ttfa", now)
+                continue
+            msg = json.loads(raw)
+            t = msg.get("type")
+            if t == "token":
+                seen.setdefault("ttft", now)
+                # The server coalesces tokens; `count` is how many one frame carries.
+                tokens += msg.get("count", 1)
+                frames += 1
+            elif t in ("tts_chunk", "tts_segment"):
+                seen.setdefault("ttfa", now)
+            elif t == "transcript":
+                seen.setdefault("stt", now)
+            elif t == "error":
+                self.errors.append(msg.get("message") or "error")
+                seen.setdefault("error", now)
+            elif t == "avatar" and msg.get("state") == "idle" and (kind != "audio" or "stt" in seen or "error" in seen):
+                seen["latency"] = now
+                break
+        t0 = origin()
+        turn = {"kind": kind, "tokens": tokens, "frames": frames, "ttft": None, "ttfa": None, "stt": None}
+        turn.update({k: max(0.0, v - t0) for k, v in seen.items() if k != "error"})
+        self.turns.append(turn)
+
+
+def _get_json(url: str) -> dict:
+    with urllib.request.urlopen(url, timeout=10) as r:
+        return json.loads(r.read())
+
+
+async def _server_stats(base: str, reset: bool = False) -> Optional[dict]:
+    try:
+        return await asyncio.to_thread(_get_json, f"{base}/stats" + ("?reset=1" if reset else ""))
+    except Exception:
+        return None
+
+
+async def run_level(args, n: int, audio_wav: Optional[bytes]) -> dict:
+    base = args.url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws", 1)[0]
+    await _server_stats(base, reset=True)
+    client_lag = LoopLagMonitor(interval_s=0.02)
+    client_lag.start()
+    students = [Student(args.url, i, args.audio_format, audio_wav, args.audio_seconds, not args.no_pace) for i in range(n)]
+    t0 = time.perf_counter()
+    results = await asyncio.gather(*(s.run(args.rounds) for s in students), return_exceptions=True)
+    wall = time.perf_counter() - t0
+    client_lag.stop()
+    server = await _server_stats(base)
+
+    turns = [t for s in students for t in s.turns]
+    errors = [e for s in students for e in s.errors] + [repr(r) for r in results if isinstance(r, Exception)]
+    tokens = sum(t["tokens"] for t in turns)
+    frames = sum(t["frames"] for t in turns)
+    pick = lambda key, kind=None: [t[key] for t in turns if t.get(key) is not None and (kind is None or t["kind"] == kind)]
+    return {
+        "sessions": n,
+        "turns": len(turns),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_s": round(wall, 3),
+        "tokens": tokens,
+        "aggregate_tok_s": round(tokens / wall, 2) if wall else 0.0,
+        "tokens_per_frame": round(tokens / frames, 2) if frames else None,
+        "ttft_s": _dist(pick("ttft")),
+        "ttfa_s": _dist(pick("ttfa")),
+        "stt_s": _dist(pick("stt", "audio")),
+        "turn_latency_s": _dist(pick("latency")),
+        "turn_latency_by_kind_s": {k: _dist(pick("latency", k)) for k in ("concept", "text", "audio")},
+        "server_loop_lag": (server or {}).get("loop_lag"),
+        "client_loop_lag": client_lag.snapshot(),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_stub_backend(profile: str, workdir: str) -> tuple:
+    """Start uvicorn with every engine stubbed; returns (process, ws url) once /ready is 200."""
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        "TUTOR_STUB_ENGINES": "all",
+        "TUTOR_STUB_PROFILE": profile,
+        "TUTOR_STT_INPUT": "pcm",
+        "TUTOR_DB_PATH": str(Path(workdir) / "bench.db"),
+        "TUTOR_TTS_CACHE_DIR": str(Path(workdir) / "tts_cache"),
+        "TUTOR_SEMANTIC_INDEX": "0",
+        "TUTOR_LOG_LEVEL": "WARNING",
+    })
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=str(_backend),
+        env=env,
+    )
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Stub backend exited with code {proc.returncode}")
+        try:
+            if _get_json(f"http://127.0.0.1:{port}/ready").get("ready"):
+                return proc, f"ws://127.0.0.1:{port}/ws"
+        except Exception:
+            pass
+        time.sleep(0.25)
+    proc.terminate()
+    raise RuntimeError("Stub backend did not become ready within 60 s")
+
+
+def _git_rev() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=str(_backend), text=True).strip()
+    except Exception:
+        return None
+
+
+def print_table(rows: List[dict]) -> None:
+    print(
+        f"{'sessions':>8} {'turns':>6} {'err':>4} {'tok/s':>8} {'ttft p50':>9} {'ttfa p50':>9} "
+        f"{'turn p50':>9} {'p95':>7} {'p99':>7} {'lag p99ms':>10}"
+    )
+    for r in rows:
+        lag = (r.get("server_loop_lag") or {}).get("p99_ms")
+        print(
+            f"{r['sessions']:>8} {r['turns']:>6} {r['errors']:>4} {r['aggregate_tok_s']:>8} "
+            f"{r['ttft_s']['p50']!s:>9} {r['ttfa_s']['p50']!s:>9} {r['turn_latency_s']['p50']!s:>9} "
+            f"{r['turn_latency_s']['p95']!s:>7} {r['turn_latency_s']['p99']!s:>7} {lag!s:>10}"
+        )
+
+
+def compare(rows: List[dict], baseline_path: str) -> None:
+    """Percent change vs an earlier JSON result, per concurrency level."""
+    base = json.loads(Path(baseline_path).read_text())
+    by_n = {r["sessions"]: r for r in base.get("levels", [])}
+    metrics = [
+        ("aggregate_tok_s", lambda r: r["aggregate_tok_s"]),
+        ("ttft p50", lambda r: r["ttft_s"]["p50"]),
+        ("ttfa p50", lambda r: r["ttfa_s"]["p50"]),
+        ("turn p95", lambda r: r["turn_latency_s"]["p95"]),
+        ("turn p99", lambda r: r["turn_latency_s"]["p99"]),
+    ]
+    print(f"\nvs {baseline_path} (rev {base.get('meta', {}).get('git_rev')})")
+    for r in rows:
+        old = by_n.get(r["sessions"])
+        if old is None:
+            continue
+        parts = []
+        for name, get in metrics:
+            a, b = get(old), get(r)
+            if a and b is not None:
+                parts.append(f"{name} {100 * (b - a) / a:+.1f}%")
+        print(f"  sessions={r['sessions']}: " + ", ".join(parts))
+
+
+async def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default="ws://127.0.0.1:8765/ws")
+    ap.add_argument("--sessions", type=int, nargs="+", default=[1, 4, 8])
+    ap.add_argument("--rounds", type=int, default=1, help="Turn rounds per student")
+    ap.add_argument("--audio", action="store_true", help="Add a spoken answer to each round")
+    ap.add_argument("--audio-seconds", type=float, default=2.0)
+    ap.add_argument("--no-pace", action="store_true", help="Send audio chunks as fast as possible")
+    ap.add_argument("--audio-format", default="pcm16", help="TTS format to negotiate ('' = JSON tts_chunk)")
+    ap.add_argument("--stub", action="store_true", help="Spawn a backend with stub engines (no models needed)")
+    ap.add_argument("--profile", default="cpu", help="Stub timing profile (see stub_engines.PROFILES)")
+    ap.add_argument("--json", help="Write results to this file")
+    ap.add_argument("--baseline", help="Earlier --json result to compare against")
+    args = ap.parse_args()
+
+    proc = None
+    tmp = tempfile.TemporaryDirectory(prefix="tutor-bench-") if args.stub else None
+    if args.stub:
+        # Stub STT expects raw PCM/WAV input, which is what the simulated students send.
+        proc, args.url = spawn_stub_backend(args.profile, tmp.name)
+    audio_wav = _answer_wav(args.audio_seconds) if args.audio else None
+    rows = []
+    try:
+        for n in args.sessions:
+            rows.append(await run_level(args, n, audio_wav))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(10)
+        if tmp is not None:
+            tmp.cleanup()
+
+    print_table(rows)
+    if args.baseline:
+        compare(rows, args.baseline)
+    if args.json:
+        meta = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "git_rev": _git_rev(),
+            "url": None if args.stub else args.url,
+            "stub_profile": args.profile if args.stub else None,
+            "rounds": args.rounds,
+            "audio": args.audio,
+            "audio_format": args.audio_format or None,
+        }
+        Path(args.json).write_text(json.dumps({"meta": meta, "levels": rows}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
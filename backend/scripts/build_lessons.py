@@ -0,0 +1,179 @@
+# backend/scripts/build_lessons.py — pre-generate concept openers (text + audio) into a lesson pack
+#
+# Runs OPENING_PROMPT for every concept of a catalog through the LLM engine the backend
+# would use, synthesizes the reply's TTS segments, and writes one memory-mapped pack
+# (app/services/lesson_pack.py) that the handler serves with no inference at all.
+#
+# Each finished concept is saved to <out>.parts/ right away, so an interrupted build
+# picks up where it stopped; the pack is assembled from the parts at the end.
+# Concepts run --concurrency at a time; give the engine the cores with --replicas
+# (processes) or --batch-slots (one process, batched decode), and Piper --tts-workers.
+#
+#   python backend/scripts/build_lessons.py --catalog topics.txt --replicas 4 --tts-workers 4
+#   python backend/scripts/build_lessons.py --catalog topics.jsonl --batch-slots 8 --concurrency 16
+#   python backend/scripts/build_lessons.py --no-audio          # EXAMPLE_CONCEPTS, text only
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings
+from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS, OPENING_PROMPT, SYSTEM_PROMPT
+from app.services.lesson_pack import decode_head, encode_record, key_hash, voice_key, write_pack
+from app.services.response_cache import normalize_key, replay
+
+
+def read_catalog(path: str) -> list:
+    """Concepts from a .txt (one per line), .json (list) or .jsonl ({"concept": ...} per line) file."""
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".json"):
+        items = json.loads(text)
+    elif path.endswith(".jsonl"):
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = text.splitlines()
+    concepts = [(i["concept"] if isinstance(i, dict) else i).strip() for i in items]
+    seen, out = set(), []
+    for c in concepts:
+        if c and normalize_key(c) not in seen:
+            seen.add(normalize_key(c))
+            out.append(c)
+    return out
+
+
+def part_path(work: Path, concept: str) -> Path:
+    return work / f"{key_hash(concept):016x}.rec"
+
+
+def is_done(path: Path, voice: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return decode_head(f.read(1 << 16)).get("voice") == voice
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+async def segments_for(text: str, synthesize) -> list:
+    """Cut the reply exactly as TTSPipeline will when it is replayed, then synthesize each piece."""
+    from app.services.tts_pipeline import SentenceSegmenter
+    s = get_settings()
+    seg = SentenceSegmenter(s.tts_min_segment_chars, s.tts_max_segment_chars)
+    pieces = []
+    async for token in replay(text):
+        pieces += seg.feed(token)
+    tail = seg.flush()
+    if tail:
+        pieces.append(tail)
+    if synthesize is None:
+        return []
+    audio = await asyncio.gather(*(synthesize(p) for p in pieces))
+    return list(zip(pieces, audio))
+
+
+async def build_one(concept: str, args, voice: str, synthesize) -> bytes:
+    from app.services.llm_service import generate_stream
+    prompt = OPENING_PROMPT.format(concept=concept)
+    text = ""
+    async for token in generate_stream(prompt, SYSTEM_PROMPT, [], max_tokens=args.max_tokens, temperature=args.temperature):
+        text += token
+    if not text.strip():
+        raise RuntimeError("empty reply")
+    return encode_record(concept, text, await segments_for(text, synthesize), voice=voice)
+
+
+async def run(args, concepts: list, work: Path, voice: str, synthesize) -> list:
+    todo = [c for c in concepts if not is_done(part_path(work, c), voice)]
+    print(f"{len(concepts)} concepts, {len(concepts) - len(todo)} already built, {len(todo)} to go")
+    queue: asyncio.Queue = asyncio.Queue()
+    for c in todo:
+        queue.put_nowait(c)
+    failed, done = [], [0]
+    t0 = time.perf_counter()
+
+    async def worker():
+        while not queue.empty():
+            concept = queue.get_nowait()
+            try:
+                rec = await build_one(concept, args, voice, synthesize)
+            except Exception as e:
+                failed.append(concept)
+                print(f"  failed: {concept!r}: {e}", flush=True)
+                continue
+            path = part_path(work, concept)
+            tmp = path.with_suffix(".tmp")
+            await asyncio.to_thread(tmp.write_bytes, rec)
+            os.replace(tmp, path)
+            done[0] += 1
+            rate = done[0] / (time.perf_counter() - t0)
+            print(f"  [{done[0]}/{len(todo)}] {concept[:60]}  ({rate:.2f} concepts/s)", flush=True)
+
+    await asyncio.gather(*(worker() for _ in range(max(1, args.concurrency))))
+    return failed
+
+
+async def main_async(args) -> int:
+    from app.services.llm_service import shutdown_llm
+    from app.services.tts_service import get_piper_pool, piper_tts_async, shutdown_piper_pools
+
+    concepts = read_catalog(args.catalog) if args.catalog else list(EXAMPLE_CONCEPTS)
+    out = Path(args.out)
+    work = Path(args.work_dir or str(out) + ".parts")
+    work.mkdir(parents=True, exist_ok=True)
+    voice, synthesize = "", None
+    if not args.no_audio:
+        pool = get_piper_pool()
+        await pool.start()
+        voice, synthesize = voice_key(pool.model, pool.params), piper_tts_async
+
+    try:
+        failed = await run(args, concepts, work, voice, synthesize)
+    finally:
+        shutdown_llm()
+        await shutdown_piper_pools()
+
+    built = [c for c in concepts if is_done(part_path(work, c), voice)]
+    s = get_settings()
+    meta = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "voice": voice,
+        "model": s.llama_model_path,
+        "prompt": OPENING_PROMPT,
+        "tts_min_segment_chars": s.tts_min_segment_chars,
+        "tts_max_segment_chars": s.tts_max_segment_chars,
+    }
+    n = write_pack(str(out), ((c, part_path(work, c).read_bytes()) for c in built), meta)
+    print(f"Wrote {out}: {n} concepts, {out.stat().st_size / 1e6:.1f} MB")
+    if failed:
+        print(f"{len(failed)} concept(s) failed; run again to retry them")
+        return 1
+    return 0
+
+
+def main():
+    s = get_settings()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--catalog", help=".txt / .json / .jsonl list of concepts (default: EXAMPLE_CONCEPTS)")
+    ap.add_argument("--out", default=s.lesson_pack or None, required=not s.lesson_pack)
+    ap.add_argument("--work-dir", help="Finished concepts, kept for resuming (default: <out>.parts)")
+    ap.add_argument("--concurrency", type=int, default=8, help="Concepts in flight at once")
+    ap.add_argument("--replicas", type=int, help="TUTOR_LLM_REPLICAS for this build")
+    ap.add_argument("--batch-slots", type=int, help="TUTOR_LLM_BATCH_SLOTS for this build")
+    ap.add_argument("--tts-workers", type=int, help="TUTOR_PIPER_POOL_SIZE for this build")
+    ap.add_argument("--max-tokens", type=int, default=128)
+    ap.add_argument("--temperature", type=float, default=0.7)
+    ap.add_argument("--no-audio", action="store_true", help="Text only; audio is synthesized at runtime")
+    args = ap.parse_args()
+    # Settings are read from the environment on use, so the engine picks these up.
+    for flag, name in ((args.replicas, "LLM_REPLICAS"), (args.batch_slots, "LLM_BATCH_SLOTS"), (args.tts_workers, "PIPER_POOL_SIZE")):
+        if flag is not None:
+            os.environ["TUTOR_" + name] = str(flag)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# backend/scripts/calibrate.py — measure this node and write the llama.cpp / Whisper profile
+#
+# Detects physical cores, SIMD flags, RAM and GPUs, then loads the GGUF and times prompt
+# eval over (n_batch x threads) and single-token decode over threads. The fastest
+# settings are written to data/hw_profile.json (TUTOR_HW_PROFILE), which get_settings()
+# reads at startup on a node with the same fingerprint; TUTOR_* env vars still win.
+#
+#   python backend/scripts/calibrate.py                       # full sweep, write the profile
+#   python backend/scripts/calibrate.py --threads 2 4 6 --batches 256 512 --repeats 3
+#   python backend/scripts/calibrate.py --detect-only         # hardware report, no model
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.config import get_settings
+from app.prompts.tutoring_prompts import EXAMPLE_CONCEPTS, SYSTEM_PROMPT
+from app.services import hardware
+
+# Within this fraction of the best, prefer fewer threads: cores left for Whisper and Piper.
+_TOLERANCE = 0.03
+
+
+def thread_candidates() -> list:
+    physical, logical = hardware.physical_cores(), hardware.logical_cores()
+    out = {physical, logical, max(1, physical // 2), max(1, physical - 1)}
+    n = 1
+    while n < logical:
+        out.add(n)
+        n *= 2
+    return sorted(t for t in out if 1 <= t <= logical)
+
+
+def prompt_tokens(llm, n: int) -> list:
+    text = SYSTEM_PROMPT + " " + " ".join(f"Explain {c} and ask me a question." for c in EXAMPLE_CONCEPTS)
+    tokens = llm.tokenize(text.encode("utf-8"))
+    while len(tokens) < n:
+        tokens += tokens
+    return tokens[:n]
+
+
+def load(path: str, n_ctx: int, n_batch: int, threads: int, gpu_layers: int):
+    from llama_cpp import Llama
+    return Llama(
+        model_path=path, n_ctx=n_ctx, n_batch=n_batch, n_threads=threads, n_threads_batch=threads,
+        n_gpu_layers=gpu_layers, use_mmap=True, verbose=False,
+    )
+
+
+def set_threads(llm, threads: int) -> bool:
+    """Change thread counts in place (False if this llama-cpp-python cannot)."""
+    import llama_cpp
+    fn = getattr(llama_cpp, "llama_set_n_threads", None)
+    if fn is None:
+        return False
+    fn(llm.ctx, threads, threads)
+    return True
+
+
+def time_prompt(llm, tokens: list, repeats: int) -> float:
+    """Median prompt-eval tokens/s from an empty KV cache."""
+    runs = []
+    for _ in range(repeats):
+        llm.reset()
+        t0 = time.perf_counter()
+        llm.eval(tokens)
+        runs.append(len(tokens) / (time.perf_counter() - t0))
+    return statistics.median(runs)
+
+
+def time_decode(llm, tokens: list, steps: int, repeats: int) -> float:
+    """Median single-token decode tokens/s after a short prompt (the per-token cost of a reply)."""
+    runs = []
+    for _ in range(repeats):
+        llm.reset()
+        llm.eval(tokens[:32])
+        t0 = time.perf_counter()
+        for i in range(steps):
+            llm.eval([tokens[32 + i % (len(tokens) - 32)]])
+        runs.append(steps / (time.perf_counter() - t0))
+    return statistics.median(runs)
+
+
+def best(rows: list, key: str) -> dict:
+    top = max(r[key] for r in rows)
+    return min((r for r in rows if r[key] >= top * (1 - _TOLERANCE)), key=lambda r: (r["threads"], -r[key]))
+
+
+def sweep(args, hw: dict) -> dict:
+    gpu_layers = -1 if hw["llama_gpu_offload"] and hw["accelerators"] else 0
+    n_ctx = max(args.prompt_tokens + args.decode_steps + 64, 512)
+    prompt_rows, decode_rows = [], []
+    for n_batch in args.batches:
+        llm = None
+        for threads in args.threads:
+            if llm is None or not set_threads(llm, threads):
+                llm = load(args.model, n_ctx, n_batch, threads, gpu_layers)
+                tokens = prompt_tokens(llm, args.prompt_tokens)
+                llm.eval(tokens[:64])   # page the weights in before timing
+            pp = time_prompt(llm, tokens, args.repeats)
+            prompt_rows.append({"n_batch": n_batch, "threads": threads, "tok_s": round(pp, 2)})
+            line = f"  n_batch={n_batch:<5} threads={threads:<3} prompt eval {pp:8.1f} tok/s"
+            # Decode feeds one token per step, so n_batch does not matter: measure it once.
+            if n_batch == args.batches[0]:
+                tg = time_decode(llm, tokens, args.decode_steps, args.repeats)
+                decode_rows.append({"threads": threads, "tok_s": round(tg, 2)})
+                line += f"   decode {tg:6.2f} tok/s"
+            print(line, flush=True)
+        del llm
+    pp_best = best(prompt_rows, "tok_s")
+    tg_best = best(decode_rows, "tok_s")
+    return {
+        "settings": {
+            "LLAMA_N_THREADS": tg_best["threads"],
+            "LLAMA_N_THREADS_BATCH": pp_best["threads"],
+            "LLM_N_BATCH": pp_best["n_batch"],
+            "LLAMA_N_GPU_LAYERS": gpu_layers,
+        },
+        "sweeps": {"prompt_eval": prompt_rows, "decode": decode_rows},
+        "best": {"prompt_eval_tok_s": pp_best["tok_s"], "decode_tok_s": tg_best["tok_s"]},
+    }
+
+
+def main():
+    s = get_settings()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default=s.llama_model_path)
+    ap.add_argument("--out", default=s.hw_profile if s.hw_profile not in ("", "0") else None)
+    ap.add_argument("--threads", nargs="+", type=int, default=None, help="Thread counts to try (default: around the core count)")
+    ap.add_argument("--batches", nargs="+", type=int, default=[128, 256, 512], help="n_batch values for prompt eval")
+    ap.add_argument("--prompt-tokens", type=int, default=512)
+    ap.add_argument("--decode-steps", type=int, default=32)
+    ap.add_argument("--repeats", type=int, default=2)
+    ap.add_argument("--detect-only", action="store_true", help="Print the hardware report and exit")
+    ap.add_argument("--dry-run", action="store_true", help="Measure but do not write the profile")
+    args = ap.parse_args()
+    args.threads = sorted(set(args.threads or thread_candidates()))
+    args.batches = sorted(set(args.batches))
+
+    hw = hardware.detect()
+    print(f"CPU      {hw['cpu']} ({hw['physical_cores']} physical / {hw['logical_cores']} logical cores)")
+    print(f"SIMD     {' '.join(hw['simd']) or '-'}")
+    print(f"RAM      {hw['ram_mb']} MB")
+    print(f"GPU      {', '.join(g['name'] for g in hw['accelerators']) or '-'}"
+          f" (llama.cpp offload: {'yes' if hw['llama_gpu_offload'] else 'no'}, torch CUDA: {'yes' if hw['torch_cuda'] else 'no'})")
+    if args.detect_only:
+        return
+    if not args.model or not Path(args.model).exists():
+        sys.exit(f"GGUF model not found: {args.model!r} (set --model or TUTOR_LLAMA_MODEL_PATH)")
+
+    print(f"Sweeping {args.model}: threads {args.threads}, n_batch {args.batches}")
+    t0 = time.perf_counter()
+    result = sweep(args, hw)
+    result["settings"]["WHISPER_DEVICE"] = "cuda" if hw["torch_cuda"] else "cpu"
+    profile = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "fingerprint": hardware.fingerprint(),
+        "hardware": hw,
+        "model": str(Path(args.model).resolve()),
+        "calibration_s": round(time.perf_counter() - t0, 1),
+        **result,
+    }
+    print("Best: " + ", ".join(f"TUTOR_{k}={v}" for k, v in profile["settings"].items()))
+    print(f"      prompt eval {result['best']['prompt_eval_tok_s']} tok/s, decode {result['best']['decode_tok_s']} tok/s")
+    if args.dry_run or not args.out:
+        return
+    out = Path(args.out)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(profile, indent=2))
+    print(f"Wrote {out}; the backend loads it at startup")
+
+
+if __name__ == "__main__":
+    main()
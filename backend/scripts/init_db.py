@@ -13,6 +13,7 @@ from app.services.memory_service import MemoryService
 async def main():
     svc = MemoryService()
     await svc._ensure_schema()
+    await svc.db.close()
     print("DB initialized at", svc.db_path)
 
 
@@ -0,0 +1,10 @@
+# backend/tests/conftest.py — run the suite from anywhere: `python -m pytest backend/tests`
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# A calibrated data/hw_profile.json on the dev machine must not change test settings.
+os.environ["TUTOR_HW_PROFILE"] = "0"
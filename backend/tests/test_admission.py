@@ -0,0 +1,101 @@
+# backend/tests/test_admission.py — degradation levels step up on a slow first token and back down when quiet
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import admission
+from app.services.admission import AdmissionController
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(admission, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    return now
+
+
+def slow_turn(ctrl: AdmissionController, clock, seconds: float):
+    ticket = asyncio.run(ctrl.admit(128))
+    clock[0] += seconds
+    ctrl.first_token(ticket)
+    ctrl.release(ticket)
+    return ticket
+
+
+def test_steps_up_when_p95_misses_the_slo(clock):
+    ctrl = AdmissionController(max_active=4, slo_ms=500, step_s=5)
+    clock[0] += 10
+    slow_turn(ctrl, clock, 2.0)
+    assert ctrl.modes == ["short"]
+    ticket = asyncio.run(ctrl.admit(128))
+    assert ticket.max_tokens == 64 and ticket.tts
+    ctrl.release(ticket)
+
+
+def test_levels_change_at_most_once_per_step(clock):
+    ctrl = AdmissionController(max_active=4, slo_ms=500, step_s=5)
+    clock[0] += 10
+    slow_turn(ctrl, clock, 2.0)
+    slow_turn(ctrl, clock, 2.0)
+    assert ctrl.level == 1
+    clock[0] += 5
+    slow_turn(ctrl, clock, 2.0)
+    # No fallback model configured, so "fallback" is skipped.
+    assert ctrl.modes == ["short", "text"]
+
+
+def test_steps_up_on_a_queue_with_no_first_tokens(clock):
+    ctrl = AdmissionController(max_active=2, slo_ms=500, step_s=5, queue_depth=lambda: 3)
+    clock[0] += 10
+    ticket = asyncio.run(ctrl.admit(128))
+    assert ctrl.level == 1
+    ctrl.release(ticket)
+
+
+def test_steps_down_after_a_quiet_spell(clock):
+    ctrl = AdmissionController(max_active=4, slo_ms=500, step_s=5, window_s=5)
+    clock[0] += 10
+    slow_turn(ctrl, clock, 2.0)
+    slow_turn(ctrl, clock, 2.0)
+    clock[0] += 5
+    slow_turn(ctrl, clock, 2.0)
+    assert ctrl.level == 2
+    # The slow samples have left the window; two steps' worth of quiet drops both levels at once.
+    clock[0] += 10.5
+    ticket = asyncio.run(ctrl.admit(128))
+    assert ctrl.level == 0 and ticket.max_tokens == 128
+    ctrl.release(ticket)
+
+
+def test_refuses_after_max_wait_when_full():
+    ctrl = AdmissionController(max_active=1, max_wait_s=0.05)
+
+    async def main():
+        held = await ctrl.admit(128)
+        refused = await ctrl.admit(128)
+        ctrl.release(held)
+        return refused
+
+    assert asyncio.run(main()) is None
+    assert ctrl.refused == 1 and ctrl.active == 0
+
+
+def test_leaving_busy_hands_the_new_slots_to_waiters():
+    ctrl = AdmissionController(max_active=2, levels=("busy",), max_wait_s=5)
+    ctrl.level = 1
+
+    async def main():
+        held = await ctrl.admit(128)
+        waiter = asyncio.create_task(ctrl.admit(128))
+        await asyncio.sleep(0)
+        assert ctrl.capacity == 1 and len(ctrl._waiters) == 1
+        ctrl._step(0, None, 0)
+        ticket = await asyncio.wait_for(waiter, 1)
+        ctrl.release(held)
+        ctrl.release(ticket)
+        return ticket
+
+    assert asyncio.run(main()).level == 0
+    assert ctrl.active == 0
@@ -0,0 +1,102 @@
+# backend/tests/test_archive.py — keyset paging of session history across live rows and archive segments
+
+import asyncio
+
+from app.services import archive
+from app.services.archive import ConversationArchive
+from app.services.db import close_databases
+from app.services.memory_service import MemoryService
+
+_OLD_MESSAGE = """INSERT INTO conversations (session_id, role, content, created_at)
+                  VALUES (?, ?, ?, datetime('now', '-40 days'))"""
+
+
+def test_history_pages_continue_into_the_archive(tmp_path, monkeypatch):
+    monkeypatch.setenv("TUTOR_DB_ARCHIVE_SEGMENT_ROWS", "4")
+    monkeypatch.setattr(archive, "_archive", None)
+
+    async def main():
+        mem = MemoryService(str(tmp_path / "tutor.db"))
+        await mem._ensure_schema()
+        try:
+            for i in range(10):
+                await mem.db.execute(_OLD_MESSAGE, ("s1", "user" if i % 2 == 0 else "assistant", f"m{i}"))
+            await mem.db.execute(_OLD_MESSAGE, ("s2", "user", "other session"))
+            moved = await ConversationArchive(mem.db, after_days=30, segment_rows=4).compact()
+            assert moved == 11
+            assert await mem.get_history("s1") == []
+            await mem.append_message("s1", "user", "m10")
+            await mem.append_message("s1", "assistant", "m11")
+
+            pages, before = [], None
+            while True:
+                page = await mem.get_history("s1", limit=5, before_id=before, include_archived=True)
+                if not page:
+                    break
+                pages.append([content for _, _, content in page])
+                before = page[0][0]
+            return pages
+        finally:
+            await close_databases()
+
+    pages = asyncio.run(main())
+    assert pages == [["m7", "m8", "m9", "m10", "m11"], ["m2", "m3", "m4", "m5", "m6"], ["m0", "m1"]]
+
+
+def test_archived_messages_are_searchable(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "_archive", None)
+
+    async def main():
+        mem = MemoryService(str(tmp_path / "tutor.db"))
+        await mem._ensure_schema()
+        try:
+            await mem.db.execute(_OLD_MESSAGE, ("s1", "user", "what is a binary tree"))
+            await mem.db.execute(_OLD_MESSAGE, ("s1", "assistant", "a tree where nodes have two children"))
+            arc = ConversationArchive(mem.db, after_days=30)
+            await arc.compact()
+            hits = await arc.search("binary tree")
+            return hits, await arc.search("binary tree", session_id="s2")
+        finally:
+            await close_databases()
+
+    hits, other = asyncio.run(main())
+    assert [h["content"] for h in hits] == ["what is a binary tree"]
+    assert other == []
+
+
+def test_http_history_and_search_are_scoped_to_the_student(tmp_path, monkeypatch):
+    from fastapi import HTTPException
+
+    from app import main
+
+    monkeypatch.setenv("TUTOR_DB_PATH", str(tmp_path / "tutor.db"))
+    monkeypatch.setattr(archive, "_archive", None)
+
+    async def status(coro):
+        try:
+            await coro
+        except HTTPException as e:
+            return e.status_code
+        return 200
+
+    async def run():
+        mem = MemoryService()
+        await mem._ensure_schema()
+        try:
+            for sid in ("mine", "theirs"):
+                await mem.db.execute(_OLD_MESSAGE, (sid, "user", f"binary tree question from {sid}"))
+            await mem.link_student("mine", "alice")
+            await mem.link_student("theirs", "bob")
+            await ConversationArchive(mem.db, after_days=30).compact()
+            found = await main.archive_search("binary tree", student_id="alice")
+            return (
+                [h["session_id"] for h in found["results"]],
+                await status(main.session_messages("mine", student_id="alice")),
+                await status(main.session_messages("theirs", student_id="alice")),
+                await status(main.session_messages("mine")),
+                await status(main.archive_search("binary tree")),
+            )
+        finally:
+            await close_databases()
+
+    assert asyncio.run(run()) == (["mine"], 200, 404, 403, 403)
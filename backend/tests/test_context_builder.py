@@ -0,0 +1,55 @@
+# backend/tests/test_context_builder.py — per-session context stays out of the pinned system prefix
+
+import asyncio
+
+from app.prompts.tutoring_prompts import SYSTEM_PROMPT
+from app.services.context_builder import ContextBuilder
+from app.services.llm_service import build_messages, format_for_llama, system_prefix
+
+
+class FakeMemory:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def get_history(self, session_id, limit=200, before_id=None, include_archived=False):
+        return self.rows[-limit:]
+
+
+def prompt_for(summary: str, related=()):
+    ctx = ContextBuilder(FakeMemory([(1, "user", "What is a loop?"), (2, "assistant", "It repeats code.")]), "s1", n_ctx=2048)
+    ctx.summary = summary
+
+    async def fake_related(prompt):
+        return list(related)
+
+    ctx.related = fake_related
+    system, history = asyncio.run(ctx.build(SYSTEM_PROMPT, "And recursion?", 128))
+    return system, format_for_llama(build_messages(system, history + [("user", "And recursion?")]))
+
+
+def test_summary_and_related_follow_the_fixed_prefix():
+    # Regression: the summary used to be appended to the system prompt, so every session
+    # keyed (and pinned) a KV prefix of its own.
+    prefix = system_prefix(SYSTEM_PROMPT)
+    for summary, related in (("", ()), ("Student knows loops.", ()), ("Other.", ("recursion: calls itself",))):
+        system, prompt = prompt_for(summary, related)
+        assert system == SYSTEM_PROMPT
+        assert prompt.startswith(prefix)
+        assert summary in prompt[len(prefix):]
+        for r in related:
+            assert r in prompt[len(prefix):]
+
+
+def test_context_note_comes_before_the_history():
+    _, prompt = prompt_for("Student knows loops.", ("recursion: calls itself",))
+    rest = prompt[len(system_prefix(SYSTEM_PROMPT)):]
+    assert rest.index("Summary of the conversation so far") < rest.index("From earlier sessions") < rest.index("What is a loop?")
+
+
+def test_history_is_trimmed_to_the_budget():
+    rows = [(i, "user" if i % 2 else "assistant", "word " * 50) for i in range(1, 41)]
+    ctx = ContextBuilder(FakeMemory(rows), "s1", n_ctx=512)
+    _, history = asyncio.run(ctx.build(SYSTEM_PROMPT, "Next?", 128))
+    assert 0 < len(history) < len(rows)
+    assert history[0][0] == "user"
+    assert ctx._overflow and ctx._overflow[-1][0] < rows[-len(history)][0]
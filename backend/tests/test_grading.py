@@ -0,0 +1,67 @@
+# backend/tests/test_grading.py — verdicts from label log-probabilities
+
+import numpy as np
+import pytest
+
+from app.services import grading
+from app.services.grading import ANSWER_LABELS, classify_logits, to_verdict
+
+
+def test_verdict_follows_the_more_likely_label():
+    v = to_verdict({"correct": np.log(0.6), "incorrect": np.log(0.2)}, 1.234)
+    assert v.correct is True
+    assert v.confidence == 0.75
+    assert v.ms == 1.23
+
+
+def test_tie_is_graded_incorrect():
+    v = to_verdict({"correct": -1.0, "incorrect": -1.0}, 0.0)
+    assert v.correct is False
+    assert v.confidence == 0.5
+
+
+def test_no_scored_label_raises_for_the_fallback():
+    with pytest.raises(ValueError):
+        to_verdict({"correct": float("-inf"), "incorrect": float("-inf")}, 0.0)
+    with pytest.raises(ValueError):
+        to_verdict({}, 0.0)
+
+
+class FakeLlm:
+    """Records how the prompt is evaluated; logits favour token 1 ("Yes")."""
+
+    def __init__(self):
+        self.generated = []
+        self.n_tokens = 3
+
+    def tokenize(self, data, add_bos=True, special=False):
+        text = data.decode("utf-8")
+        for spelling_token, (_, spellings) in enumerate(ANSWER_LABELS, start=1):
+            if text in spellings:
+                return [spelling_token]
+        return [5, 6, 7]
+
+    def generate(self, tokens, temp, reset):
+        self.generated.append((tokens, temp, reset))
+        yield 1
+
+    @property
+    def context_params(self):
+        return type("P", (), {"logits_all": True})()
+
+    @property
+    def scores(self):
+        return np.array([[0.0, 0.0, 0.0], [0.0, 0.0, 0.0], [0.0, 3.0, 1.0]])
+
+    def __setattr__(self, name, value):
+        if name == "n_tokens" and "n_tokens" in self.__dict__:
+            raise AssertionError("classify_logits must not rewind n_tokens itself")
+        super().__setattr__(name, value)
+
+
+def test_classify_evaluates_through_the_prefix_reusing_generate():
+    grading.label_token_ids.cache_clear()
+    llm = FakeLlm()
+    scores = classify_logits(llm, "Is it right?", ANSWER_LABELS)
+    assert llm.generated == [([5, 6, 7], 0.0, True)]
+    assert scores["correct"] > scores["incorrect"]
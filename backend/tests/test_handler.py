@@ -0,0 +1,103 @@
+# backend/tests/test_handler.py — turn cancellation and stored history on the WebSocket handler
+
+import asyncio
+
+from app.services.teaching_engine import TeachingState
+from app.websocket.handler import _send_reply, _start_turn, cancel_turn
+
+
+def test_new_turn_supersedes_the_one_in_flight():
+    sent, closed = [], []
+
+    async def send(msg):
+        sent.append(msg)
+
+    async def main():
+        state = {"teaching_state": TeachingState()}
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            finally:
+                closed.append("slow")
+
+        async def quick():
+            await send({"type": "token", "text": "hi"})
+
+        await _start_turn("text", slow, send, state)
+        first = state["turn"]
+        await started.wait()
+        await _start_turn("text", quick, send, state)
+        await state["turn"].task
+        return first
+
+    first = asyncio.run(main())
+    assert first.task.cancelled()
+    assert closed == ["slow"]
+    assert sent == [{"type": "turn_cancelled", "reason": "superseded"}, {"type": "token", "text": "hi"}]
+
+
+def test_cancel_turn_reports_only_unfinished_turns():
+    sent = []
+
+    async def send(msg):
+        sent.append(msg)
+
+    async def main():
+        state = {}
+        assert await cancel_turn(state, "barge_in", send) is False
+
+        async def done():
+            pass
+
+        await _start_turn("text", done, send, state)
+        await state["turn"].task
+        # Already finished and nothing queued: not a cancellation.
+        return await cancel_turn(state, "barge_in", send)
+
+    assert asyncio.run(main()) is False
+    assert sent == []
+
+
+class FakeMemory:
+    def __init__(self):
+        self.messages = []
+
+    async def append_message(self, session_id, role, content):
+        self.messages.append((role, content))
+
+
+class FakeContext:
+    def summarize_in_background(self):
+        pass
+
+
+def _reply(user_text):
+    async def tokens():
+        for t in ("Recursion ", "calls itself."):
+            yield t
+
+    async def send(msg):
+        pass
+
+    async def synthesize(text):
+        return b""
+
+    mem = FakeMemory()
+    state = {"session_id": "s1", "memory": mem, "context": FakeContext()}
+    reply = asyncio.run(_send_reply(user_text, tokens(), synthesize, send, state, None, None, None, None))
+    assert reply == "Recursion calls itself."
+    return mem.messages
+
+
+def test_history_stores_the_students_text_not_the_prompt():
+    assert _reply("what is recursion?") == [
+        ("user", "what is recursion?"),
+        ("assistant", "Recursion calls itself."),
+    ]
+
+
+def test_unprompted_reply_stores_no_user_message():
+    assert _reply(None) == [("assistant", "Recursion calls itself.")]
@@ -0,0 +1,93 @@
+# backend/tests/test_kv_cache.py — RAM budget, pinning and disk spill of saved llama states
+
+from app.services.kv_cache import KVStateCache
+
+
+class FakeState:
+    """Stands in for a LlamaState: only the size attributes state_nbytes() reads."""
+
+    def __init__(self, name: str, size: int = 100):
+        self.name = name
+        self.llama_state_size = size
+
+
+def test_evicts_least_recently_used_over_budget():
+    cache = KVStateCache(ram_bytes=250)
+    for name in "abc":
+        cache.put(name, FakeState(name))
+    assert cache.used_bytes == 200
+    assert cache.get("a") is None
+    assert cache.get("b").name == "b"
+    cache.put("d", FakeState("d"))
+    # "b" was just used, so "c" goes.
+    assert cache.get("c") is None
+    assert cache.get("b") is not None
+
+
+def test_pinned_entries_are_never_evicted():
+    cache = KVStateCache(ram_bytes=150)
+    cache.put("prefix", FakeState("prefix"), pin=True)
+    for name in "abc":
+        cache.put(name, FakeState(name))
+    assert cache.get("prefix").name == "prefix"
+    assert cache.get("a") is None
+
+
+def test_spills_to_disk_and_loads_back(tmp_path):
+    cache = KVStateCache(ram_bytes=150, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("a", FakeState("a"))
+    cache.put("b", FakeState("b"))
+    assert len(list(tmp_path.glob("*.kv"))) == 1
+    state = cache.get("a")
+    assert state.name == "a"
+    assert cache.hits_disk == 1
+    # Loaded back into RAM, which spilled "b" in turn.
+    assert cache._spill_path("a").exists() is False
+    assert cache._spill_path("b").exists()
+
+
+def test_discard_removes_spilled_file(tmp_path):
+    cache = KVStateCache(ram_bytes=150, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("a", FakeState("a"))
+    cache.put("b", FakeState("b"))
+    cache.discard("a")
+    assert list(tmp_path.glob("*.kv")) == []
+    assert cache.get("a") is None
+
+
+def test_disk_tier_has_its_own_budget(tmp_path):
+    cache = KVStateCache(ram_bytes=100, disk_dir=str(tmp_path), disk_bytes=1)
+    for name in "abc":
+        cache.put(name, FakeState(name))
+    assert list(tmp_path.glob("*.kv")) == []
+
+
+def test_state_put_back_while_spilling_leaves_no_file(tmp_path):
+    cache = KVStateCache(ram_bytes=1 << 20, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    old = FakeState("old")
+    # Evicted, then put back before its spill finished writing.
+    cache._spilling["a"] = old
+    cache.put("a", FakeState("new"))
+    cache._spill("a", old)
+    assert list(tmp_path.iterdir()) == []
+    assert cache.get("a").name == "new"
+
+
+def test_disk_trim_keeps_newest_files_without_listing_the_directory(tmp_path, monkeypatch):
+    cache = KVStateCache(ram_bytes=100, disk_dir=str(tmp_path), disk_bytes=1 << 20)
+    cache.put("a", FakeState("a"))
+    cache.put("b", FakeState("b"))
+    one_file = cache._disk_used
+    cache.disk_bytes = 2 * one_file
+
+    def no_listing(self, pattern):
+        raise AssertionError("disk trim must not glob the spill directory")
+
+    monkeypatch.setattr(type(tmp_path), "glob", no_listing)
+    for name in "cde":
+        cache.put(name, FakeState(name))
+    monkeypatch.undo()
+    assert sorted(p.name for p in tmp_path.glob("*.kv")) == sorted(
+        cache._spill_path(k).name for k in "cd"
+    )
+    assert cache._disk_used == 2 * one_file
@@ -0,0 +1,76 @@
+# backend/tests/test_lesson_pack.py — lesson pack write/read round trip
+
+import asyncio
+
+import pytest
+
+from app.services.lesson_pack import LessonPack, encode_record, write_pack
+
+
+def build(path):
+    records = [
+        ("Recursion", encode_record("Recursion", "Recursion is a function calling itself.",
+                                    [("Recursion is a function", b"AAAA"), ("calling itself.", b"BB")])),
+        ("Loops", encode_record("Loops", "Loops repeat code.", [("Loops repeat code.", b"CCC")])),
+        ("recursion!", encode_record("recursion!", "duplicate", [])),   # same key: skipped
+    ]
+    return write_pack(str(path), records, {"voice": "v1"})
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "lessons.tlpk"
+    assert build(path) == 2
+    pack = LessonPack(str(path))
+    try:
+        assert len(pack) == 2
+        assert sorted(pack.concepts()) == ["Loops", "Recursion"]
+        lesson = pack.lookup("  RECURSION ", voice="v1")
+        assert lesson.text == "Recursion is a function calling itself."
+        assert {k: bytes(v) for k, v in lesson.segments.items()} == {
+            "Recursion is a function": b"AAAA",
+            "calling itself.": b"BB",
+        }
+        assert pack.lookup("closures") is None
+        assert (pack.hits, pack.misses) == (1, 1)
+        del lesson
+    finally:
+        pack.close()
+
+
+def test_other_voice_gets_text_only(tmp_path):
+    path = tmp_path / "lessons.tlpk"
+    build(path)
+    pack = LessonPack(str(path))
+    try:
+        lesson = pack.lookup("Loops", voice="v2")
+        assert lesson.text == "Loops repeat code."
+        assert lesson.segments == {}
+    finally:
+        pack.close()
+
+
+def test_synthesizer_falls_back_for_unpacked_text(tmp_path):
+    path = tmp_path / "lessons.tlpk"
+    build(path)
+    pack = LessonPack(str(path))
+    calls = []
+
+    async def fallback(text: str) -> bytes:
+        calls.append(text)
+        return b"SYNTH"
+
+    try:
+        synth = pack.lookup("Loops", voice="v1").synthesizer(fallback)
+        assert asyncio.run(synth("Loops repeat code.")) == b"CCC"
+        assert asyncio.run(synth("Something else.")) == b"SYNTH"
+        assert calls == ["Something else."]
+        del synth
+    finally:
+        pack.close()
+
+
+def test_rejects_other_files(tmp_path):
+    path = tmp_path / "not-a-pack.bin"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        LessonPack(str(path))
@@ -0,0 +1,28 @@
+# backend/tests/test_llm_service.py — token hand-off between the inference thread and the consumer
+
+import asyncio
+import threading
+
+from app.services.llm_service import _Job
+
+
+def test_backlog_is_counted_without_reading_the_asyncio_queue():
+    async def main():
+        job = _Job("", {}, asyncio.get_running_loop(), maxsize=2)
+        pushed = threading.Event()
+
+        def engine():
+            job.push("token", "a")
+            job.push("token", "b")
+            pushed.set()
+
+        threading.Thread(target=engine).start()
+        await asyncio.to_thread(pushed.wait)
+        full = job.backlogged
+        first = await job.get()
+        return full, first, job.backlogged
+
+    full, first, after = asyncio.run(main())
+    assert full is True
+    assert first == ("token", "a")
+    assert after is False
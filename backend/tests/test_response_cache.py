@@ -0,0 +1,64 @@
+# backend/tests/test_response_cache.py — exact and semantic matches, variants and TTL
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+
+from app.services import response_cache
+from app.services.response_cache import ResponseCache, normalize_key
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_normalize_key_ignores_case_punctuation_and_spacing():
+    assert normalize_key("  What is   Recursion?!") == normalize_key("what is recursion")
+
+
+def test_serves_only_after_collecting_variants():
+    cache = ResponseCache(variants=2)
+    first = run(cache.lookup("concept", "Recursion"))
+    assert first.text is None
+    cache.store(first, "Reply one.", 60)
+    second = run(cache.lookup("concept", "recursion!"))
+    assert second.text is None
+    cache.store(second, "Reply two.", 60)
+    hit = run(cache.lookup("concept", "RECURSION"))
+    assert hit.tier == "exact"
+    assert hit.text in ("Reply one.", "Reply two.")
+    # Kinds are separate namespaces.
+    assert run(cache.lookup("question", "recursion")).text is None
+
+
+def test_semantic_match_uses_nearest_key_of_same_kind():
+    vectors = {"recursion": [1.0, 0.0], "explain recursion": [0.96, 0.28], "loops": [0.0, 1.0]}
+
+    async def embed(texts):
+        return np.array([vectors[t] for t in texts], dtype=np.float32)
+
+    cache = ResponseCache(variants=1, min_score=0.9, embed=embed)
+    cache.store(run(cache.lookup("concept", "recursion")), "Recursion is...", 60)
+    hit = run(cache.lookup("concept", "explain recursion"))
+    assert (hit.tier, hit.text) == ("semantic", "Recursion is...")
+    assert run(cache.lookup("concept", "loops")).text is None
+
+
+def test_variants_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(monotonic=lambda: now[0]))
+    cache = ResponseCache(variants=1)
+    cache.store(run(cache.lookup("question", "what is a loop?")), "A loop repeats.", 30)
+    assert run(cache.lookup("question", "what is a loop?")).text == "A loop repeats."
+    now[0] += 31
+    assert run(cache.lookup("question", "what is a loop?")).text is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_prompts_are_evicted():
+    cache = ResponseCache(max_entries=2, variants=1)
+    for key in ("a", "b", "c"):
+        cache.store(run(cache.lookup("concept", key)), f"reply {key}", 60)
+    assert len(cache) == 2
+    assert run(cache.lookup("concept", "a")).text is None
@@ -0,0 +1,37 @@
+# backend/tests/test_semantic_index.py — related past messages stay within the asking student's sessions
+
+import asyncio
+
+from app.services.semantic_index import _KIND_CONVERSATION, _KIND_TOPIC, SemanticIndex, _encode_id
+
+
+class FakeDB:
+    async def fetchall(self, sql, params=()):
+        if "FROM conversations" in sql:
+            return [
+                {"id": 1, "session_id": "alice-old", "role": "user", "content": "alice earlier"},
+                {"id": 2, "session_id": "bob-old", "role": "user", "content": "bob earlier"},
+                {"id": 3, "session_id": "alice-now", "role": "user", "content": "alice now"},
+            ]
+        if "FROM student_sessions" in sql:
+            owned = {"alice": {"alice-old", "alice-now"}, "bob": {"bob-old"}}.get(params[0], set())
+            return [{"session_id": s} for s in params[1:] if s in owned]
+        if "FROM topics" in sql:
+            return [{"id": 7, "name": "loops", "concept_summary": "repeat code"}]
+        return []
+
+
+def resolve(student_id):
+    idx = SemanticIndex.__new__(SemanticIndex)
+    idx.db = FakeDB()
+    scored = [(_encode_id(_KIND_CONVERSATION, i), 0.9) for i in (1, 2, 3)] + [(_encode_id(_KIND_TOPIC, 7), 0.8)]
+    return [(h.kind, h.text) for h in asyncio.run(idx._resolve(scored, "alice-now", student_id))]
+
+
+def test_recall_is_limited_to_the_students_other_sessions():
+    assert resolve("alice") == [("conversation", "alice earlier"), ("topic", "loops: repeat code")]
+
+
+def test_sessions_without_a_student_get_topics_only():
+    assert resolve(None) == [("topic", "loops: repeat code")]
+    assert resolve("carol") == [("topic", "loops: repeat code")]
@@ -0,0 +1,84 @@
+# backend/tests/test_tts_pipeline.py — sentence segmentation and TTS pipeline cancellation
+
+import asyncio
+
+from app.services.tts_pipeline import SentenceSegmenter, TTSPipeline
+
+
+def feed_all(seg: SentenceSegmenter, tokens):
+    out = []
+    for t in tokens:
+        out += seg.feed(t)
+    tail = seg.flush()
+    return out + ([tail] if tail else [])
+
+
+def test_segmenter_cuts_at_sentence_ends():
+    seg = SentenceSegmenter(min_chars=5, max_chars=200)
+    tokens = ["Recursion is ", "a function calling ", "itself. What ", "is a base case? ", "Think"]
+    assert feed_all(seg, tokens) == ["Recursion is a function calling itself.", "What is a base case?", "Think"]
+
+
+def test_segmenter_keeps_decimals_and_short_sentences_together():
+    seg = SentenceSegmenter(min_chars=20, max_chars=200)
+    # "3.14" has no whitespace after the dot; "Yes." alone is under min_chars.
+    assert feed_all(seg, ["Yes. Pi is about 3.14 here. ", "Next"]) == ["Yes. Pi is about 3.14 here.", "Next"]
+
+
+def test_segmenter_uses_clauses_then_hard_cuts():
+    seg = SentenceSegmenter(min_chars=5, max_chars=30)
+    assert seg.feed("First part of it, second part") == ["First part of it,"]
+    seg = SentenceSegmenter(min_chars=5, max_chars=30)
+    out = seg.feed("word " * 10)
+    assert out and all(len(s) <= 30 for s in out)
+
+
+def test_finish_cancelled_stops_queued_synthesis():
+    # Regression: a turn cut off during finish() used to leave queued segments synthesizing.
+    started = []
+
+    async def synth(text: str) -> bytes:
+        started.append(text)
+        await asyncio.sleep(0.5)
+        return b"RIFF"
+
+    async def send(msg):
+        pass
+
+    async def main():
+        tts = TTSPipeline(send, min_chars=5, synthesize=synth)
+        for s in ["First one here. ", "Second one here. ", "Third one here. "]:
+            tts.feed(s)
+        fin = asyncio.create_task(tts.finish())
+        await asyncio.sleep(0.1)
+        fin.cancel()
+        try:
+            await fin
+        except asyncio.CancelledError:
+            pass
+        await asyncio.sleep(0.6)
+        return tts
+
+    tts = asyncio.run(main())
+    assert started == ["First one here."]
+    assert tts._tasks == []
+
+
+def test_segments_are_sent_in_order():
+    sent = []
+
+    async def synth(text: str) -> bytes:
+        # Later segments finish first.
+        await asyncio.sleep(0.05 if text.startswith("One") else 0.0)
+        return text.encode()
+
+    async def send(msg):
+        sent.append(msg)
+
+    async def main():
+        tts = TTSPipeline(send, min_chars=3, synthesize=synth, max_inflight=3)
+        tts.feed("One here. Two here. Three.")
+        return await tts.finish()
+
+    assert asyncio.run(main()) == 3
+    assert [m["seq"] for m in sent if m["type"] == "tts_chunk"] == [0, 1, 2]
@@ -0,0 +1,33 @@
+# backend/tests/test_tts_service.py — stub audio bypasses the cache; aborting without SIGUSR1
+
+import asyncio
+
+from app.services import tts_service
+
+
+def test_stub_audio_is_not_cached(monkeypatch):
+    monkeypatch.setenv("TUTOR_STUB_ENGINES", "tts")
+    monkeypatch.setenv("TUTOR_STUB_PROFILE", "gpu")
+    monkeypatch.setattr(tts_service, "_pools", {})
+
+    def no_cache():
+        raise AssertionError("stub audio must not reach the TTS cache")
+
+    monkeypatch.setattr(tts_service, "get_audio_cache", no_cache)
+    audio = asyncio.run(tts_service.piper_tts_async("Hello there."))
+    assert audio[:4] == b"RIFF"
+
+
+def test_abort_without_sigusr1_asks_for_a_restart(monkeypatch):
+    monkeypatch.setattr(tts_service, "_ABORT_SIGNAL", None)
+
+    class Proc:
+        returncode = None
+
+        def send_signal(self, sig):
+            raise AssertionError("no signal to send")
+
+    worker = tts_service.PiperWorker("voice.onnx")
+    worker._proc = Proc()
+    worker._awaiting = True
+    assert asyncio.run(worker.abort(1.0)) is False
@@ -7,21 +7,42 @@ import { useWebSocket } from "./hooks/useWebSocket";
 import Avatar from "./components/Avatar";
 import VoiceInput from "./components/VoiceInput";
 import TeachingPanel from "./components/TeachingPanel";
+import { createTtsStream, supportedAudioFormats } from "./audio/ttsStream";
 
 export default function App() {
-  const { connected, lastMessage, error, send, sendAudio } = useWebSocket();
+  const audioCtxRef = useRef(null);
+  const getAudioCtx = () => {
+    audioCtxRef.current = audioCtxRef.current || new (window.AudioContext || window.webkitAudioContext)();
+    return audioCtxRef.current;
+  };
+  // Binary TTS frames (negotiated in start_session) are scheduled as they arrive.
+  const ttsStreamRef = useRef(null);
+  if (!ttsStreamRef.current) {
+    ttsStreamRef.current = createTtsStream(getAudioCtx, {
+      onStart: () => setAvatarState("talking"),
+      onEnd: () => setAvatarState("idle"),
+    });
+  }
+
+  const { connected, lastMessage, error, send, sendAudio } = useWebSocket({
+    onBinary: (buf) => ttsStreamRef.current.push(buf),
+  });
   const [avatarState, setAvatarState] = useState("idle");
   const [assistantText, setAssistantText] = useState("");
   const [concepts, setConcepts] = useState([]);
   const [sessionId, setSessionId] = useState(null);
-  
-  const audioCtxRef = useRef(null);
-  const lastIdRef = useRef(0);
+  const [transcript, setTranscript] = useState("");
+
+  // Sentence segments arrive as separate tts_chunk frames; decode them in
+  // arrival order and schedule each one to start when the previous one ends.
+  const playChainRef = useRef(Promise.resolve());
+  const nextStartRef = useRef(0);
+  const wavSourcesRef = useRef(new Set());
+  const wavTurnRef = useRef(0);   // bumped on turn_cancelled; stale decodes are not played
 
   // Process inbound WS messages
   useEffect(() => {
     if (!lastMessage) return;
-    const id = ++lastIdRef.current;
     const type = lastMessage.type;
 
     // 1. Handle Streaming Tokens (i3 Optimization)
@@ -50,41 +71,66 @@ export default function App() {
       }
     } 
     
-    // 5. Audio Playback
+    // 5. Audio Playback (tts_segment announces binary chunks; tts_chunk is the JSON fallback)
+    else if (type === "tts_segment") {
+      // Audio follows as binary frames handled by ttsStreamRef.
+    }
     else if (type === "tts_chunk") {
       const b64 = lastMessage.data;
       if (!b64) return;
       try {
         const bytes = Uint8Array.from(atob(b64), (c) => c.charCodeAt(0));
-        playWav(bytes, id);
+        playWav(bytes);
       } catch (err) {
         console.error("Audio decode error:", err);
       }
     } 
     
+    // 6. Speech-to-text (partial while speaking, then final)
+    else if (type === "partial_transcript" || type === "transcript") {
+      setTranscript(lastMessage.text || "");
+    }
+
+    // 7. The reply was cut off (new question or barge-in): stop its audio
+    else if (type === "turn_cancelled") {
+      ttsStreamRef.current.stop();
+      wavTurnRef.current += 1;
+      wavSourcesRef.current.forEach((src) => src.stop());
+      wavSourcesRef.current.clear();
+      nextStartRef.current = 0;
+    }
+
     else if (type === "error") {
       console.error("Backend error:", lastMessage.message);
     }
   }, [lastMessage]);
 
-  const playWav = (bytes, playId) => {
-    // Stop if a newer request has already started
-    if (playId !== lastIdRef.current) return;
+  const playWav = (bytes) => {
+    const ctx = getAudioCtx();
+    const turn = wavTurnRef.current;
 
-    const ctx = audioCtxRef.current || new (window.AudioContext || window.webkitAudioContext)();
-    audioCtxRef.current = ctx;
+    playChainRef.current = playChainRef.current
+      .then(() => ctx.decodeAudioData(bytes.buffer))
+      .then((buf) => {
+        if (turn !== wavTurnRef.current) return;
+        const src = ctx.createBufferSource();
+        src.buffer = buf;
+        src.connect(ctx.destination);
 
-    ctx.decodeAudioData(bytes.buffer).then((buf) => {
-      const src = ctx.createBufferSource();
-      src.buffer = buf;
-      src.connect(ctx.destination);
-      
-      // Update avatar state while audio plays
-      setAvatarState("talking");
-      src.onended = () => setAvatarState("idle");
-      
-      src.start(0);
-    }).catch((err) => console.error("Playback error:", err));
+        const startAt = Math.max(ctx.currentTime, nextStartRef.current);
+        nextStartRef.current = startAt + buf.duration;
+
+        // Update avatar state while audio plays
+        setAvatarState("talking");
+        wavSourcesRef.current.add(src);
+        src.onended = () => {
+          wavSourcesRef.current.delete(src);
+          if (ctx.currentTime >= nextStartRef.current - 0.05) setAvatarState("idle");
+        };
+
+        src.start(startAt);
+      })
+      .catch((err) => console.error("Playback error:", err));
   };
 
   const handleStartConcept = (concept) => {
@@ -106,8 +152,15 @@ export default function App() {
     }
   };
 
+  const handleAudioEnd = () => {
+    send({ type: "audio_end" });
+  };
+
   useEffect(() => {
-    if (connected) send({ type: "start_session" });
+    if (connected) {
+      ttsStreamRef.current.reset();
+      send({ type: "start_session", audio: { formats: supportedAudioFormats(), chunk_ms: 100 } });
+    }
   }, [connected, send]);
 
   return (
@@ -135,6 +188,8 @@ export default function App() {
         <VoiceInput
           onText={handleUserText}
           onAudioChunk={handleAudioChunk}
+          onAudioEnd={handleAudioEnd}
+          transcript={transcript}
           disabled={!connected}
         />
       </main>
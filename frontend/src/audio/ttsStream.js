@@ -0,0 +1,122 @@
+/**
+ * ttsStream — plays binary TTS frames (see backend/app/services/audio_transport.py)
+ * as they arrive: each 16-byte-header chunk is decoded and scheduled right after the
+ * previous one, so playback starts with the first ~100 ms chunk of a sentence.
+ */
+
+const HEADER_BYTES = 16;
+const CODEC_PCM16 = 0;
+const CODEC_OPUS = 1;
+const FLAG_LAST = 2;
+
+/** Formats to offer in start_session, best first. */
+export function supportedAudioFormats() {
+  const formats = ["pcm16"];
+  if (typeof window !== "undefined" && typeof window.AudioDecoder === "function") {
+    formats.unshift("opus");
+  }
+  return formats;
+}
+
+export function parseFrame(buf) {
+  const view = new DataView(buf);
+  if (buf.byteLength < HEADER_BYTES || view.getUint8(0) !== 0x54 || view.getUint8(1) !== 0x41) {
+    return null; // not "TA"
+  }
+  return {
+    codec: view.getUint8(3),
+    flags: view.getUint8(4),
+    sampleRate: view.getUint16(6, true) * 10,
+    seq: view.getUint32(8, true),
+    index: view.getUint32(12, true),
+    payload: buf.slice(HEADER_BYTES),
+  };
+}
+
+/**
+ * createTtsStream(getCtx, { onStart, onEnd }) → { push(arrayBuffer), reset(), stop() }
+ * getCtx returns the shared AudioContext; onStart/onEnd drive the avatar state.
+ */
+export function createTtsStream(getCtx, { onStart, onEnd } = {}) {
+  let nextStart = 0;
+  let opusDecoder = null;
+  let opusSeq = -1;
+  const playing = new Set();
+
+  const schedule = (samples, sampleRate) => {
+    if (!samples.length) return;
+    const ctx = getCtx();
+    const buf = ctx.createBuffer(1, samples.length, sampleRate);
+    buf.copyToChannel(samples, 0);
+    const src = ctx.createBufferSource();
+    src.buffer = buf;
+    src.connect(ctx.destination);
+    const startAt = Math.max(ctx.currentTime, nextStart);
+    nextStart = startAt + buf.duration;
+    onStart?.();
+    playing.add(src);
+    src.onended = () => {
+      playing.delete(src);
+      if (ctx.currentTime >= nextStart - 0.05) onEnd?.();
+    };
+    src.start(startAt);
+  };
+
+  const pushPcm = (frame) => {
+    const pcm = new Int16Array(frame.payload);
+    const samples = new Float32Array(pcm.length);
+    for (let i = 0; i < pcm.length; i++) samples[i] = pcm[i] / 32768;
+    schedule(samples, frame.sampleRate);
+  };
+
+  const pushOpus = (frame) => {
+    // One decoder per segment: the server starts a fresh encoder for each one.
+    if (!opusDecoder || frame.seq !== opusSeq) {
+      opusDecoder?.close();
+      opusSeq = frame.seq;
+      opusDecoder = new window.AudioDecoder({
+        output: (data) => {
+          const samples = new Float32Array(data.numberOfFrames);
+          data.copyTo(samples, { planeIndex: 0, format: "f32-planar" });
+          schedule(samples, data.sampleRate);
+          data.close();
+        },
+        error: (err) => console.error("Opus decode error:", err),
+      });
+      opusDecoder.configure({ codec: "opus", sampleRate: frame.sampleRate, numberOfChannels: 1 });
+    }
+    // Payload = [u16 length][packet] repeated; each packet is 20 ms.
+    const view = new DataView(frame.payload);
+    let off = 0;
+    let ts = frame.index * 1e6;
+    while (off + 2 <= view.byteLength) {
+      const len = view.getUint16(off, true);
+      const packet = frame.payload.slice(off + 2, off + 2 + len);
+      off += 2 + len;
+      opusDecoder.decode(new window.EncodedAudioChunk({ type: "key", timestamp: ts, data: packet }));
+      ts += 20000;
+    }
+    if (frame.flags & FLAG_LAST) opusDecoder.flush().catch(() => {});
+  };
+
+  return {
+    push(arrayBuffer) {
+      const frame = parseFrame(arrayBuffer);
+      if (!frame) return;
+      if (frame.codec === CODEC_PCM16) pushPcm(frame);
+      else if (frame.codec === CODEC_OPUS) pushOpus(frame);
+    },
+    reset() {
+      nextStart = 0;
+      opusDecoder?.close();
+      opusDecoder = null;
+      opusSeq = -1;
+    },
+    // Cut off everything scheduled (turn_cancelled: the reply was superseded).
+    stop() {
+      playing.forEach((src) => src.stop());
+      playing.clear();
+      this.reset();
+    },
+  };
+}
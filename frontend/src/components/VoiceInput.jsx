@@ -1,14 +1,14 @@
 /**
  * VoiceInput — text input and optional mic (stream chunks to WS).
- * MVP: text input only; mic sends recorded blob when done (backend does full chunk handling).
+ * Mic chunks are sent every 250 ms while recording so the backend can transcribe
+ * incrementally; stopping the mic sends end-of-utterance.
  */
 import { useState, useRef } from "react";
 
-export default function VoiceInput({ onText, onAudioChunk, disabled }) {
+export default function VoiceInput({ onText, onAudioChunk, onAudioEnd, transcript, disabled }) {
   const [text, setText] = useState("");
   const [recording, setRecording] = useState(false);
   const mediaRecorderRef = useRef(null);
-  const chunksRef = useRef([]);
 
   const handleSubmit = (e) => {
     e.preventDefault();
@@ -21,19 +21,17 @@ export default function VoiceInput({ onText, onAudioChunk, disabled }) {
 
   const startMic = () => {
     if (!navigator.mediaDevices?.getUserMedia || !onAudioChunk) return;
-    chunksRef.current = [];
     navigator.mediaDevices.getUserMedia({ audio: true }).then((stream) => {
       const rec = new MediaRecorder(stream);
       mediaRecorderRef.current = rec;
       rec.ondataavailable = (e) => {
-        if (e.data.size) chunksRef.current.push(e.data);
+        if (e.data.size && onAudioChunk) onAudioChunk(e.data);
       };
       rec.onstop = () => {
         stream.getTracks().forEach((t) => t.stop());
-        const blob = new Blob(chunksRef.current, { type: "audio/webm" });
-        if (blob.size && onAudioChunk) onAudioChunk(blob);
+        if (onAudioEnd) onAudioEnd();
       };
-      rec.start(500);
+      rec.start(250);
       setRecording(true);
     }).catch(() => setRecording(false));
   };
@@ -73,6 +71,7 @@ export default function VoiceInput({ onText, onAudioChunk, disabled }) {
           )}
         </div>
       </form>
+      {transcript && <p className="transcript">{transcript}</p>}
     </div>
   );
 }
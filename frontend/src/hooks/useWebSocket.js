@@ -1,22 +1,30 @@
 /**
  * useWebSocket — connect to backend WS, send JSON, receive messages.
+ * Binary messages (TTS audio frames) go to the optional onBinary callback.
  * Backend runs at ws://127.0.0.1:8765/ws by default.
  */
 import { useState, useEffect, useRef, useCallback } from "react";
 
 const WS_URL = "ws://127.0.0.1:8765/ws";
 
-export function useWebSocket() {
+export function useWebSocket({ onBinary } = {}) {
   const [connected, setConnected] = useState(false);
   const [lastMessage, setLastMessage] = useState(null);
   const [error, setError] = useState(null);
   const wsRef = useRef(null);
   const reconnectTimeoutRef = useRef(null);
+  // Blob -> ArrayBuffer is async; chain all sends so audio chunks and the
+  // following audio_end go out in the order they were issued.
+  const sendChainRef = useRef(Promise.resolve());
+  // Binary frames (TTS audio chunks) bypass React state so none are coalesced away.
+  const onBinaryRef = useRef(onBinary);
+  onBinaryRef.current = onBinary;
 
   const connect = useCallback(() => {
     if (wsRef.current?.readyState === WebSocket.OPEN) return;
     setError(null);
     const ws = new WebSocket(WS_URL);
+    ws.binaryType = "arraybuffer";
     wsRef.current = ws;
 
     ws.onopen = () => setConnected(true);
@@ -27,6 +35,10 @@ export function useWebSocket() {
     };
     ws.onerror = (e) => setError("WebSocket error");
     ws.onmessage = (e) => {
+      if (e.data instanceof ArrayBuffer) {
+        onBinaryRef.current?.(e.data);
+        return;
+      }
       try {
         const msg = JSON.parse(e.data);
         setLastMessage(msg);
@@ -48,20 +60,29 @@ export function useWebSocket() {
     setConnected(false);
   }, []);
 
+  const enqueue = useCallback((payload) => {
+    sendChainRef.current = sendChainRef.current
+      .then(() => payload)
+      .then((data) => {
+        if (wsRef.current?.readyState === WebSocket.OPEN) wsRef.current.send(data);
+      })
+      .catch(() => {});
+  }, []);
+
   const send = useCallback((msg) => {
     if (wsRef.current?.readyState !== WebSocket.OPEN) return;
     const s = typeof msg === "string" ? msg : JSON.stringify(msg);
-    wsRef.current.send(s);
-  }, []);
+    enqueue(s);
+  }, [enqueue]);
 
   const sendAudio = useCallback((blobOrArrayBuffer) => {
     if (wsRef.current?.readyState !== WebSocket.OPEN) return;
     if (blobOrArrayBuffer instanceof Blob) {
-      blobOrArrayBuffer.arrayBuffer().then((buf) => wsRef.current.send(buf));
+      enqueue(blobOrArrayBuffer.arrayBuffer());
     } else {
-      wsRef.current.send(blobOrArrayBuffer);
+      enqueue(blobOrArrayBuffer);
     }
-  }, []);
+  }, [enqueue]);
 
   useEffect(() => {
     connect();